@@ -0,0 +1,135 @@
+"""
+Caché en disco de los archivos exportados (Excel y CSV).
+Cada archivo se identifica por el tipo de reporte, los filtros y una marca de agua
+de los datos; mientras los datos no cambien, las descargas repetidas se sirven desde
+el archivo ya generado y el navegador puede revalidar con ETag/If-None-Match.
+La versión que invalida todos los archivos se comparte entre workers (VersionCompartida).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Count, Max
+from .models import RegistroAsistencia, VersionCompartida
+
+VERSION_KEY = 'exportaciones'
+EXTENSION = '.exportacion'
+
+
+def activa():
+    """Retorna True si las exportaciones deben guardarse en disco."""
+    return getattr(settings, 'EXPORT_CACHE_ACTIVA', False)
+
+
+def _directorio():
+    directorio = Path(settings.EXPORT_CACHE_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def _version():
+    return VersionCompartida.actual(VERSION_KEY)
+
+
+def invalidar():
+    """
+    Descarta los archivos cacheados en todos los workers (en a lo sumo VERSIONES_INTERVALO segundos).
+    Necesario cuando cambian datos que la marca de agua no detecta (nombres de empleados,
+    tipos de asistencia, reconstrucción de ResumenDiario); los archivos viejos se desalojan por tamaño.
+    """
+    VersionCompartida.incrementar(VERSION_KEY)
+
+
+def marca_de_agua(filtros):
+    """
+    Marca de agua de los datos de un reporte: cambia si se agregan, eliminan o editan
+    registros dentro de los filtros. Es una sola consulta.
+
+    Args:
+        filtros: FiltrosReporte aplicados al reporte
+
+    Returns:
+        dict: max_id, cantidad, última modificación y versión
+    """
+    datos = filtros.aplicar(RegistroAsistencia.objects.all()).aggregate(
+        max_id=Max('id_registro'), cantidad=Count('id_registro'), actualizado=Max('actualizado')
+    )
+    datos['version'] = _version()
+    return datos
+
+
+def clave(tipo, formato, filtros, marca):
+    """Clave estable (y ETag) para un reporte en un formato, con sus filtros y marca de agua."""
+    contenido = json.dumps([tipo, formato, filtros._asdict(), marca], default=str, sort_keys=True)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+
+def obtener(clave_archivo):
+    """
+    Busca un archivo ya generado.
+
+    Returns:
+        Path o None si no está en caché
+    """
+    ruta = _directorio() / f"{clave_archivo}{EXTENSION}"
+    try:
+        os.utime(ruta)  # Marca el uso para el desalojo por antigüedad
+    except FileNotFoundError:
+        return None
+    return ruta
+
+
+def guardar_mientras(clave_archivo, fragmentos):
+    """
+    Entrega los fragmentos del archivo a la vez que los escribe en disco.
+    El archivo solo queda en caché si la generación termina completa
+    (si el cliente corta la descarga se descarta).
+
+    Args:
+        clave_archivo: Clave del reporte
+        fragmentos: Iterable de bytes
+
+    Yields:
+        bytes: Los mismos fragmentos recibidos
+    """
+    directorio = _directorio()
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    completo = False
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            for fragmento in fragmentos:
+                archivo.write(fragmento)
+                yield fragmento
+        os.replace(temporal, directorio / f"{clave_archivo}{EXTENSION}")
+        completo = True
+    finally:
+        if not completo:
+            try:
+                os.remove(temporal)
+            except FileNotFoundError:
+                pass
+    _desalojar(directorio)
+
+
+def _desalojar(directorio):
+    """Elimina los archivos usados hace más tiempo hasta respetar EXPORT_CACHE_MAX_BYTES."""
+    limite = settings.EXPORT_CACHE_MAX_BYTES
+    archivos = []
+    for ruta in directorio.glob(f"*{EXTENSION}"):
+        try:
+            info = ruta.stat()
+        except FileNotFoundError:
+            continue
+        archivos.append((info.st_mtime, info.st_size, ruta))
+    total = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, ruta in sorted(archivos):
+        if total <= limite:
+            break
+        try:
+            ruta.unlink()
+        except FileNotFoundError:
+            pass
+        total -= tamano
@@ -0,0 +1,160 @@
+"""
+Caché LRU en memoria de proceso con expiración por tiempo.
+Se usa para resoluciones muy frecuentes (fingerprint, código QR) que no deben
+llegar a la base de datos en cada petición.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """
+    Caché LRU acotada, segura entre hilos, con TTL y caché negativa.
+
+    Los valores None se guardan como entradas negativas ("no existe") con su
+    propio TTL, normalmente más corto que el de las entradas positivas.
+    Cada worker mantiene su propia copia; las invalidaciones son locales al proceso
+    y, para ver las de otros workers, se llama a sincronizar() con una versión compartida.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, ttl_negativo=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+
+    def obtener(self, clave, cargar):
+        """
+        Retorna el valor cacheado para la clave o lo carga con ``cargar(clave)``.
+
+        Args:
+            clave: Clave a buscar
+            cargar: Función que obtiene el valor real (puede retornar None)
+
+        Returns:
+            Valor cacheado o recién cargado
+        """
+        encontrado, valor = self._buscar(clave)
+        if encontrado:
+            return valor
+        valor = cargar(clave)
+        self.guardar(clave, valor)
+        return valor
+
+    async def aobtener(self, clave, cargar):
+        """Versión asíncrona de obtener(); ``cargar`` debe ser una corrutina."""
+        encontrado, valor = self._buscar(clave)
+        if encontrado:
+            return valor
+        valor = await cargar(clave)
+        self.guardar(clave, valor)
+        return valor
+
+    def obtener_varios(self, claves, cargar_varios):
+        """
+        Versión por lotes de obtener(): las claves que no están en caché se cargan
+        todas juntas con ``cargar_varios(faltantes)``.
+
+        Args:
+            claves: Claves a buscar
+            cargar_varios: Función que recibe la lista de claves faltantes y retorna
+                un dict clave -> valor (las ausentes se guardan como entradas negativas)
+
+        Returns:
+            dict: clave -> valor (None si no existe), en el orden de ``claves``
+        """
+        resultado, faltantes = self._buscar_varios(claves)
+        if faltantes:
+            self._completar(resultado, faltantes, cargar_varios(faltantes))
+        return {clave: resultado[clave] for clave in claves}
+
+    async def aobtener_varios(self, claves, cargar_varios):
+        """Versión asíncrona de obtener_varios(); ``cargar_varios`` debe ser una corrutina."""
+        resultado, faltantes = self._buscar_varios(claves)
+        if faltantes:
+            self._completar(resultado, faltantes, await cargar_varios(faltantes))
+        return {clave: resultado[clave] for clave in claves}
+
+    def _buscar_varios(self, claves):
+        """Retorna (encontrados, faltantes): dict de claves en caché y lista de las demás."""
+        encontrados, faltantes = {}, []
+        for clave in claves:
+            encontrado, valor = self._buscar(clave)
+            if encontrado:
+                encontrados[clave] = valor
+            else:
+                faltantes.append(clave)
+        return encontrados, faltantes
+
+    def _completar(self, resultado, faltantes, cargados):
+        for clave in faltantes:
+            valor = cargados.get(clave)
+            self.guardar(clave, valor)
+            resultado[clave] = valor
+
+    def _buscar(self, clave):
+        """Retorna (encontrado, valor) actualizando los contadores."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._datos.move_to_end(clave)
+                self.hits += 1
+                return True, entrada[1]
+            self.misses += 1
+            return False, None
+
+    def guardar(self, clave, valor):
+        """Guarda un valor (None = entrada negativa) desalojando la entrada menos usada."""
+        ttl = self.ttl if valor is not None else self.ttl_negativo
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def sincronizar(self, version):
+        """
+        Vacía la caché si cambió la versión compartida de sus datos (otro worker los modificó).
+
+        Args:
+            version: Versión vigente de los datos cacheados
+        """
+        if version == self._version:
+            return
+        with self._lock:
+            self._datos.clear()
+            self._version = version
+
+    def invalidar(self, clave):
+        """Elimina una clave de la caché."""
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        """Vacía la caché completa."""
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        """
+        Retorna los contadores de uso de la caché.
+
+        Returns:
+            dict: hits, misses, ratio de aciertos y ocupación
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'tamano': len(self._datos),
+                'maxsize': self.maxsize,
+            }
@@ -0,0 +1,104 @@
+"""
+Catálogo en memoria de tipos de asistencia.
+La tabla TipoAsistencia casi nunca cambia, así que cada worker la carga una vez
+y la reutiliza en vistas y servicios sin volver a consultar la base de datos.
+"""
+
+import threading
+from typing import NamedTuple
+from .models import TipoAsistencia, VersionCompartida, TIPOS_UNICOS, TIPOS_CON_DESCRIPCION
+
+
+class TipoInfo(NamedTuple):
+    """Datos de un tipo de asistencia con sus reglas ya calculadas."""
+    id_tipo: int
+    nombre_asistencia: str
+    es_tipo_unico: bool
+    requiere_descripcion: bool
+
+    def __str__(self):
+        return self.nombre_asistencia
+
+
+class CatalogoTipos:
+    """
+    Catálogo de TipoAsistencia cargado una vez por proceso.
+
+    La invalidación la disparan las señales post_save/post_delete del modelo
+    (ver signals.py) e incrementa una VersionCompartida en la base de datos,
+    de modo que los demás workers recargan en a lo sumo VERSIONES_INTERVALO segundos.
+    Las escrituras que no emiten señales (update()/SQL directo) requieren llamar a invalidar().
+    """
+
+    VERSION_KEY = 'catalogo_tipos'
+
+    _lock = threading.Lock()
+    _version = None
+    _por_id = {}
+    _lista = ()
+
+    @classmethod
+    def _version_actual(cls):
+        return VersionCompartida.actual(cls.VERSION_KEY)
+
+    @classmethod
+    def _cargar(cls):
+        version = cls._version_actual()
+        if version == cls._version:
+            return
+        with cls._lock:
+            if version == cls._version:
+                return
+            lista = tuple(
+                TipoInfo(
+                    id_tipo=tipo.id_tipo,
+                    nombre_asistencia=tipo.nombre_asistencia,
+                    es_tipo_unico=tipo.nombre_asistencia in TIPOS_UNICOS,
+                    requiere_descripcion=tipo.nombre_asistencia in TIPOS_CON_DESCRIPCION,
+                )
+                for tipo in TipoAsistencia.objects.order_by('id_tipo')
+            )
+            cls._por_id = {tipo.id_tipo: tipo for tipo in lista}
+            cls._lista = lista
+            cls._version = version
+
+    @classmethod
+    def invalidar(cls):
+        """Descarta el catálogo local y avisa al resto de workers."""
+        with cls._lock:
+            cls._version = None
+        VersionCompartida.incrementar(cls.VERSION_KEY)
+
+    @classmethod
+    def listar(cls):
+        """
+        Retorna todos los tipos de asistencia.
+
+        Returns:
+            tuple: TipoInfo ordenados por id_tipo
+        """
+        cls._cargar()
+        return cls._lista
+
+    @classmethod
+    def obtener(cls, tipo_id):
+        """
+        Busca un tipo de asistencia por su ID.
+
+        Args:
+            tipo_id: ID del tipo (int o str)
+
+        Returns:
+            TipoInfo o None si no existe
+        """
+        cls._cargar()
+        try:
+            return cls._por_id.get(int(tipo_id))
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def es_tipo_unico(cls, tipo_id):
+        """Retorna True si el tipo solo puede registrarse una vez por día."""
+        tipo = cls.obtener(tipo_id)
+        return bool(tipo and tipo.es_tipo_unico)
@@ -0,0 +1,48 @@
+"""
+Estadísticas de uso de conexiones a la base de datos por worker.
+Permiten comprobar si el modo DB_POOL_MODE configurado evita abrir conexiones en cada petición.
+"""
+
+import threading
+from django.conf import settings
+from django.db import connections
+
+_lock = threading.Lock()
+_contadores = {'conexiones_abiertas': 0, 'peticiones': 0}
+
+
+def registrar_conexion():
+    """Cuenta una señal connection_created: una conexión abierta o, en modo pool, un préstamo del pool."""
+    with _lock:
+        _contadores['conexiones_abiertas'] += 1
+
+
+def registrar_peticion():
+    """Cuenta una petición HTTP atendida por este worker."""
+    with _lock:
+        _contadores['peticiones'] += 1
+
+
+def estadisticas(alias='default'):
+    """
+    Retorna el uso de conexiones del worker actual.
+
+    Returns:
+        dict: Modo configurado, contadores y, con pool nativo, las estadísticas del pool
+    """
+    conexion = connections[alias]
+    with _lock:
+        datos = dict(_contadores)
+    pool = getattr(conexion, 'pool', None)
+    if pool is not None:
+        datos['pool'] = pool.get_stats()
+        # connection_created se emite en cada préstamo; las conexiones reales las cuenta el pool
+        datos['prestamos_pool'] = datos['conexiones_abiertas']
+        datos['conexiones_abiertas'] = datos['pool'].get('connections_num', 0)
+    datos['conexiones_por_peticion'] = (
+        round(datos['conexiones_abiertas'] / datos['peticiones'], 4) if datos['peticiones'] else 0.0
+    )
+    datos['modo'] = getattr(settings, 'DB_POOL_MODE', 'none')
+    datos['motor'] = conexion.vendor
+    datos['conn_max_age'] = conexion.settings_dict.get('CONN_MAX_AGE')
+    return datos
@@ -0,0 +1,163 @@
+"""
+Hojas imprimibles de credenciales QR (PDF de varias páginas).
+Cada página se compone con Pillow a partir de la matriz del QR (sin codificar ni
+decodificar PNG intermedios) y se envía apenas está lista: la memoria es la de una
+página, sin importar la cantidad de empleados. El PDF se escribe a mano porque el
+escritor de Pillow necesita todas las páginas a la vez.
+"""
+
+import unicodedata
+import zlib
+from itertools import islice
+from PIL import Image, ImageDraw, ImageFont
+from .qr_render import matriz
+
+# Página A4 a 150 dpi, en píxeles y en puntos PDF
+PAGINA_PX = (1240, 1754)
+PAGINA_PT = (595.28, 841.89)
+COLUMNAS = 3
+FILAS = 4
+MARGEN = 60
+TAMANO_LETRA = 26
+
+
+def _imagen_qr(modulos, lado_maximo):
+    """Dibuja la matriz con módulos cuadrados enteros (el QR queda nítido al imprimir)."""
+    n = len(modulos)
+    img = Image.new('L', (n, n), 255)
+    img.putdata([0 if modulo else 255 for fila in modulos for modulo in fila])
+    lado = (lado_maximo // n) * n
+    return img.resize((lado, lado), Image.NEAREST)
+
+
+def _fuente(ruta):
+    """
+    Fuente TrueType para los nombres (la indicada o DejaVu Sans del sistema).
+
+    Returns:
+        tuple: (fuente, solo_ascii); la fuente incluida en Pillow no tiene tildes ni eñes
+    """
+    for candidata in (ruta, "DejaVuSans.ttf"):
+        if not candidata:
+            continue
+        try:
+            return ImageFont.truetype(candidata, TAMANO_LETRA), False
+        except OSError:
+            continue
+    return ImageFont.load_default(size=TAMANO_LETRA), True
+
+
+def _ajustar_texto(texto, fuente, ancho):
+    if fuente.getlength(texto) <= ancho:
+        return texto
+    while texto and fuente.getlength(texto + "...") > ancho:
+        texto = texto[:-1]
+    return texto + "..."
+
+
+def componer_paginas(credenciales, ruta_fuente=None):
+    """
+    Compone las páginas de credenciales (COLUMNAS x FILAS por página).
+
+    Args:
+        credenciales: Iterable de (nombre, datos del QR)
+        ruta_fuente: Archivo .ttf para los nombres (opcional)
+
+    Yields:
+        Image: Página en escala de grises (al menos una, aunque no haya credenciales)
+    """
+    fuente, solo_ascii = _fuente(ruta_fuente)
+    ancho_celda = (PAGINA_PX[0] - 2 * MARGEN) // COLUMNAS
+    alto_celda = (PAGINA_PX[1] - 2 * MARGEN) // FILAS
+    lado_qr = min(ancho_celda - 20, alto_celda - 3 * TAMANO_LETRA)
+    credenciales = iter(credenciales)
+    primera = True
+    while True:
+        lote = list(islice(credenciales, COLUMNAS * FILAS))
+        if not lote and not primera:
+            return
+        primera = False
+        pagina = Image.new('L', PAGINA_PX, 255)
+        dibujo = ImageDraw.Draw(pagina)
+        for indice, (nombre, datos) in enumerate(lote):
+            x = MARGEN + (indice % COLUMNAS) * ancho_celda
+            y = MARGEN + (indice // COLUMNAS) * alto_celda
+            # Guía de corte
+            dibujo.rectangle([x, y, x + ancho_celda - 1, y + alto_celda - 1], outline=200)
+            qr = _imagen_qr(matriz(datos), lado_qr)
+            pagina.paste(qr, (x + (ancho_celda - qr.width) // 2, y + 10))
+            if solo_ascii:
+                nombre = unicodedata.normalize('NFKD', nombre).encode('ascii', 'ignore').decode('ascii')
+            texto = _ajustar_texto(nombre, fuente, ancho_celda - 20)
+            dibujo.text(
+                (x + ancho_celda // 2, y + 10 + qr.height + TAMANO_LETRA), texto,
+                fill=0, font=fuente, anchor="mm",
+            )
+        yield pagina
+        if len(lote) < COLUMNAS * FILAS:
+            return
+
+
+class _EscritorPDF:
+    """Numera los bytes emitidos para armar la tabla xref al final."""
+
+    def __init__(self):
+        self.posicion = 0
+        self.desplazamientos = {}
+
+    def bytes(self, datos):
+        self.posicion += len(datos)
+        return datos
+
+    def objeto(self, numero, contenido, flujo=None):
+        self.desplazamientos[numero] = self.posicion
+        if flujo is not None:
+            contenido += b'\nstream\n' + flujo + b'\nendstream'
+        return self.bytes(b'%d 0 obj\n' % numero + contenido + b'\nendobj\n')
+
+
+def generar_pdf(credenciales, ruta_fuente=None):
+    """
+    Genera el PDF de credenciales entregando los bytes de cada página al componerla.
+
+    Args:
+        credenciales: Iterable de (nombre, datos del QR)
+        ruta_fuente: Archivo .ttf para los nombres (opcional)
+
+    Yields:
+        bytes: Fragmentos consecutivos del archivo
+    """
+    pdf = _EscritorPDF()
+    yield pdf.bytes(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    # El objeto 2 (árbol de páginas) se escribe al final, cuando se conocen todas
+    yield pdf.objeto(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    paginas = []
+    siguiente = 3
+    dibujar = b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q' % PAGINA_PT
+    for pagina in componer_paginas(credenciales, ruta_fuente):
+        imagen, contenido, hoja = siguiente, siguiente + 1, siguiente + 2
+        siguiente += 3
+        datos = zlib.compress(pagina.tobytes(), 6)
+        bloque = pdf.objeto(
+            imagen,
+            b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+            b'/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>' % (pagina.width, pagina.height, len(datos)),
+            datos,
+        )
+        bloque += pdf.objeto(contenido, b'<< /Length %d >>' % len(dibujar), dibujar)
+        bloque += pdf.objeto(
+            hoja,
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>' % (*PAGINA_PT, imagen, contenido),
+        )
+        paginas.append(hoja)
+        yield bloque
+
+    hijos = b' '.join(b'%d 0 R' % hoja for hoja in paginas)
+    final = pdf.objeto(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (hijos, len(paginas)))
+    inicio_xref = pdf.posicion
+    final += b'xref\n0 %d\n0000000000 65535 f \n' % siguiente
+    final += b''.join(b'%010d 00000 n \n' % pdf.desplazamientos[numero] for numero in range(1, siguiente))
+    final += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (siguiente, inicio_xref)
+    yield final
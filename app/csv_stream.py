@@ -0,0 +1,55 @@
+"""
+Generación de archivos CSV (opcionalmente comprimidos con gzip) en streaming.
+Las filas se escriben por bloques y cada bloque se entrega apenas está listo,
+sin estilos ni estructura adicional: pensado para extractos grandes.
+"""
+
+import csv
+import io
+import zlib
+from itertools import islice
+
+CONTENT_TYPE_CSV = 'text/csv; charset=utf-8'
+CONTENT_TYPE_GZIP = 'application/gzip'
+
+
+def generar_csv(encabezados, filas, comprimir=False, filas_por_bloque=1000):
+    """
+    Genera un CSV UTF-8 entregando un bloque de bytes cada filas_por_bloque filas.
+
+    Args:
+        encabezados: Lista de encabezados (primera línea)
+        filas: Iterable de listas de valores
+        comprimir: True para entregar el CSV comprimido en formato gzip
+        filas_por_bloque: Filas escritas antes de entregar un bloque
+
+    Yields:
+        bytes: Fragmentos consecutivos del archivo
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # wbits=31: cabecera y checksum gzip, compatible con gunzip y con Python/pandas
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+
+    def vaciar():
+        datos = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compresor.compress(datos) if compresor else datos
+
+    escritor.writerow(encabezados)
+    filas = iter(filas)
+    while True:
+        lote = list(islice(filas, filas_por_bloque))
+        if not lote:
+            break
+        escritor.writerows(lote)
+        bloque = vaciar()
+        if bloque:
+            yield bloque
+
+    bloque = vaciar()
+    if compresor:
+        bloque += compresor.flush()
+    if bloque:
+        yield bloque
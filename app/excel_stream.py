@@ -0,0 +1,185 @@
+"""
+Generación de archivos Excel (.xlsx) en streaming.
+openpyxl (modo write-only) produce las partes fijas del libro (estilos, anchos,
+tabla) y las filas se escriben directamente en el XML de la hoja dentro del
+ZIP, de modo que la memoria no depende del número de filas y los primeros
+bytes se envían antes de terminar de leer los datos.
+"""
+
+import io
+import warnings
+import zipfile
+from xml.sax.saxutils import escape
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font, PatternFill, Border, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_RUTA_HOJA = 'xl/worksheets/sheet1.xml'
+_RUTA_TABLA = 'xl/tables/table1.xml'
+_FILAS_POR_ESCRITURA = 500
+
+
+class BufferSalida:
+    """Destino no buscable para zipfile: acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self._partes = []
+        self.tamano = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self.tamano += len(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        self.tamano = 0
+        return datos
+
+
+def _celda_xml(referencia, valor):
+    if valor is None or valor == '':
+        return ''
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c r="{referencia}"><v>{valor}</v></c>'
+    texto = escape(ILLEGAL_CHARACTERS_RE.sub('', str(valor)))
+    espacio = ' xml:space="preserve"' if texto != texto.strip() else ''
+    return f'<c r="{referencia}" t="inlineStr"><is><t{espacio}>{texto}</t></is></c>'
+
+
+def _plantilla(titulo, encabezados, anchos, nombre_tabla):
+    """Libro con solo el encabezado, del que se reutilizan todas las partes salvo las filas."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=titulo)
+    for indice, ancho in enumerate(anchos, start=1):
+        ws.column_dimensions[get_column_letter(indice)].width = ancho
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill("solid", fgColor="4F81BD")
+    thin_border = Border(
+        left=Side(style='thin'), right=Side(style='thin'),
+        top=Side(style='thin'), bottom=Side(style='thin')
+    )
+    fila = []
+    for encabezado in encabezados:
+        cell = WriteOnlyCell(ws, value=encabezado)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.border = thin_border
+        fila.append(cell)
+    ws.append(fila)
+
+    if nombre_tabla:
+        # Rango provisional: se reemplaza por el definitivo al terminar las filas
+        tabla = Table(displayName=nombre_tabla, ref=f"A1:{get_column_letter(len(encabezados))}2")
+        tabla.tableStyleInfo = TableStyleInfo(
+            name="TableStyleMedium9", showFirstColumn=False,
+            showLastColumn=False, showRowStripes=True, showColumnStripes=False
+        )
+        tabla.tableColumns = [TableColumn(id=i, name=str(n)) for i, n in enumerate(encabezados, start=1)]
+        with warnings.catch_warnings():
+            # Las columnas ya se definieron arriba; openpyxl avisa igual en modo write-only
+            warnings.simplefilter('ignore', UserWarning)
+            ws.add_table(tabla)
+
+    salida = io.BytesIO()
+    wb.save(salida)
+    return zipfile.ZipFile(salida)
+
+
+def generar_xlsx_streaming(titulo, encabezados, filas, anchos, nombre_tabla=None, tamano_bloque=64 * 1024):
+    """
+    Genera un .xlsx de una hoja entregando los bytes a medida que se producen.
+    Pensado para StreamingHttpResponse.
+
+    Args:
+        titulo: Nombre de la hoja
+        encabezados: Lista de encabezados (fila 1, con el estilo de los reportes)
+        filas: Iterable de listas de valores (str o números)
+        anchos: Ancho de cada columna; deben conocerse antes de escribir filas
+        nombre_tabla: displayName de la tabla de Excel (se omite si no hay filas)
+        tamano_bloque: Bytes acumulados antes de entregar un bloque
+
+    Yields:
+        bytes: Fragmentos consecutivos del archivo
+    """
+    filas = iter(filas)
+    primera = next(filas, None)
+    con_tabla = bool(nombre_tabla) and primera is not None
+    plantilla = _plantilla(titulo, encabezados, anchos, nombre_tabla if con_tabla else None)
+    letras = [get_column_letter(i) for i in range(1, len(encabezados) + 1)]
+
+    buffer = BufferSalida()
+    destino = zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    for info in plantilla.infolist():
+        if info.filename in (_RUTA_HOJA, _RUTA_TABLA):
+            continue
+        destino.writestr(info.filename, plantilla.read(info.filename), compress_type=zipfile.ZIP_DEFLATED)
+    yield buffer.vaciar()
+
+    hoja = plantilla.read(_RUTA_HOJA).decode('utf-8')
+    corte = hoja.index('</sheetData>')
+    ultima_fila = 1
+    with destino.open(_RUTA_HOJA, 'w') as xml:
+        xml.write(hoja[:corte].encode('utf-8'))
+        if primera is not None:
+            pendientes = []
+            for valores in _encadenar(primera, filas):
+                ultima_fila += 1
+                celdas = ''.join(
+                    _celda_xml(f"{letra}{ultima_fila}", valor) for letra, valor in zip(letras, valores)
+                )
+                pendientes.append(f'<row r="{ultima_fila}">{celdas}</row>')
+                if len(pendientes) >= _FILAS_POR_ESCRITURA:
+                    xml.write(''.join(pendientes).encode('utf-8'))
+                    pendientes = []
+                    if buffer.tamano >= tamano_bloque:
+                        yield buffer.vaciar()
+            xml.write(''.join(pendientes).encode('utf-8'))
+        xml.write(hoja[corte:].encode('utf-8'))
+
+    if con_tabla:
+        rango = f"A1:{letras[-1]}{ultima_fila}"
+        tabla = plantilla.read(_RUTA_TABLA).decode('utf-8').replace(f'ref="A1:{letras[-1]}2"', f'ref="{rango}"')
+        destino.writestr(_RUTA_TABLA, tabla, compress_type=zipfile.ZIP_DEFLATED)
+
+    destino.close()
+    yield buffer.vaciar()
+
+
+def generar_xlsx(titulo, encabezados, filas, nombre_tabla=None):
+    """
+    Genera un .xlsx completo a partir de filas ya en memoria, con el ancho de cada
+    columna ajustado al contenido. Solo depende de openpyxl, por lo que puede
+    ejecutarse en otro proceso (ProcessPoolExecutor).
+
+    Args:
+        titulo: Nombre de la hoja
+        encabezados: Lista de encabezados
+        filas: Lista de listas de valores
+        nombre_tabla: displayName de la tabla de Excel (se omite si no hay filas)
+
+    Returns:
+        bytes: El archivo completo
+    """
+    anchos = [len(str(encabezado)) + 2 for encabezado in encabezados]
+    for fila in filas:
+        for indice, valor in enumerate(fila):
+            if valor is not None:
+                anchos[indice] = max(anchos[indice], len(str(valor)) + 2)
+    return b''.join(generar_xlsx_streaming(titulo, encabezados, filas, anchos, nombre_tabla))
+
+
+def _encadenar(primera, resto):
+    yield primera
+    yield from resto
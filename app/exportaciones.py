@@ -0,0 +1,533 @@
+"""
+Generación de los reportes (Excel y CSV) y trabajos de exportación en segundo plano.
+Los trabajos se ejecutan en un pool de hilos acotado (EXPORT_WORKERS) fuera del
+ciclo de la petición o, con EXPORT_JOBS_EN_WEB desactivado, en un proceso aparte
+(`python manage.py procesar_exportaciones`); su estado y avance se guardan en
+TrabajoExportacion para que cualquier worker pueda responder las consultas de progreso.
+Los libros del paquete por empleado se arman en un pool de procesos (EXPORT_PAQUETE_PROCESOS).
+"""
+
+import multiprocessing
+import os
+import shutil
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Max, Q, QuerySet
+from django.db.models.functions import Length
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from . import cache_exportaciones
+from .csv_stream import generar_csv, CONTENT_TYPE_CSV, CONTENT_TYPE_GZIP
+from .excel_stream import BufferSalida, generar_xlsx, generar_xlsx_streaming, CONTENT_TYPE_XLSX
+from .models import Empleado, RegistroAsistencia, ResumenDiario, TrabajoExportacion
+from .services import FiltrosReporte, ReporteService
+
+# Prefijo del nombre de archivo de cada reporte
+REPORTES = {
+    'asistencia': 'registro_asistencia',
+    'resumen': 'resumen_asistencia',
+    'mensual': 'resumen_mensual',
+    'paquete': 'asistencia_por_empleado',
+}
+# Formato -> (extensión, content type)
+FORMATOS = {
+    'xlsx': ('.xlsx', CONTENT_TYPE_XLSX),
+    'csv': ('.csv', CONTENT_TYPE_CSV),
+    'csv.gz': ('.csv.gz', CONTENT_TYPE_GZIP),
+    'zip': ('.zip', 'application/zip'),
+}
+# Reportes que se generan en un único formato
+FORMATO_FIJO = {
+    'paquete': 'zip',
+}
+# Encabezados (sin Proyecto/Actividad mientras la funcionalidad está deshabilitada)
+ENCABEZADOS_RESUMEN = [
+    "Empleado", "Fecha", "Tiempo de Almuerzo",
+    "Horas por Comisión", "Horas por Permiso (Otros)",
+    "Horas Trabajadas Totales"
+]
+ENCABEZADOS_MENSUAL = [
+    "Empleado", "Mes", "Días Trabajados", "Horas Trabajadas Totales",
+    "Tiempo de Almuerzo", "Horas por Comisión", "Horas por Permiso (Otros)",
+    "Marcas Faltantes"
+]
+INTERVALO_PROGRESO = 1000  # filas entre cada actualización del avance
+
+_lock = threading.Lock()
+_pool = None
+_pool_procesos = None
+
+
+def formatos_reporte(tipo):
+    """Formatos en que se puede generar un reporte (el primero es el predeterminado)."""
+    if tipo in FORMATO_FIJO:
+        return (FORMATO_FIJO[tipo],)
+    return ('xlsx', 'csv', 'csv.gz')
+
+
+def nombre_archivo(tipo, filtros, formato='xlsx'):
+    """Nombre sugerido para la descarga de un reporte."""
+    return f"{REPORTES[tipo]}{filtros.sufijo_archivo()}{FORMATOS[formato][0]}"
+
+
+def _contar(filas, progreso):
+    """Reentrega las filas avisando a progreso(n) cada INTERVALO_PROGRESO filas y al terminar."""
+    if progreso is None:
+        yield from filas
+        return
+    cantidad = 0
+    for fila in filas:
+        cantidad += 1
+        if cantidad % INTERVALO_PROGRESO == 0:
+            progreso(cantidad)
+        yield fila
+    progreso(cantidad)
+
+
+def _registros_asistencia(filtros):
+    return filtros.aplicar(RegistroAsistencia.objects.order_by('-fecha_registro', '-hora_registro'))
+
+
+def filas_resumen(filtros):
+    """
+    Filas del resumen diario ya formateadas (HH:MM), leídas por bloques.
+
+    Yields:
+        list: Valores en el orden de ENCABEZADOS_RESUMEN
+    """
+    datos_diarios = ReporteService.obtener_datos_resumen(filtros)
+    if isinstance(datos_diarios, QuerySet):
+        datos_diarios = datos_diarios.iterator(chunk_size=ReporteService.TAMANO_LOTE_EXPORTACION)
+    # Columnas de proyecto/actividad deshabilitadas temporalmente
+    for data in datos_diarios:
+        horas = ReporteService.calcular_horas_empleado(data)
+        yield [
+            f"{data['nombres']} {data['apellidos']}",
+            data['fecha'].strftime("%Y-%m-%d"),
+            horas['almuerzo'],
+            horas['comision'],
+            horas['permiso'],
+            horas['trabajadas']
+        ]
+
+
+def filas_mensual(filtros):
+    """
+    Filas del resumen mensual por empleado, ya formateadas (HH:MM).
+
+    Yields:
+        list: Valores en el orden de ENCABEZADOS_MENSUAL
+    """
+    for data in ReporteService.obtener_datos_resumen_mensual(filtros):
+        horas = ReporteService.calcular_horas_empleado(data)
+        yield [
+            f"{data['nombres']} {data['apellidos']}",
+            data['mes'].strftime("%Y-%m"),
+            data['dias_trabajados'],
+            horas['trabajadas'],
+            horas['almuerzo'],
+            horas['comision'],
+            horas['permiso'],
+            data['marcas_faltantes']
+        ]
+
+
+def generar(tipo, filtros, formato='xlsx', progreso=None):
+    """
+    Genera un reporte en el formato pedido.
+
+    Args:
+        tipo: Clave de REPORTES
+        filtros: FiltrosReporte
+        formato: Clave de FORMATOS
+        progreso: Función opcional que recibe la cantidad de filas escritas
+
+    Returns:
+        iterable: Fragmentos de bytes del archivo
+    """
+    if formato in ('xlsx', 'zip'):
+        return GENERADORES[tipo](filtros, progreso)
+    if tipo == 'asistencia':
+        encabezados = ReporteService.ENCABEZADOS_ASISTENCIA
+        filas = ReporteService.filas_exportacion_asistencia(_registros_asistencia(filtros))
+    elif tipo == 'mensual':
+        encabezados, filas = ENCABEZADOS_MENSUAL, filas_mensual(filtros)
+    else:
+        encabezados, filas = ENCABEZADOS_RESUMEN, filas_resumen(filtros)
+    return generar_csv(encabezados, _contar(filas, progreso), comprimir=(formato == 'csv.gz'))
+
+
+def generar_asistencia(filtros, progreso=None):
+    """
+    Excel de registros de asistencia, generado en streaming.
+
+    Args:
+        filtros: FiltrosReporte
+        progreso: Función opcional que recibe la cantidad de filas escritas
+
+    Returns:
+        iterable: Fragmentos de bytes del archivo
+    """
+    registros = _registros_asistencia(filtros)
+
+    # Hoja adicional de Actividades: DESHABILITADA TEMPORALMENTE (el export en streaming es de una sola hoja)
+
+    return generar_xlsx_streaming(
+        "Asistencia",
+        ReporteService.ENCABEZADOS_ASISTENCIA,
+        _contar(ReporteService.filas_exportacion_asistencia(registros), progreso),
+        ReporteService.anchos_exportacion_asistencia(registros),
+        nombre_tabla="RegistroAsistencia",
+    )
+
+
+def _anchos(encabezados, contenido, filtros):
+    """
+    Ancho de cada columna de un resumen antes de escribir filas.
+    La primera columna es el nombre del empleado; su largo máximo se consulta en Empleado.
+
+    Args:
+        encabezados: Encabezados del reporte
+        contenido: Largo máximo del contenido de las demás columnas
+        filtros: FiltrosReporte (para acotar los empleados)
+    """
+    empleados = Empleado.objects.all()
+    if filtros.empleados:
+        empleados = empleados.filter(id_empleado__in=filtros.empleados)
+    largo_nombre = empleados.aggregate(largo=Max(Length('nombres') + Length('apellidos')))['largo'] or 0
+    return [
+        max(len(encabezado), largo) + 2
+        for encabezado, largo in zip(encabezados, [largo_nombre + 1, *contenido])
+    ]
+
+
+def generar_resumen(filtros, progreso=None):
+    """
+    Excel de resumen diario, generado en streaming.
+
+    Args:
+        filtros: FiltrosReporte
+        progreso: Función opcional que recibe la cantidad de filas escritas
+
+    Returns:
+        iterable: Fragmentos de bytes del archivo
+    """
+    # Una fila por empleado y fecha, leída de ResumenDiario
+    return generar_xlsx_streaming(
+        "Resumen Diario",
+        ENCABEZADOS_RESUMEN,
+        _contar(filas_resumen(filtros), progreso),
+        _anchos(ENCABEZADOS_RESUMEN, [10, 5, 5, 5, 5], filtros),
+        nombre_tabla="ResumenAsistencia",
+    )
+
+
+def generar_mensual(filtros, progreso=None):
+    """
+    Excel de resumen mensual (una fila por empleado y mes), generado en streaming.
+
+    Args:
+        filtros: FiltrosReporte
+        progreso: Función opcional que recibe la cantidad de filas escritas
+
+    Returns:
+        iterable: Fragmentos de bytes del archivo
+    """
+    return generar_xlsx_streaming(
+        "Resumen Mensual",
+        ENCABEZADOS_MENSUAL,
+        _contar(filas_mensual(filtros), progreso),
+        _anchos(ENCABEZADOS_MENSUAL, [7, 2, 6, 6, 6, 6, 2], filtros),
+        nombre_tabla="ResumenMensual",
+    )
+
+
+def _obtener_pool_procesos():
+    global _pool_procesos
+    with _lock:
+        if _pool_procesos is None:
+            # spawn: los hijos solo importan openpyxl, sin heredar hilos ni conexiones del servidor
+            _pool_procesos = ProcessPoolExecutor(
+                max_workers=max(1, settings.EXPORT_PAQUETE_PROCESOS),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool_procesos
+
+
+def _descartar_pool_procesos():
+    global _pool_procesos
+    with _lock:
+        _pool_procesos = None
+
+
+def _empleados_con_registros(filtros):
+    return _registros_asistencia(filtros).order_by('empleado__apellidos', 'empleado__nombres', 'empleado_id') \
+        .values_list('empleado_id', 'empleado__nombres', 'empleado__apellidos') \
+        .distinct()
+
+
+def generar_paquete(filtros, progreso=None):
+    """
+    ZIP con un Excel de registros de asistencia por empleado.
+    Los registros se leen en este proceso con una sola consulta ordenada por empleado
+    (ReporteService.filas_exportacion_por_empleado) y cada libro se arma en el pool de
+    procesos; el ZIP se entrega a medida que los libros terminan, en orden de empleado
+    y con a lo sumo dos libros por proceso en espera.
+
+    Args:
+        filtros: FiltrosReporte
+        progreso: Función opcional que recibe la cantidad de empleados escritos
+
+    Yields:
+        bytes: Fragmentos consecutivos del ZIP
+    """
+    pool = _obtener_pool_procesos()
+    en_espera = 2 * max(1, settings.EXPORT_PAQUETE_PROCESOS)
+    buffer = BufferSalida()
+    # Los .xlsx ya vienen comprimidos
+    paquete = zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED)
+    pendientes = deque()
+    escritos = 0
+
+    def escribir_siguiente():
+        nonlocal escritos
+        nombre, futuro = pendientes.popleft()
+        paquete.writestr(nombre, futuro.result())
+        escritos += 1
+        if progreso is not None:
+            progreso(escritos)
+        return buffer.vaciar()
+
+    try:
+        por_empleado = ReporteService.filas_exportacion_por_empleado(_registros_asistencia(filtros))
+        for empleado_id, nombres, apellidos, filas in por_empleado:
+            futuro = pool.submit(
+                generar_xlsx, "Asistencia", ReporteService.ENCABEZADOS_ASISTENCIA, filas, "RegistroAsistencia"
+            )
+            nombre = f"{get_valid_filename(f'{apellidos}_{nombres}')}_{empleado_id}.xlsx"
+            pendientes.append((nombre, futuro))
+            if len(pendientes) >= en_espera:
+                yield escribir_siguiente()
+        while pendientes:
+            yield escribir_siguiente()
+        paquete.close()
+        yield buffer.vaciar()
+    except BrokenProcessPool:
+        # Un proceso hijo murió: el siguiente paquete crea un pool nuevo
+        _descartar_pool_procesos()
+        raise
+    finally:
+        for _, futuro in pendientes:
+            futuro.cancel()
+
+
+GENERADORES = {
+    'asistencia': generar_asistencia,
+    'resumen': generar_resumen,
+    'mensual': generar_mensual,
+    'paquete': generar_paquete,
+}
+
+
+def total_filas(tipo, filtros):
+    """Cantidad de filas de datos que tendrá el reporte (para el porcentaje de avance)."""
+    if tipo == 'mensual':
+        return ReporteService.consulta_resumen_mensual(filtros).count()
+    if tipo == 'paquete':
+        return _empleados_con_registros(filtros).count()
+    if tipo == 'resumen':
+        if filtros.tipos:
+            return ReporteService.consulta_resumen(
+                filtros.aplicar(RegistroAsistencia.objects.all()), []
+            ).count()
+        return filtros.aplicar_resumen(ResumenDiario.objects.all()).count()
+    return filtros.aplicar(RegistroAsistencia.objects.all()).count()
+
+
+# --- Trabajos en segundo plano ---
+
+def _directorio_trabajos():
+    directorio = Path(settings.EXPORT_CACHE_DIR) / 'trabajos'
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.EXPORT_WORKERS), thread_name_prefix='exportacion'
+            )
+        return _pool
+
+
+def encolar(tipo, filtros, usuario, formato='xlsx'):
+    """
+    Registra un trabajo de exportación y lo envía al pool de hilos
+    (o lo deja pendiente para procesar_exportaciones si EXPORT_JOBS_EN_WEB está desactivado).
+
+    Args:
+        tipo: Clave de REPORTES
+        filtros: FiltrosReporte
+        usuario: Usuario que lo solicita; solo él puede consultarlo y descargarlo
+        formato: Clave de FORMATOS
+
+    Returns:
+        TrabajoExportacion: Trabajo en estado pendiente
+    """
+    limpiar_vencidos()
+    recuperar_huerfanos()
+    trabajo = TrabajoExportacion.objects.create(
+        tipo=tipo,
+        filtros=filtros.como_dict(),
+        formato=formato,
+        nombre_archivo=nombre_archivo(tipo, filtros, formato),
+        usuario=usuario,
+    )
+    if settings.EXPORT_JOBS_EN_WEB:
+        # Se encola al confirmar la transacción para que el hilo vea el registro
+        transaction.on_commit(lambda: _obtener_pool().submit(ejecutar, trabajo.pk))
+    return trabajo
+
+
+def _reclamar(trabajo_id):
+    """Pasa un trabajo de pendiente a en proceso; solo un hilo o proceso lo consigue."""
+    return TrabajoExportacion.objects.filter(pk=trabajo_id, estado=TrabajoExportacion.PENDIENTE).update(
+        estado=TrabajoExportacion.EN_PROCESO, ultimo_avance=timezone.now()
+    )
+
+
+def ejecutar(trabajo_id):
+    """
+    Genera el archivo de un trabajo actualizando su avance.
+    Corre en un hilo del pool o en procesar_exportaciones; si otro ya lo tomó, no hace nada.
+    """
+    close_old_connections()
+    try:
+        if not _reclamar(trabajo_id):
+            return
+        trabajo = TrabajoExportacion.objects.get(pk=trabajo_id)
+        filtros = FiltrosReporte.desde_dict(trabajo.filtros)
+        destino = _directorio_trabajos() / f"{trabajo.pk}{FORMATOS[trabajo.formato][0]}"
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(
+            filas_totales=total_filas(trabajo.tipo, filtros), ultimo_avance=timezone.now()
+        )
+
+        def progreso(cantidad):
+            TrabajoExportacion.objects.filter(pk=trabajo.pk).update(
+                filas_procesadas=cantidad, ultimo_avance=timezone.now()
+            )
+
+        en_cache = None
+        if cache_exportaciones.activa():
+            clave = cache_exportaciones.clave(
+                trabajo.tipo, trabajo.formato, filtros, cache_exportaciones.marca_de_agua(filtros)
+            )
+            en_cache = cache_exportaciones.obtener(clave)
+        if en_cache:
+            shutil.copyfile(en_cache, destino)
+            TrabajoExportacion.objects.filter(pk=trabajo.pk).update(filas_procesadas=F('filas_totales'))
+        else:
+            fragmentos = generar(trabajo.tipo, filtros, trabajo.formato, progreso)
+            if cache_exportaciones.activa():
+                # Igual que las descargas directas: el archivo queda en caché con la marca de agua leída antes
+                fragmentos = cache_exportaciones.guardar_mientras(clave, fragmentos)
+            temporal = destino.with_name(f"{trabajo.pk}.tmp")
+            with open(temporal, 'wb') as archivo:
+                for fragmento in fragmentos:
+                    archivo.write(fragmento)
+            os.replace(temporal, destino)
+
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(
+            estado=TrabajoExportacion.TERMINADO, archivo=str(destino), terminado=timezone.now()
+        )
+    except Exception as e:
+        TrabajoExportacion.objects.filter(pk=trabajo_id).update(
+            estado=TrabajoExportacion.ERROR, error=str(e)[:500], terminado=timezone.now()
+        )
+    finally:
+        connection.close()
+
+
+def procesar_pendientes():
+    """
+    Ejecuta, uno tras otro, los trabajos pendientes (más antiguos primero).
+    Lo usa procesar_exportaciones cuando los trabajos no corren en los workers web.
+
+    Returns:
+        int: Cantidad de trabajos procesados
+    """
+    recuperar_huerfanos()
+    pendientes = list(
+        TrabajoExportacion.objects.filter(estado=TrabajoExportacion.PENDIENTE)
+        .order_by('creado').values_list('pk', flat=True)
+    )
+    for trabajo_id in pendientes:
+        ejecutar(trabajo_id)
+    return len(pendientes)
+
+
+def recuperar_huerfanos():
+    """
+    Marca como error los trabajos sin avance en EXPORT_JOBS_ESTANCADO_MINUTOS: el worker
+    o proceso que los generaba se reinició y nadie más los va a terminar. Con
+    EXPORT_JOBS_EN_WEB también los pendientes, porque se encolan solo en memoria.
+
+    Returns:
+        int: Cantidad de trabajos marcados
+    """
+    limite = timezone.now() - timedelta(minutes=settings.EXPORT_JOBS_ESTANCADO_MINUTOS)
+    huerfanos = Q(estado=TrabajoExportacion.EN_PROCESO, ultimo_avance__lt=limite)
+    if settings.EXPORT_JOBS_EN_WEB:
+        huerfanos |= Q(estado=TrabajoExportacion.PENDIENTE, creado__lt=limite)
+    return TrabajoExportacion.objects.filter(huerfanos).update(
+        estado=TrabajoExportacion.ERROR,
+        error='La exportación se interrumpió (reinicio del servidor). Vuelve a solicitarla.',
+        terminado=timezone.now(),
+    )
+
+
+def limpiar_vencidos():
+    """Elimina los trabajos (y sus archivos) más antiguos que EXPORT_JOBS_RETENCION_HORAS."""
+    limite = timezone.now() - timedelta(hours=settings.EXPORT_JOBS_RETENCION_HORAS)
+    vencidos = TrabajoExportacion.objects.filter(creado__lt=limite)
+    for archivo in vencidos.exclude(archivo='').values_list('archivo', flat=True):
+        try:
+            os.remove(archivo)
+        except FileNotFoundError:
+            pass
+    vencidos.delete()
+
+
+def serializar(trabajo):
+    """
+    Estado de un trabajo para las respuestas JSON.
+
+    Returns:
+        dict: Estado, avance y URLs de consulta y descarga
+    """
+    datos = {
+        'id': str(trabajo.pk),
+        'tipo': trabajo.tipo,
+        'formato': trabajo.formato,
+        'estado': trabajo.estado,
+        'filas_procesadas': trabajo.filas_procesadas,
+        'filas_totales': trabajo.filas_totales,
+        'porcentaje': trabajo.porcentaje,
+        'nombre_archivo': trabajo.nombre_archivo,
+        'url_estado': reverse('api_estado_exportacion', args=[trabajo.pk]),
+    }
+    if trabajo.estado == TrabajoExportacion.TERMINADO:
+        datos['url_descarga'] = reverse('descargar_exportacion', args=[trabajo.pk])
+    if trabajo.estado == TrabajoExportacion.ERROR:
+        datos['error'] = trabajo.error
+    return datos
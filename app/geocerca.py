@@ -0,0 +1,176 @@
+"""
+Validación de ubicación contra las sedes configuradas (geocerca).
+Las sedes se indexan en una grilla de celdas de tamaño fijo para que cada
+consulta solo evalúe las sedes cercanas, sin importar cuántas haya.
+"""
+
+import math
+from collections import defaultdict
+from functools import lru_cache
+from django.conf import settings
+from .utils import calcular_distancia_geografica
+
+RADIO_TIERRA = 6371000.0  # el mismo que usa calcular_distancia_geografica
+METROS_POR_GRADO = math.radians(RADIO_TIERRA)
+MARGEN_GRADOS = 1e-9  # evita descartar por redondeo puntos justo en el borde del radio
+
+
+class Sede:
+    """
+    Sede con su radio permitido y su rectángulo envolvente precalculado.
+
+    delta_lon es la mitad del ancho en longitud del casquete esférico; es None
+    cuando el radio alcanza un polo y la sede abarca todas las longitudes.
+    """
+
+    __slots__ = ('nombre', 'lat', 'lon', 'radio', 'lat_min', 'lat_max', 'delta_lon')
+
+    def __init__(self, nombre, lat, lon, radio):
+        self.nombre = nombre
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.radio = float(radio)
+        radio_angular = self.radio / RADIO_TIERRA
+        delta_lat = math.degrees(radio_angular) + MARGEN_GRADOS
+        self.lat_min, self.lat_max = max(self.lat - delta_lat, -90.0), min(self.lat + delta_lat, 90.0)
+        if radio_angular >= math.pi / 2 - math.radians(abs(self.lat)):
+            self.delta_lon = None
+        else:
+            self.delta_lon = math.degrees(
+                math.asin(math.sin(radio_angular) / math.cos(math.radians(self.lat)))
+            ) + MARGEN_GRADOS
+
+    def contiene(self, lat, lon):
+        """Retorna True si el punto está dentro del radio de la sede."""
+        if not self.lat_min <= lat <= self.lat_max:
+            return False
+        # Diferencia de longitud normalizada a [-180, 180) para cruzar el antimeridiano
+        if self.delta_lon is not None and abs((lon - self.lon + 180.0) % 360.0 - 180.0) > self.delta_lon:
+            return False
+        return calcular_distancia_geografica(lat, lon, self.lat, self.lon) <= self.radio
+
+    def __repr__(self):
+        return f"Sede({self.nombre!r}, {self.lat}, {self.lon}, radio={self.radio})"
+
+
+class IndiceSedes:
+    """
+    Índice espacial de sedes basado en una grilla lat/lon.
+
+    El lado de la celda es el mayor radio (en grados), así que cada sede ocupa
+    pocas celdas y un punto solo se compara con las sedes de su celda. Las
+    columnas dan la vuelta en ±180°. Cerca de los polos, donde una sede cruzaría
+    más de COLUMNAS_POR_SEDE columnas, se guarda una sola vez para toda la fila.
+    """
+
+    COLUMNAS_POR_SEDE = 64
+
+    def __init__(self, sedes):
+        self.sedes = [s if isinstance(s, Sede) else Sede(**s) for s in sedes]
+        radio_max = max((s.radio for s in self.sedes), default=1.0)
+        self.tamano_celda = max(radio_max / METROS_POR_GRADO, 1e-4)
+        self._num_columnas = math.ceil(360.0 / self.tamano_celda)
+        self._celdas = defaultdict(list)
+        self._filas = defaultdict(list)
+        for sede in self.sedes:
+            columnas = self._columnas_de(sede)
+            for i in range(self._fila(sede.lat_min), self._fila(sede.lat_max) + 1):
+                if columnas is None:
+                    self._filas[i].append(sede)
+                else:
+                    for j in columnas:
+                        self._celdas[(i, j)].append(sede)
+        # Las celdas con sedes propias también llevan las de su fila, en el orden de la configuración
+        orden = {id(sede): posicion for posicion, sede in enumerate(self.sedes)}
+        for (i, _), candidatas in self._celdas.items():
+            candidatas.extend(self._filas.get(i, ()))
+            candidatas.sort(key=lambda sede: orden[id(sede)])
+
+    def _fila(self, lat):
+        return math.floor(lat / self.tamano_celda)
+
+    def _columna(self, lon):
+        return math.floor(((lon + 180.0) % 360.0) / self.tamano_celda) % self._num_columnas
+
+    def _columnas_de(self, sede):
+        """Columnas que cubre la sede, o None si debe indexarse en toda la fila."""
+        limite = min(self.COLUMNAS_POR_SEDE, self._num_columnas - 1)
+        if sede.delta_lon is None or 2 * sede.delta_lon / self.tamano_celda + 2 > limite:
+            return None
+        inicio = self._columna(sede.lon - sede.delta_lon)
+        total = (self._columna(sede.lon + sede.delta_lon) - inicio) % self._num_columnas + 1
+        return [(inicio + k) % self._num_columnas for k in range(total)]
+
+    def _candidatas(self, celda):
+        return self._celdas.get(celda) or self._filas.get(celda[0], ())
+
+    def sede_para(self, lat, lon):
+        """
+        Busca la sede que contiene el punto.
+
+        Args:
+            lat, lon: Coordenadas a validar
+
+        Returns:
+            Sede o None si el punto está fuera de todas las sedes (si hay varias,
+            la primera en el orden de SEDES_ASISTENCIA)
+        """
+        for sede in self._candidatas((self._fila(lat), self._columna(lon))):
+            if sede.contiene(lat, lon):
+                return sede
+        return None
+
+    def sedes_para_puntos(self, puntos):
+        """
+        Versión por lotes de sede_para: agrupa los puntos por celda para resolver
+        las candidatas una sola vez por celda.
+
+        Args:
+            puntos: Lista de tuplas (lat, lon)
+
+        Returns:
+            list: Sede o None por cada punto, en el mismo orden
+        """
+        por_celda = defaultdict(list)
+        for posicion, (lat, lon) in enumerate(puntos):
+            por_celda[(self._fila(lat), self._columna(lon))].append(posicion)
+
+        resultado = [None] * len(puntos)
+        for celda, posiciones in por_celda.items():
+            candidatas = self._candidatas(celda)
+            if not candidatas:
+                continue
+            for posicion in posiciones:
+                lat, lon = puntos[posicion]
+                for sede in candidatas:
+                    if sede.contiene(lat, lon):
+                        resultado[posicion] = sede
+                        break
+        return resultado
+
+
+@lru_cache(maxsize=1)
+def obtener_indice_sedes():
+    """Índice construido una vez por proceso a partir de settings.SEDES_ASISTENCIA."""
+    return IndiceSedes(getattr(settings, 'SEDES_ASISTENCIA', []))
+
+
+def geocerca_activa():
+    """Retorna True si el servidor debe validar la ubicación de cada registro."""
+    return getattr(settings, 'GEOCERCA_ACTIVA', False)
+
+
+def parsear_coordenadas(latitud, longitud):
+    """
+    Convierte las coordenadas recibidas del formulario o del JSON.
+
+    Returns:
+        tuple: (lat, lon) como float, o None si faltan o son inválidas
+    """
+    try:
+        lat, lon = float(latitud), float(longitud)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):  # también descarta NaN
+        return None
+    return lat, lon
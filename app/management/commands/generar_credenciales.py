@@ -0,0 +1,24 @@
+"""
+Genera el PDF imprimible de credenciales QR (12 por página A4).
+Ejecutar: python manage.py generar_credenciales --salida credenciales.pdf [--empleado 3 --empleado 7]
+"""
+
+from django.core.management.base import BaseCommand
+from app.qr_service import QRService
+
+
+class Command(BaseCommand):
+    help = "Genera un PDF con las credenciales QR (QR y nombre) de todos los empleados o de los indicados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salida', default='credenciales_qr.pdf', help="Archivo PDF a escribir.")
+        parser.add_argument('--empleado', type=int, action='append', default=[],
+                            help="ID de empleado a incluir (repetible; por defecto todos).")
+
+    def handle(self, *args, **options):
+        tamano = 0
+        with open(options['salida'], 'wb') as archivo:
+            for fragmento in QRService.generar_pdf_credenciales(tuple(options['empleado'])):
+                archivo.write(fragmento)
+                tamano += len(fragmento)
+        self.stdout.write(self.style.SUCCESS(f"Credenciales guardadas en {options['salida']} ({tamano // 1024} KB)."))
@@ -0,0 +1,47 @@
+"""
+Genera las imágenes QR de todos los empleados (asigna los códigos faltantes).
+Las imágenes que no cambiaron desde la última ejecución se reutilizan.
+Con --revocar se regenera antes el código de los empleados indicados (credencial
+perdida): su QR anterior, con codigo_qr o token firmado, deja de ser válido.
+Cada QR dibujado de nuevo invalida la credencial impresa antes para ese empleado
+(p. ej. los tokens firmados sin sello): el comando avisa que deben reimprimirse.
+Ejecutar: python manage.py generar_qr --procesos 4 [--revocar 12 15]
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from app.models import Empleado
+from app.qr_service import QRService
+
+
+class Command(BaseCommand):
+    help = "Genera los QR de todos los empleados en paralelo, dibujando solo los que cambiaron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int,
+                            help="Procesos para dibujar los QR (por defecto QR_PROCESOS).")
+        parser.add_argument('--revocar', type=int, nargs='+', default=[], metavar='ID_EMPLEADO',
+                            help="Regenera el código QR de estos empleados, revocando su credencial impresa.")
+
+    def handle(self, *args, **options):
+        empleados = list(Empleado.objects.filter(id_empleado__in=options['revocar']))
+        faltantes = set(options['revocar']) - {empleado.id_empleado for empleado in empleados}
+        if faltantes:
+            raise CommandError(f"Empleados no encontrados: {', '.join(map(str, sorted(faltantes)))}")
+        for empleado in empleados:
+            empleado.revocar_codigo_qr()
+            self.stdout.write(f"QR revocado: {empleado.nombre_completo}")
+
+        inicio = time.perf_counter()
+        archivos = QRService.generar_qr_todos_empleados(procesos=options['procesos'])
+        generados = sum(1 for item in archivos if item['generado'])
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"QR listos: {len(archivos)} ({generados} generado(s), {len(archivos) - generados} sin cambios) "
+            f"en {duracion:.2f}s."
+        ))
+        if generados:
+            self.stdout.write(self.style.WARNING(
+                f"Reimprime las credenciales de los {generados} QR generados: las impresas antes "
+                f"para esos empleados (incluidos los tokens firmados sin sello) ya no son válidas."
+            ))
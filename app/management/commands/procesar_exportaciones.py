@@ -0,0 +1,31 @@
+"""
+Procesa los trabajos de exportación en segundo plano fuera de los workers web
+(usar con EXPORT_JOBS_EN_WEB=False), para que generar archivos grandes no compita
+por el GIL con las peticiones de marcación.
+Ejecutar: python manage.py procesar_exportaciones --intervalo 5
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from app import exportaciones
+
+
+class Command(BaseCommand):
+    help = "Genera los trabajos de exportación pendientes; por defecto queda esperando nuevos trabajos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help="Procesa los pendientes y termina (para ejecutarlo desde cron).")
+        parser.add_argument('--intervalo', type=float, default=5,
+                            help="Segundos entre cada revisión de trabajos pendientes (por defecto 5).")
+
+    def handle(self, *args, **options):
+        while True:
+            procesados = exportaciones.procesar_pendientes()
+            if procesados:
+                self.stdout.write(f"Trabajos procesados: {procesados}")
+            if options['una_vez']:
+                break
+            if not procesados:
+                time.sleep(options['intervalo'])
+        exportaciones.limpiar_vencidos()
@@ -0,0 +1,192 @@
+"""
+Prueba de carga del cambio de turno: N empleados marcando "Entrada" a la vez.
+Recorre el flujo real del QR general para cada empleado sintético:
+identificar_dispositivo -> api_identificar_por_fingerprint -> formulario -> registrar_asistencia_auto (POST)
+
+Se ejecuta sobre una base de datos de prueba temporal (SQLite o PostgreSQL según
+la configuración), nunca sobre los datos reales.
+
+Ejecutar: python manage.py prueba_carga --empleados 200 --concurrencia 16
+"""
+
+import json
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+PASOS = ('identificar_dispositivo', 'api_identificar', 'formulario', 'registrar_asistencia')
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores:
+        return 0.0
+    k = max(0, min(len(valores) - 1, round(p / 100 * len(valores) + 0.5) - 1))
+    return valores[k]
+
+
+class Command(BaseCommand):
+    help = "Simula el marcaje de Entrada concurrente de N empleados y reporta throughput, latencias y consultas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empleados', type=int, default=100, help="Empleados sintéticos (por defecto 100).")
+        parser.add_argument('--concurrencia', type=int, default=8, help="Hilos cliente simultáneos (por defecto 8).")
+        parser.add_argument('--ventana', type=float, default=0.0,
+                            help="Segundos en los que se reparten las llegadas (0 = todas de golpe).")
+        parser.add_argument('--semilla', type=int, default=1, help="Semilla para el orden y tiempos de llegada.")
+        parser.add_argument('--json', dest='salida_json', help="Guarda el resultado en un archivo JSON.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        nombre_original = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # Archivo en disco: una BD en memoria compartida bloquea tablas completas entre hilos
+            connection.settings_dict['TEST']['NAME'] = str(settings.BASE_DIR / 'prueba_carga.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            resultado = self._ejecutar(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        self._reportar(resultado)
+        if options['salida_json']:
+            with open(options['salida_json'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+
+    def _preparar_datos(self, cantidad):
+        from app.models import Empleado, TipoAsistencia, DispositivoEmpleado
+
+        entrada = TipoAsistencia.objects.create(nombre_asistencia='Entrada')
+        for nombre in ('Inicio Almuerzo', 'Fin Almuerzo', 'Salida'):
+            TipoAsistencia.objects.create(nombre_asistencia=nombre)
+        Empleado.objects.bulk_create(
+            Empleado(nombres=f"Empleado {i:05d}", apellidos="Carga") for i in range(cantidad)
+        )
+        empleados = list(Empleado.objects.filter(apellidos="Carga").values_list('id_empleado', flat=True))
+        DispositivoEmpleado.objects.bulk_create(
+            DispositivoEmpleado(empleado_id=empleado_id, fingerprint=f"carga-{empleado_id}")
+            for empleado_id in empleados
+        )
+        return entrada.id_tipo, empleados
+
+    def _ejecutar(self, options):
+        from app.models import RegistroAsistencia
+
+        tipo_id, empleados = self._preparar_datos(options['empleados'])
+        sedes = getattr(settings, 'SEDES_ASISTENCIA', [])
+        ubicacion = {'latitud': sedes[0]['lat'], 'longitud': sedes[0]['lon']} if sedes else {}
+
+        aleatorio = random.Random(options['semilla'])
+        aleatorio.shuffle(empleados)
+        llegadas = sorted(aleatorio.uniform(0, options['ventana']) for _ in empleados)
+
+        pendientes = queue.Queue()
+        for empleado_id, llegada in zip(empleados, llegadas):
+            pendientes.put((empleado_id, llegada))
+
+        latencias = defaultdict(list)
+        consultas = defaultdict(list)
+        errores = defaultdict(int)
+        lock = threading.Lock()
+        inicio = time.perf_counter()
+
+        def medir(paso, funcion, esperado):
+            with CaptureQueriesContext(connection) as capturadas:
+                t0 = time.perf_counter()
+                respuesta = funcion()
+                duracion = time.perf_counter() - t0
+            with lock:
+                latencias[paso].append(duracion * 1000)
+                consultas[paso].append(len(capturadas))
+                if respuesta.status_code != esperado:
+                    errores[paso] += 1
+            return respuesta
+
+        def trabajador():
+            cliente = Client()
+            try:
+                while True:
+                    try:
+                        empleado_id, llegada = pendientes.get_nowait()
+                    except queue.Empty:
+                        return
+                    espera = inicio + llegada - time.perf_counter()
+                    if espera > 0:
+                        time.sleep(espera)
+                    fingerprint = f"carga-{empleado_id}"
+                    url_formulario = reverse('registrar_asistencia_auto', args=[empleado_id])
+                    medir('identificar_dispositivo', lambda: cliente.get(reverse('identificar_dispositivo')), 200)
+                    medir('api_identificar', lambda: cliente.post(
+                        reverse('api_identificar_por_fingerprint'),
+                        json.dumps({'fingerprint': fingerprint}),
+                        content_type='application/json',
+                    ), 200)
+                    medir('formulario', lambda: cliente.get(url_formulario), 200)
+                    medir('registrar_asistencia', lambda: cliente.post(url_formulario, {
+                        'tipo_evento': tipo_id,
+                        'fingerprint': fingerprint,
+                        **ubicacion,
+                    }), 200)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=trabajador) for _ in range(max(1, options['concurrencia']))]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        total = time.perf_counter() - inicio
+
+        registrados = RegistroAsistencia.objects.count()
+        pasos = {}
+        for paso in PASOS:
+            valores = sorted(latencias[paso])
+            pasos[paso] = {
+                'peticiones': len(valores),
+                'errores': errores[paso],
+                'p50_ms': round(percentil(valores, 50), 2),
+                'p95_ms': round(percentil(valores, 95), 2),
+                'p99_ms': round(percentil(valores, 99), 2),
+                'max_ms': round(valores[-1], 2) if valores else 0.0,
+                'consultas_promedio': round(sum(consultas[paso]) / len(consultas[paso]), 2) if consultas[paso] else 0.0,
+                'consultas_max': max(consultas[paso], default=0),
+            }
+        return {
+            'motor': connection.vendor,
+            'empleados': len(empleados),
+            'concurrencia': options['concurrencia'],
+            'ventana_s': options['ventana'],
+            'duracion_s': round(total, 3),
+            'flujos_por_segundo': round(len(empleados) / total, 2) if total else 0.0,
+            'peticiones_por_segundo': round(len(empleados) * len(PASOS) / total, 2) if total else 0.0,
+            'registros_creados': registrados,
+            'pasos': pasos,
+        }
+
+    def _reportar(self, r):
+        self.stdout.write(
+            f"Motor: {r['motor']} | Empleados: {r['empleados']} | Concurrencia: {r['concurrencia']} | "
+            f"Ventana: {r['ventana_s']}s"
+        )
+        self.stdout.write(
+            f"Duración: {r['duracion_s']}s | Flujos/s: {r['flujos_por_segundo']} | "
+            f"Peticiones/s: {r['peticiones_por_segundo']}"
+        )
+        self.stdout.write(f"{'Paso':<26}{'n':>6}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'q/pet':>8}{'q max':>7}")
+        for paso, m in r['pasos'].items():
+            self.stdout.write(
+                f"{paso:<26}{m['peticiones']:>6}{m['errores']:>5}{m['p50_ms']:>9}{m['p95_ms']:>9}"
+                f"{m['p99_ms']:>9}{m['max_ms']:>9}{m['consultas_promedio']:>8}{m['consultas_max']:>7}"
+            )
+        estilo = self.style.SUCCESS if r['registros_creados'] == r['empleados'] else self.style.ERROR
+        self.stdout.write(estilo(f"Entradas registradas: {r['registros_creados']} de {r['empleados']}"))
@@ -0,0 +1,35 @@
+"""
+Reconstruye la tabla ResumenDiario desde RegistroAsistencia.
+Necesario tras corregir registros a mano o renombrar tipos de asistencia.
+Ejecutar: python manage.py reconstruir_resumen --desde 2025-01-01 --hasta 2025-01-31
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from app.services import ReporteService
+
+
+def fecha(valor):
+    try:
+        resultado = parse_date(valor)
+    except ValueError:
+        resultado = None
+    if resultado is None:
+        raise CommandError(f"Fecha inválida: {valor} (formato YYYY-MM-DD)")
+    return resultado
+
+
+class Command(BaseCommand):
+    help = "Recalcula ResumenDiario para un rango de fechas (por defecto, todo el historial)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=fecha, help="Primera fecha a reconstruir (YYYY-MM-DD).")
+        parser.add_argument('--hasta', type=fecha, help="Última fecha a reconstruir (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        desde, hasta = options['desde'], options['hasta']
+        if desde and hasta and desde > hasta:
+            raise CommandError("--desde no puede ser posterior a --hasta")
+        total = ReporteService.reconstruir_resumen(desde, hasta)
+        rango = f"{desde or 'inicio'} a {hasta or 'hoy'}"
+        self.stdout.write(self.style.SUCCESS(f"Resumen diario reconstruido ({rango}): {total} día(s)-empleado."))
@@ -0,0 +1,145 @@
+"""
+Verifica con EXPLAIN que las consultas frecuentes sobre RegistroAsistencia usan índices.
+En PostgreSQL además exige lectura solo del índice (Index Only Scan) en las consultas
+que los índices cubren con sus columnas include.
+Ejecutar: python manage.py verificar_indices
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from app.models import Empleado, RegistroAsistencia
+from app.services import FiltrosReporte, ReporteService
+
+
+def consultas_frecuentes():
+    """
+    Retorna las consultas críticas junto con el índice que deben usar.
+
+    Returns:
+        list: Tuplas (descripción, queryset, índice esperado, requiere orden sin sort,
+        cubierta por el índice)
+    """
+    hoy = timezone.localtime().date()
+    empleado = Empleado(id_empleado=1)
+    return [
+        (
+            "RegistroAsistencia.obtener_registros_hoy",
+            RegistroAsistencia.obtener_registros_hoy(),
+            "idx_registro_fecha_hora",
+            False,
+            False,
+        ),
+        (
+            "AsistenciaService.validar_registro_duplicado (índice parcial de la restricción única)",
+            RegistroAsistencia.objects.filter(empleado=empleado, tipo_id=1, fecha_registro=hoy, tipo_unico=True),
+            "uniq_registro_tipo_unico_por_dia",
+            False,
+            False,
+        ),
+        (
+            "Empleado.tiene_registro_hoy",
+            RegistroAsistencia.objects.filter(empleado=empleado, tipo_id=1, fecha_registro=hoy),
+            "idx_registro_emp_fecha_hora",
+            False,
+            False,
+        ),
+        (
+            "RegistroAsistencia.obtener_registros_por_empleado",
+            RegistroAsistencia.obtener_registros_por_empleado(empleado, hoy),
+            "idx_registro_emp_fecha_hora",
+            True,
+            False,
+        ),
+        (
+            "ReporteService.consulta_resumen",
+            ReporteService.consulta_resumen(RegistroAsistencia.objects.all(), [(1, "Entrada"), (2, "Salida")]),
+            "idx_registro_emp_fecha_hora",
+            True,
+            True,
+        ),
+        (
+            "ReporteService.obtener_datos_resumen (ResumenDiario, por rango de fechas)",
+            ReporteService.obtener_datos_resumen(FiltrosReporte(desde=hoy, hasta=hoy)),
+            "idx_resumen_fecha_emp",
+            False,
+            False,
+        ),
+        (
+            "ReporteService.consulta_resumen_mensual (ResumenDiario, por rango de fechas)",
+            ReporteService.consulta_resumen_mensual(FiltrosReporte(desde=hoy.replace(day=1), hasta=hoy)),
+            "idx_resumen_fecha_emp",
+            False,
+            False,
+        ),
+        (
+            "ReporteService.filas_exportacion_asistencia",
+            RegistroAsistencia.objects.order_by('-fecha_registro', '-hora_registro')
+            .values_list(*ReporteService.CAMPOS_EXPORTACION_ASISTENCIA),
+            "idx_registro_fecha_hora",
+            True,
+            True,
+        ),
+    ]
+
+
+def ordena_en_memoria(plan):
+    """Detecta un paso de ordenamiento explícito en el plan (SQLite o PostgreSQL)."""
+    for linea in plan.splitlines():
+        paso = linea.strip().lstrip('->').strip()
+        if 'TEMP B-TREE FOR ORDER BY' in paso or paso.startswith(('Sort ', 'Incremental Sort')):
+            return True
+    return False
+
+
+def plan_valido(plan, indice, sin_sort, cubierta, motor):
+    """
+    Comprueba el plan de una consulta frecuente.
+
+    Args:
+        plan: Salida de QuerySet.explain()
+        indice: Nombre del índice que debe aparecer
+        sin_sort: True si el orden debe salir del índice
+        cubierta: True si en PostgreSQL debe leerse solo el índice
+        motor: connection.vendor
+
+    Returns:
+        bool: True si el plan usa el índice como se espera
+    """
+    if indice not in plan or (sin_sort and ordena_en_memoria(plan)):
+        return False
+    if cubierta and motor == 'postgresql':
+        return f"Index Only Scan using {indice}" in plan or f"Index Only Scan Backward using {indice}" in plan
+    return True
+
+
+class Command(BaseCommand):
+    help = "Verifica con EXPLAIN que las consultas frecuentes de asistencia usan los índices compuestos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plan', action='store_true', help="Muestra el plan completo de cada consulta.")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Motor no soportado: {connection.vendor}")
+
+        fallos = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Con tablas pequeñas el planificador prefiere Seq Scan; se comprueba que el índice sea utilizable
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for descripcion, queryset, indice, sin_sort, cubierta in consultas_frecuentes():
+                plan = queryset.explain()
+                ok = plan_valido(plan, indice, sin_sort, cubierta, connection.vendor)
+                estado = self.style.SUCCESS("OK   ") if ok else self.style.ERROR("FALLA")
+                self.stdout.write(f"{estado} {descripcion} -> {indice}")
+                if options['plan'] or not ok:
+                    self.stdout.write(plan)
+                if not ok:
+                    fallos.append(descripcion)
+
+        if fallos:
+            raise CommandError(f"{len(fallos)} consulta(s) sin el índice esperado: {', '.join(fallos)}")
+        self.stdout.write(self.style.SUCCESS("Todas las consultas frecuentes usan índices."))
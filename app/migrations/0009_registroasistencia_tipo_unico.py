@@ -0,0 +1,45 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+TIPOS_UNICOS = ['Entrada', 'Inicio Almuerzo', 'Fin Almuerzo', 'Salida']
+
+
+def marcar_tipos_unicos(apps, schema_editor):
+    """
+    Marca como tipo_unico el primer registro de cada (empleado, tipo, fecha) de tipos únicos.
+    Los duplicados históricos quedan sin marcar para que la restricción pueda crearse.
+    """
+    RegistroAsistencia = apps.get_model('app', 'RegistroAsistencia')
+    primeros = (
+        RegistroAsistencia.objects
+        .filter(tipo__nombre_asistencia__in=TIPOS_UNICOS)
+        .values('empleado', 'tipo', 'fecha_registro')
+        .annotate(primero=Min('id_registro'))
+        .values_list('primero', flat=True)
+    )
+    RegistroAsistencia.objects.filter(id_registro__in=list(primeros)).update(tipo_unico=True)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_remove_empleado_contrato_remove_empleado_dni'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroasistencia',
+            name='tipo_unico',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(marcar_tipos_unicos, noop),
+        migrations.AddConstraint(
+            model_name='registroasistencia',
+            constraint=models.UniqueConstraint(condition=models.Q(('tipo_unico', True)), fields=('empleado', 'tipo', 'fecha_registro'), name='uniq_registro_tipo_unico_por_dia'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_registroasistencia_tipo_unico'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registroasistencia',
+            index=models.Index(fields=['empleado', 'tipo', 'fecha_registro'], name='idx_registro_emp_tipo_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='registroasistencia',
+            index=models.Index(fields=['empleado', 'fecha_registro', 'hora_registro'], name='idx_registro_emp_fecha_hora'),
+        ),
+        migrations.AddIndex(
+            model_name='registroasistencia',
+            index=models.Index(fields=['fecha_registro', 'hora_registro'], name='idx_registro_fecha_hora'),
+        ),
+    ]
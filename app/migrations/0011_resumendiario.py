@@ -0,0 +1,111 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+# Copia congelada de ReporteService.consulta_resumen / campos_resumen al crear esta migración:
+# la migración no debe cambiar si el servicio evoluciona
+TIPOS_RESUMEN = {
+    'entrada': "Entrada",
+    'salida': "Salida",
+    'ini_almuerzo': "Inicio Almuerzo",
+    'fin_almuerzo': "Fin Almuerzo",
+    'sal_comision': "Salida por comisión",
+    'ent_comision': "Entrada por comisión",
+    'sal_otros': "Salida por otros",
+    'ent_otros': "Entrada por otros",
+}
+
+
+def _primera_hora(ids_tipo):
+    if not ids_tipo:
+        return models.Min(models.Value(None, output_field=models.TimeField()))
+    return models.Min('hora_registro', filter=models.Q(tipo_id__in=ids_tipo))
+
+
+def _diferencia(inicio, fin):
+    return models.ExpressionWrapper(models.F(fin) - models.F(inicio), output_field=models.DurationField())
+
+
+def _segundos(td):
+    return int(td.total_seconds()) if td is not None else 0
+
+
+def poblar_resumen(apps, schema_editor):
+    """Calcula el resumen de todo el historial existente."""
+    RegistroAsistencia = apps.get_model('app', 'RegistroAsistencia')
+    TipoAsistencia = apps.get_model('app', 'TipoAsistencia')
+    ResumenDiario = apps.get_model('app', 'ResumenDiario')
+    ids_por_nombre = defaultdict(list)
+    for id_tipo, nombre in TipoAsistencia.objects.values_list('id_tipo', 'nombre_asistencia'):
+        ids_por_nombre[nombre.lower()].append(id_tipo)
+    primeras = {
+        clave: _primera_hora(ids_por_nombre.get(nombre.lower()))
+        for clave, nombre in TIPOS_RESUMEN.items()
+    }
+    cero = models.Value(timedelta(), output_field=models.DurationField())
+    consulta = RegistroAsistencia.objects.values('empleado_id', 'fecha_registro') \
+        .annotate(**primeras) \
+        .annotate(
+            almuerzo=_diferencia('ini_almuerzo', 'fin_almuerzo'),
+            comision=_diferencia('sal_comision', 'ent_comision'),
+            permiso=_diferencia('sal_otros', 'ent_otros'),
+        ) \
+        .annotate(
+            trabajadas=models.ExpressionWrapper(
+                _diferencia('entrada', 'salida') - Coalesce('almuerzo', cero) - Coalesce('permiso', cero),
+                output_field=models.DurationField(),
+            )
+        ) \
+        .order_by('empleado_id', 'fecha_registro')
+    lote = []
+    for fila in consulta.iterator(chunk_size=1000):
+        lote.append(ResumenDiario(
+            empleado_id=fila['empleado_id'],
+            fecha=fila['fecha_registro'],
+            entrada=fila['entrada'],
+            salida=fila['salida'],
+            almuerzo_segundos=_segundos(fila['almuerzo']),
+            comision_segundos=_segundos(fila['comision']),
+            permiso_segundos=_segundos(fila['permiso']),
+            trabajadas_segundos=_segundos(fila['trabajadas']),
+        ))
+        if len(lote) >= 1000:
+            ResumenDiario.objects.bulk_create(lote)
+            lote = []
+    ResumenDiario.objects.bulk_create(lote)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_registroasistencia_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('entrada', models.TimeField(blank=True, null=True)),
+                ('salida', models.TimeField(blank=True, null=True)),
+                ('almuerzo_segundos', models.IntegerField(default=0)),
+                ('comision_segundos', models.IntegerField(default=0)),
+                ('permiso_segundos', models.IntegerField(default=0)),
+                ('trabajadas_segundos', models.IntegerField(default=0)),
+                ('empleado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.empleado')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha', 'empleado'], name='idx_resumen_fecha_emp')],
+                'constraints': [models.UniqueConstraint(fields=('empleado', 'fecha'), name='uniq_resumen_empleado_fecha')],
+            },
+        ),
+        migrations.RunPython(poblar_resumen, noop),
+    ]
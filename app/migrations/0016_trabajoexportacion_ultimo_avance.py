@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_registroasistencia_actualizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoexportacion',
+            name='ultimo_avance',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
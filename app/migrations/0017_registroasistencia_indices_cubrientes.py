@@ -0,0 +1,44 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    - idx_registro_emp_tipo_fecha repetía las columnas de uniq_registro_tipo_unico_por_dia,
+      que ya sirve a la búsqueda de duplicados de tipos únicos.
+    - El índice de la FK empleado sobra: idx_registro_emp_fecha_hora empieza por empleado.
+    - Los índices restantes se recrean con columnas include para que PostgreSQL resuelva el
+      resumen y la exportación leyendo solo el índice (SQLite ignora include).
+    """
+
+    dependencies = [
+        ('app', '0016_trabajoexportacion_ultimo_avance'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='registroasistencia',
+            name='idx_registro_emp_tipo_fecha',
+        ),
+        migrations.RemoveIndex(
+            model_name='registroasistencia',
+            name='idx_registro_emp_fecha_hora',
+        ),
+        migrations.RemoveIndex(
+            model_name='registroasistencia',
+            name='idx_registro_fecha_hora',
+        ),
+        migrations.AlterField(
+            model_name='registroasistencia',
+            name='empleado',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app.empleado'),
+        ),
+        migrations.AddIndex(
+            model_name='registroasistencia',
+            index=models.Index(fields=['empleado', 'fecha_registro', 'hora_registro'], include=('tipo',), name='idx_registro_emp_fecha_hora'),
+        ),
+        migrations.AddIndex(
+            model_name='registroasistencia',
+            index=models.Index(fields=['fecha_registro', 'hora_registro'], include=('empleado', 'tipo', 'descripcion', 'fingerprint'), name='idx_registro_fecha_hora'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+import os
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def eliminar_trabajos_sin_usuario(apps, schema_editor):
+    # Nadie podría consultarlos ni descargarlos; los trabajos son temporales (EXPORT_JOBS_RETENCION_HORAS)
+    TrabajoExportacion = apps.get_model('app', 'TrabajoExportacion')
+    sin_usuario = TrabajoExportacion.objects.filter(usuario__isnull=True)
+    for archivo in sin_usuario.exclude(archivo='').values_list('archivo', flat=True):
+        try:
+            os.remove(archivo)
+        except FileNotFoundError:
+            pass
+    sin_usuario.delete()
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_registroasistencia_indices_cubrientes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_trabajos_sin_usuario, noop),
+        migrations.AlterField(
+            model_name='trabajoexportacion',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,6 +1,72 @@
+import time
+import uuid
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from datetime import date
+from .cache_local import CacheLRU
+from . import tokens_qr
+
+
+# Tipos de asistencia que solo pueden registrarse una vez por día
+TIPOS_UNICOS = ('Entrada', 'Inicio Almuerzo', 'Fin Almuerzo', 'Salida')
+
+# Tipos de asistencia que requieren descripción adicional
+TIPOS_CON_DESCRIPCION = ('Entrada por otros', 'Salida por otros')
+
+# Caché codigo_qr o ID de empleado (tokens firmados) -> Empleado (None = código inválido)
+_cache_codigo_qr = CacheLRU(
+    maxsize=getattr(settings, 'QR_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'QR_CACHE_TTL', 300),
+    ttl_negativo=getattr(settings, 'QR_CACHE_NEGATIVE_TTL', 10),
+)
+
+# Versiones compartidas leídas por este worker y cuándo volver a leerlas (ver VersionCompartida)
+_versiones = {'valores': {}, 'vence': 0.0}
+
+
+class VersionCompartida(models.Model):
+    """
+    Contador de versión compartido por todos los workers, para invalidar las cachés en memoria.
+    Quien modifica los datos llama a incrementar(); cada worker relee todas las versiones
+    (una sola consulta) como máximo cada VERSIONES_INTERVALO segundos, así que un cambio
+    tarda a lo sumo ese tiempo en verse en los demás workers.
+    """
+    clave = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.clave} v{self.version}"
+
+    @classmethod
+    def actual(cls, clave):
+        """
+        Retorna la versión vigente de una clave (0 si nunca se incrementó).
+        """
+        if time.monotonic() >= _versiones['vence']:
+            cls._recordar(cls.objects.values_list('clave', 'version'))
+        return _versiones['valores'].get(clave, 0)
+
+    @classmethod
+    async def aactual(cls, clave):
+        """Versión asíncrona de actual()."""
+        if time.monotonic() >= _versiones['vence']:
+            cls._recordar([fila async for fila in cls.objects.values_list('clave', 'version')])
+        return _versiones['valores'].get(clave, 0)
+
+    @staticmethod
+    def _recordar(filas):
+        _versiones['valores'] = dict(filas)
+        _versiones['vence'] = time.monotonic() + getattr(settings, 'VERSIONES_INTERVALO', 2)
+
+    @classmethod
+    def incrementar(cls, clave):
+        """Avisa a todos los workers que los datos de la clave cambiaron."""
+        cls.objects.get_or_create(clave=clave)
+        cls.objects.filter(clave=clave).update(version=models.F('version') + 1)
+        # Este worker ve el cambio en su siguiente acceso
+        _versiones['vence'] = 0.0
+
 
 class Empleado(models.Model):
     id_empleado = models.AutoField(primary_key=True)
@@ -45,29 +111,221 @@ class Empleado(models.Model):
             str: Código QR generado
         """
         if not self.codigo_qr:
-            import uuid
-            # Generar código único basado en ID y timestamp
-            codigo = f"EMP{self.id_empleado}{uuid.uuid4().hex[:8].upper()}"
+            codigo = Empleado.nuevo_codigo_qr(self.id_empleado)
             self.codigo_qr = codigo
             self.save()
+            Empleado.invalidar_cache_qr(codigo)
         return self.codigo_qr
+
+    def revocar_codigo_qr(self):
+        """
+        Reemplaza el código QR del empleado: dejan de valer su codigo_qr anterior y
+        los tokens firmados emitidos con él (credencial perdida), sin afectar al resto.
+
+        Returns:
+            str: Nuevo código QR
+        """
+        self.codigo_qr = Empleado.nuevo_codigo_qr(self.id_empleado)
+        # post_save vacía la caché de códigos QR en todos los workers
+        self.save()
+        return self.codigo_qr
+
+    @staticmethod
+    def nuevo_codigo_qr(id_empleado):
+        """Código único basado en el ID y un sufijo aleatorio."""
+        return f"EMP{id_empleado}{uuid.uuid4().hex[:8].upper()}"
+
+    VERSION_CACHE_QR = 'codigos_qr'
+
+    @classmethod
+    def _cache_qr(cls):
+        """Caché de códigos QR, vaciada si otro worker modificó empleados o códigos."""
+        _cache_codigo_qr.sincronizar(VersionCompartida.actual(cls.VERSION_CACHE_QR))
+        return _cache_codigo_qr
+
+    @classmethod
+    async def _acache_qr(cls):
+        _cache_codigo_qr.sincronizar(await VersionCompartida.aactual(cls.VERSION_CACHE_QR))
+        return _cache_codigo_qr
     
     @classmethod
     def buscar_por_codigo_qr(cls, codigo):
         """
-        Busca un empleado por su código QR.
+        Busca un empleado por su código QR usando la caché en memoria.
+        Los códigos inválidos (lecturas erróneas de cámara) se cachean por poco tiempo.
+        La firma de los tokens (tokens_qr) se verifica sin consultar la base de datos:
+        si no es válida se rechazan y, si lo es, el empleado se busca por ID en la misma
+        caché (un fallo de caché cuesta una consulta por clave primaria) y su sello debe
+        coincidir con el codigo_qr vigente.
         
         Args:
-            codigo: Código QR a buscar
+            codigo: Código QR o token firmado
             
         Returns:
             Empleado o None si no se encuentra
         """
+        if not isinstance(codigo, str):
+            return None
+        if tokens_qr.es_token(codigo):
+            token = tokens_qr.verificar(codigo)
+            if token is None:
+                return None
+            return cls._vigente(cls._cache_qr().obtener(token[0], cls._consultar_por_id), token)
+        return cls._cache_qr().obtener(codigo, cls._consultar_por_codigo_qr)
+
+    @classmethod
+    async def abuscar_por_codigo_qr(cls, codigo):
+        """Versión asíncrona de buscar_por_codigo_qr (comparte la misma caché)."""
+        if not isinstance(codigo, str):
+            return None
+        cache = await cls._acache_qr()
+        if tokens_qr.es_token(codigo):
+            token = tokens_qr.verificar(codigo)
+            if token is None:
+                return None
+            return cls._vigente(await cache.aobtener(token[0], cls._aconsultar_por_id), token)
+        return await cache.aobtener(codigo, cls._aconsultar_por_codigo_qr)
+
+    @classmethod
+    def buscar_varios_por_codigo_qr(cls, codigos):
+        """
+        Versión por lotes de buscar_por_codigo_qr (comparte la misma caché).
+        Los códigos que no están en caché se resuelven con una sola consulta.
+
+        Args:
+            codigos: Códigos QR o tokens firmados (sin duplicados)
+
+        Returns:
+            dict: código -> Empleado o None si no se encuentra
+        """
+        resultado, tokens = cls._verificar_tokens(codigos)
+        claves = cls._claves_cache(tokens)
+        encontrados = cls._cache_qr().obtener_varios(list(dict.fromkeys(claves.values())), cls._consultar_por_claves)
+        resultado.update(cls._resolver_tokens(tokens, claves, encontrados))
+        return {codigo: resultado[codigo] for codigo in codigos}
+
+    @classmethod
+    async def abuscar_varios_por_codigo_qr(cls, codigos):
+        """Versión asíncrona de buscar_varios_por_codigo_qr (comparte la misma caché)."""
+        resultado, tokens = cls._verificar_tokens(codigos)
+        claves = cls._claves_cache(tokens)
+        cache = await cls._acache_qr()
+        encontrados = await cache.aobtener_varios(list(dict.fromkeys(claves.values())), cls._aconsultar_por_claves)
+        resultado.update(cls._resolver_tokens(tokens, claves, encontrados))
+        return {codigo: resultado[codigo] for codigo in codigos}
+
+    @staticmethod
+    def _verificar_tokens(codigos):
+        """
+        Descarta los tokens con firma inválida sin consultar la base de datos.
+
+        Returns:
+            tuple: (dict de códigos rechazados -> None,
+            dict código -> (ID, sello) del token o None si es codigo_qr)
+        """
+        rechazados, tokens = {}, {}
+        for codigo in codigos:
+            if not tokens_qr.es_token(codigo):
+                tokens[codigo] = None
+                continue
+            token = tokens_qr.verificar(codigo)
+            if token is None:
+                rechazados[codigo] = None
+            else:
+                tokens[codigo] = token
+        return rechazados, tokens
+
+    @staticmethod
+    def _claves_cache(tokens):
+        """Clave de caché de cada código: el ID del empleado para los tokens, el código si no."""
+        return {codigo: codigo if token is None else token[0] for codigo, token in tokens.items()}
+
+    @staticmethod
+    def _resolver_tokens(tokens, claves, encontrados):
+        return {
+            codigo: Empleado._vigente(encontrados[claves[codigo]], token) if token else encontrados[claves[codigo]]
+            for codigo, token in tokens.items()
+        }
+
+    @staticmethod
+    def _vigente(empleado, token):
+        """Retorna el empleado si el sello del token corresponde a su codigo_qr actual."""
+        if empleado is None or not empleado.codigo_qr or tokens_qr.sello(empleado.codigo_qr) != token[1]:
+            return None
+        return empleado
+
+    @staticmethod
+    def _filtro_claves(claves):
+        return (
+            models.Q(codigo_qr__in=[clave for clave in claves if isinstance(clave, str)])
+            | models.Q(id_empleado__in=[clave for clave in claves if isinstance(clave, int)])
+        )
+
+    @staticmethod
+    def _mapear_claves(claves, empleados):
+        # Los codigo_qr siempre son texto, así que no chocan con los IDs
+        por_clave = {}
+        for empleado in empleados:
+            por_clave[empleado.id_empleado] = empleado
+            if empleado.codigo_qr:
+                por_clave[empleado.codigo_qr] = empleado
+        return {clave: por_clave.get(clave) for clave in claves}
+
+    @classmethod
+    def _consultar_por_claves(cls, claves):
+        return cls._mapear_claves(claves, cls.objects.filter(cls._filtro_claves(claves)))
+
+    @classmethod
+    async def _aconsultar_por_claves(cls, claves):
+        empleados = [empleado async for empleado in cls.objects.filter(cls._filtro_claves(claves))]
+        return cls._mapear_claves(claves, empleados)
+
+    @classmethod
+    def _consultar_por_id(cls, id_empleado):
+        return cls.objects.filter(id_empleado=id_empleado).first()
+
+    @classmethod
+    async def _aconsultar_por_id(cls, id_empleado):
+        return await cls.objects.filter(id_empleado=id_empleado).afirst()
+
+    @classmethod
+    def _consultar_por_codigo_qr(cls, codigo):
         try:
             return cls.objects.get(codigo_qr=codigo)
         except cls.DoesNotExist:
             return None
 
+    @classmethod
+    async def _aconsultar_por_codigo_qr(cls, codigo):
+        try:
+            return await cls.objects.aget(codigo_qr=codigo)
+        except cls.DoesNotExist:
+            return None
+
+    @classmethod
+    def invalidar_cache_qr(cls, codigo=None):
+        """
+        Invalida un código QR en la caché, o la caché completa si no se indica.
+        Los demás workers vacían su caché en a lo sumo VERSIONES_INTERVALO segundos.
+        """
+        if codigo is None:
+            _cache_codigo_qr.limpiar()
+        else:
+            _cache_codigo_qr.invalidar(codigo)
+        VersionCompartida.incrementar(cls.VERSION_CACHE_QR)
+
+    @staticmethod
+    def estadisticas_cache_qr():
+        """Retorna hits/misses de la caché de códigos QR."""
+        return _cache_codigo_qr.estadisticas()
+
+# Caché fingerprint -> Empleado (None = dispositivo no vinculado)
+_cache_fingerprint = CacheLRU(
+    maxsize=getattr(settings, 'FINGERPRINT_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'FINGERPRINT_CACHE_TTL', 300),
+    ttl_negativo=getattr(settings, 'FINGERPRINT_CACHE_NEGATIVE_TTL', 30),
+)
+
 class DispositivoEmpleado(models.Model):
     """Vincula un dispositivo (fingerprint) con un empleado para auto-identificación."""
     empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE)
@@ -77,14 +335,92 @@ class DispositivoEmpleado(models.Model):
     def __str__(self):
         return f"{self.empleado.nombre_completo} - {self.fingerprint}"
 
+    VERSION_CACHE = 'fingerprints'
+
+    @classmethod
+    def _cache(cls):
+        """Caché de fingerprints, vaciada si otro worker modificó vínculos o empleados."""
+        _cache_fingerprint.sincronizar(VersionCompartida.actual(cls.VERSION_CACHE))
+        return _cache_fingerprint
+
+    @classmethod
+    async def _acache(cls):
+        _cache_fingerprint.sincronizar(await VersionCompartida.aactual(cls.VERSION_CACHE))
+        return _cache_fingerprint
+
     @classmethod
     def obtener_empleado_por_fingerprint(cls, fp):
+        """
+        Retorna el empleado vinculado al fingerprint, usando la caché en memoria.
+        Los dispositivos no vinculados también se cachean (por menos tiempo).
+        """
+        return cls._cache().obtener(fp, cls._consultar_empleado_por_fingerprint)
+
+    @classmethod
+    async def aobtener_empleado_por_fingerprint(cls, fp):
+        """Versión asíncrona de obtener_empleado_por_fingerprint (comparte la misma caché)."""
+        return await (await cls._acache()).aobtener(fp, cls._aconsultar_empleado_por_fingerprint)
+
+    @classmethod
+    def obtener_empleados_por_fingerprint(cls, fps):
+        """
+        Versión por lotes de obtener_empleado_por_fingerprint (comparte la misma caché).
+        Los fingerprints que no están en caché se resuelven con una sola consulta.
+
+        Returns:
+            dict: fingerprint -> Empleado o None si no está vinculado
+        """
+        return cls._cache().obtener_varios(fps, cls._consultar_empleados_por_fingerprint)
+
+    @classmethod
+    async def aobtener_empleados_por_fingerprint(cls, fps):
+        """Versión asíncrona de obtener_empleados_por_fingerprint (comparte la misma caché)."""
+        return await (await cls._acache()).aobtener_varios(fps, cls._aconsultar_empleados_por_fingerprint)
+
+    @classmethod
+    def _consultar_empleados_por_fingerprint(cls, fps):
+        vinculos = cls.objects.select_related('empleado').filter(fingerprint__in=fps)
+        return {vinculo.fingerprint: vinculo.empleado for vinculo in vinculos}
+
+    @classmethod
+    async def _aconsultar_empleados_por_fingerprint(cls, fps):
+        vinculos = cls.objects.select_related('empleado').filter(fingerprint__in=fps)
+        return {vinculo.fingerprint: vinculo.empleado async for vinculo in vinculos}
+
+    @classmethod
+    def _consultar_empleado_por_fingerprint(cls, fp):
         try:
             vinculo = cls.objects.select_related('empleado').get(fingerprint=fp)
             return vinculo.empleado
         except cls.DoesNotExist:
             return None
 
+    @classmethod
+    async def _aconsultar_empleado_por_fingerprint(cls, fp):
+        try:
+            vinculo = await cls.objects.select_related('empleado').aget(fingerprint=fp)
+            return vinculo.empleado
+        except cls.DoesNotExist:
+            return None
+
+    @classmethod
+    def invalidar_cache_fingerprint(cls, fp=None):
+        """
+        Invalida un fingerprint en la caché, o la caché completa si no se indica.
+        Los demás workers vacían su caché en a lo sumo VERSIONES_INTERVALO segundos.
+        Los vínculos guardados o eliminados con el ORM ya la llaman desde signals.py.
+        """
+        if fp is None:
+            _cache_fingerprint.limpiar()
+        else:
+            _cache_fingerprint.invalidar(fp)
+        VersionCompartida.incrementar(cls.VERSION_CACHE)
+
+    @staticmethod
+    def estadisticas_cache():
+        """Retorna hits/misses de la caché de fingerprints."""
+        return _cache_fingerprint.estadisticas()
+
 class TipoAsistencia(models.Model):
     id_tipo = models.AutoField(primary_key=True)
     nombre_asistencia = models.CharField(max_length=50, unique=True)
@@ -100,8 +436,7 @@ class TipoAsistencia(models.Model):
         Returns:
             bool: True si es un tipo único
         """
-        tipos_unicos = ['Entrada', 'Inicio Almuerzo', 'Fin Almuerzo', 'Salida']
-        return self.nombre_asistencia in tipos_unicos
+        return self.nombre_asistencia in TIPOS_UNICOS
     
     @property
     def requiere_descripcion(self):
@@ -111,20 +446,63 @@ class TipoAsistencia(models.Model):
         Returns:
             bool: True si requiere descripción
         """
-        tipos_con_descripcion = ['Entrada por otros', 'Salida por otros']
-        return self.nombre_asistencia in tipos_con_descripcion
+        return self.nombre_asistencia in TIPOS_CON_DESCRIPCION
 
 class RegistroAsistencia(models.Model):
     id_registro = models.AutoField(primary_key=True)
-    empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE)
+    # Sin índice propio: idx_registro_emp_fecha_hora empieza por empleado y sirve a la FK
+    empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE, db_index=False)
     tipo = models.ForeignKey(TipoAsistencia, on_delete=models.CASCADE)
     fecha_registro = models.DateField()
     hora_registro = models.TimeField()
     descripcion = models.CharField(max_length=50, blank=True, null=True)   
     fingerprint = models.CharField(max_length=100, blank=True, null=True) # FingerprintJS ID del dispositivo
+    # Copia de TipoAsistencia.es_tipo_unico; permite que la BD garantice un solo registro por día
+    tipo_unico = models.BooleanField(default=False, editable=False)
+    # Última creación o edición hecha con el ORM (marca de agua de cache_exportaciones)
+    actualizado = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["empleado", "tipo", "fecha_registro"],
+                condition=models.Q(tipo_unico=True),
+                name="uniq_registro_tipo_unico_por_dia",
+            )
+        ]
+        # Índices alineados con las consultas frecuentes (ver comando verificar_indices).
+        # Los duplicados de tipos únicos usan el índice de uniq_registro_tipo_unico_por_dia.
+        # Las columnas include solo las usa PostgreSQL (lectura solo del índice); SQLite las ignora.
+        indexes = [
+            # Resumen diario, Empleado.tiene_registro_hoy y registros de un empleado por fecha,
+            # ya ordenados por hora
+            models.Index(
+                fields=["empleado", "fecha_registro", "hora_registro"], include=["tipo"],
+                name="idx_registro_emp_fecha_hora",
+            ),
+            # Registros de hoy y exportación ordenada por fecha/hora descendente
+            models.Index(
+                fields=["fecha_registro", "hora_registro"],
+                include=["empleado", "tipo", "descripcion", "fingerprint"],
+                name="idx_registro_fecha_hora",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.empleado} - {self.tipo.nombre_asistencia} - {self.fecha_registro} {self.hora_registro}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        registro = super().from_db(db, field_names, values)
+        # Empleado y día leídos, para recalcular también el resumen anterior si se editan
+        registro._dia_original = (registro.__dict__.get('empleado_id'), registro.__dict__.get('fecha_registro'))
+        return registro
+
+    def save(self, *args, **kwargs):
+        from .catalogo import CatalogoTipos
+        self.tipo_unico = CatalogoTipos.es_tipo_unico(self.tipo_id)
+        super().save(*args, **kwargs)
+        self._dia_original = (self.empleado_id, self.fecha_registro)
     
     @property
     def fecha_hora_completa(self):
@@ -163,6 +541,74 @@ class RegistroAsistencia(models.Model):
             fecha_registro=fecha
         ).select_related('tipo').order_by('hora_registro')
 
+class ResumenDiario(models.Model):
+    """
+    Resumen materializado de un empleado en un día, con lo que muestra el Excel de resumen.
+    Se actualiza tras el COMMIT de cada alta, edición o baja de registros de asistencia
+    (señales de RegistroAsistencia y ReporteService.actualizar_resumen_diario) y se recalcula desde
+    RegistroAsistencia con `python manage.py reconstruir_resumen` (necesario tras update() o SQL directo).
+    """
+    empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE)
+    fecha = models.DateField()
+    entrada = models.TimeField(blank=True, null=True)  # Primera "Entrada" del día
+    salida = models.TimeField(blank=True, null=True)  # Primera "Salida" del día
+    almuerzo_segundos = models.IntegerField(default=0)
+    comision_segundos = models.IntegerField(default=0)
+    permiso_segundos = models.IntegerField(default=0)
+    trabajadas_segundos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["empleado", "fecha"], name="uniq_resumen_empleado_fecha")
+        ]
+        indexes = [
+            # Exportación filtrada por rango de fechas
+            models.Index(fields=["fecha", "empleado"], name="idx_resumen_fecha_emp"),
+        ]
+
+    def __str__(self):
+        return f"{self.empleado} - {self.fecha}"
+
+class TrabajoExportacion(models.Model):
+    """Exportación a Excel generada en segundo plano (ver exportaciones.py)."""
+    PENDIENTE = 'pendiente'
+    EN_PROCESO = 'en_proceso'
+    TERMINADO = 'terminado'
+    ERROR = 'error'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_PROCESO, 'En proceso'),
+        (TERMINADO, 'Terminado'),
+        (ERROR, 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tipo = models.CharField(max_length=20)  # Clave de exportaciones.REPORTES
+    filtros = models.JSONField(default=dict)
+    formato = models.CharField(max_length=10, default='xlsx')  # Clave de exportaciones.FORMATOS
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    filas_procesadas = models.IntegerField(default=0)
+    filas_totales = models.IntegerField(default=0)
+    nombre_archivo = models.CharField(max_length=150)
+    archivo = models.CharField(max_length=255, blank=True)  # Ruta local del archivo generado
+    error = models.CharField(max_length=500, blank=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  # Solo él consulta y descarga el trabajo
+    creado = models.DateTimeField(auto_now_add=True)
+    ultimo_avance = models.DateTimeField(blank=True, null=True)  # Inicio o último avance (detecta trabajos huérfanos)
+    terminado = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.tipo} - {self.estado} - {self.creado:%Y-%m-%d %H:%M}"
+
+    @property
+    def porcentaje(self):
+        """Avance de 0 a 100 según las filas procesadas."""
+        if self.estado == self.TERMINADO:
+            return 100
+        if not self.filas_totales:
+            return 0
+        return min(99, int(self.filas_procesadas * 100 / self.filas_totales))
+
 class ActividadProyecto(models.Model):
     """Registro local de proyecto y actividad declarada por el empleado. Solo una vez por día (al registrar Entrada)."""
     empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE)
@@ -0,0 +1,104 @@
+"""
+Dibujo de los códigos QR de los empleados.
+Solo depende de qrcode, por lo que puede ejecutarse en otros procesos
+(ProcessPoolExecutor) sin cargar Django.
+"""
+
+import hashlib
+import io
+import json
+from functools import lru_cache
+import qrcode
+from qrcode.image.svg import SvgPathImage
+
+# Parámetros con los que se dibujan los QR de los empleados
+PARAMETROS_QR = {
+    'version': 1,
+    'error_correction': qrcode.constants.ERROR_CORRECT_L,
+    'box_size': 10,
+    'border': 4,
+    'fill_color': "black",
+    'back_color': "white",
+}
+
+# Matrices recordadas por proceso: las hojas de credenciales y las reimpresiones
+# vuelven a dibujar los mismos códigos (~10 KB por matriz)
+MATRIZ_CACHE_SIZE = 1024
+
+
+def huella(datos, parametros=PARAMETROS_QR):
+    """
+    Hash del contenido de un QR (datos codificados + parámetros de dibujo).
+    Si no cambia, la imagen ya generada sigue siendo válida.
+    """
+    contenido = json.dumps([datos, parametros], sort_keys=True)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _crear_qr(datos, parametros):
+    qr = qrcode.QRCode(
+        version=parametros['version'],
+        error_correction=parametros['error_correction'],
+        box_size=parametros['box_size'],
+        border=parametros['border'],
+    )
+    qr.add_data(datos)
+    qr.make(fit=True)
+    return qr
+
+
+def matriz(datos, parametros=PARAMETROS_QR):
+    """
+    Módulos del QR (incluido el borde) para dibujarlo directamente sobre otra imagen.
+
+    Se calcula una sola vez por (datos, parámetros) en cada proceso.
+
+    Returns:
+        tuple: Filas de booleanos (True = módulo negro); inmutables porque se comparten
+    """
+    return _matriz(datos, json.dumps(parametros, sort_keys=True))
+
+
+@lru_cache(maxsize=MATRIZ_CACHE_SIZE)
+def _matriz(datos, parametros_json):
+    parametros = json.loads(parametros_json)
+    return tuple(tuple(fila) for fila in _crear_qr(datos, parametros).get_matrix())
+
+
+def renderizar(datos, formato='png', parametros=PARAMETROS_QR):
+    """
+    Dibuja un QR en memoria.
+
+    Args:
+        datos: Texto a codificar (URL del formulario)
+        formato: 'png' o 'svg' (el SVG es vectorial, en negro sobre fondo transparente)
+        parametros: Parámetros de dibujo (ver PARAMETROS_QR)
+
+    Returns:
+        bytes: La imagen
+    """
+    qr = _crear_qr(datos, parametros)
+    if formato == 'svg':
+        img = qr.make_image(image_factory=SvgPathImage)
+    else:
+        img = qr.make_image(fill_color=parametros['fill_color'], back_color=parametros['back_color'])
+    salida = io.BytesIO()
+    img.save(salida)
+    return salida.getvalue()
+
+
+def guardar_png(datos, ruta, parametros=PARAMETROS_QR):
+    """
+    Dibuja un QR y lo guarda como PNG.
+
+    Args:
+        datos: Texto a codificar (URL del formulario)
+        ruta: Archivo destino
+        parametros: Parámetros de dibujo (ver PARAMETROS_QR)
+
+    Returns:
+        str: Ruta del archivo generado
+    """
+    with open(ruta, 'wb') as archivo:
+        archivo.write(renderizar(datos, 'png', parametros))
+    return ruta
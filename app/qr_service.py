@@ -3,15 +3,40 @@ Servicio para manejar el sistema de códigos QR.
 Permite identificación automática de empleados mediante QR.
 """
 
-import qrcode
+import json
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from django.conf import settings
 from django.http import JsonResponse
-from .models import Empleado
+from django.db.models import Q
+from .cache_local import CacheLRU
+from .credenciales import generar_pdf
+from .models import Empleado, DispositivoEmpleado
+from .qr_render import guardar_png, huella, renderizar
+from . import tokens_qr
+
+# Archivo (dentro de qr_codes) con el hash de contenido de cada imagen generada
+MANIFIESTO_QR = '.manifiesto.json'
+
+# Caché (url, formato) -> bytes de la imagen; la clave incluye el código, así que no requiere invalidación
+_cache_imagenes_qr = CacheLRU(
+    maxsize=getattr(settings, 'QR_IMAGEN_CACHE_SIZE', 512),
+    ttl=getattr(settings, 'QR_IMAGEN_CACHE_TTL', 86400),
+)
 
 
 class QRService:
     """Servicio para manejar códigos QR de empleados."""
+
+    # Formato -> content type de imagen_qr_empleado
+    FORMATOS_IMAGEN = {
+        'png': 'image/png',
+        'svg': 'image/svg+xml',
+    }
+
+    # Máximo de códigos o fingerprints por identificación en lote
+    LOTE_MAX_IDENTIFICACIONES = 200
     
     @staticmethod
     def generar_qr_empleado(empleado):
@@ -26,58 +51,179 @@ class QRService:
         """
         # Generar código QR si no existe
         codigo_qr = empleado.generar_codigo_qr()
-        
-        # URL que se codificará en el QR
-        base_url = os.getenv("APP_URL", "http://127.0.0.1:8000")
-        qr_url = f"{base_url}/qr/{codigo_qr}/"
-        
-        # Crear directorio si no existe
-        qr_dir = os.path.join(settings.BASE_DIR, 'qr_codes')
-        os.makedirs(qr_dir, exist_ok=True)
-        
-        # Generar QR
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
+        filepath = os.path.join(
+            QRService._directorio_qr(), QRService._nombre_archivo(empleado.id_empleado, codigo_qr)
         )
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        
-        # Crear imagen
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Guardar archivo
-        filename = f"qr_{empleado.id_empleado}_{codigo_qr}.png"
-        filepath = os.path.join(qr_dir, filename)
-        img.save(filepath)
-        
-        return filepath
+        return guardar_png(QRService._url_qr(empleado), filepath)
     
     @staticmethod
-    def generar_qr_todos_empleados():
+    def imagen_qr_empleado(empleado, formato='png'):
+        """
+        Imagen del QR de un empleado dibujada en memoria, sin escribir en disco.
+        Las imágenes ya dibujadas se reutilizan desde una caché LRU del proceso.
+
+        Args:
+            empleado: Instancia de Empleado con codigo_qr (no se asigna aquí)
+            formato: Clave de FORMATOS_IMAGEN
+
+        Returns:
+            bytes: La imagen
+
+        Raises:
+            ValueError: Si el empleado no tiene codigo_qr
+        """
+        qr_url = QRService.url_qr_asignado(empleado)
+        if qr_url is None:
+            raise ValueError("El empleado no tiene código QR asignado")
+        return _cache_imagenes_qr.obtener((qr_url, formato), lambda clave: renderizar(*clave))
+
+    @staticmethod
+    def version_imagen_qr(qr_url, formato):
+        """Versión de una imagen QR: cambia con la URL codificada, el formato o los parámetros de dibujo."""
+        return huella([qr_url, formato])[:32]
+
+    @staticmethod
+    def generar_qr_todos_empleados(procesos=None):
         """
         Genera códigos QR para todos los empleados.
+        Los códigos faltantes se asignan con un solo bulk_update; las imágenes cuyo
+        contenido (URL + parámetros de dibujo) no cambió desde la última ejecución
+        se reutilizan y el resto se dibuja en un pool de procesos.
+        
+        Args:
+            procesos: Procesos para dibujar (por defecto settings.QR_PROCESOS)
         
         Returns:
-            list: Lista de rutas de archivos generados
+            list: Un dict por empleado con empleado, archivo, codigo_qr y
+            generado (False si la imagen existente se reutilizó)
         """
-        empleados = Empleado.objects.all()
+        empleados = list(Empleado.objects.order_by('id_empleado'))
+        QRService._asignar_codigos_faltantes(empleados)
+
+        qr_dir = QRService._directorio_qr()
+        anteriores = QRService._leer_manifiesto(qr_dir)
+        manifiesto = {}
         archivos_generados = []
-        
+        pendientes = []
         for empleado in empleados:
-            try:
-                archivo = QRService.generar_qr_empleado(empleado)
-                archivos_generados.append({
-                    'empleado': empleado,
-                    'archivo': archivo,
-                    'codigo_qr': empleado.codigo_qr
-                })
-            except Exception as e:
-                print(f"Error generando QR para {empleado}: {e}")
-        
-        return archivos_generados
+            nombre = QRService._nombre_archivo(empleado.id_empleado, empleado.codigo_qr)
+            qr_url = QRService._url_qr(empleado)
+            item = {
+                'empleado': empleado,
+                'archivo': os.path.join(qr_dir, nombre),
+                'codigo_qr': empleado.codigo_qr,
+                'generado': False,
+            }
+            contenido = huella(qr_url)
+            if anteriores.get(nombre) == contenido and os.path.exists(item['archivo']):
+                manifiesto[nombre] = contenido
+            else:
+                pendientes.append((item, nombre, contenido, qr_url))
+            archivos_generados.append((nombre, item))
+
+        fallidos = set()
+        for (item, nombre, contenido, _), error in zip(pendientes, QRService._dibujar(pendientes, procesos)):
+            if error:
+                print(f"Error generando QR para {item['empleado']}: {error}")
+                fallidos.add(nombre)
+            else:
+                item['generado'] = True
+                manifiesto[nombre] = contenido
+
+        QRService._guardar_manifiesto(qr_dir, manifiesto)
+        return [item for nombre, item in archivos_generados if nombre not in fallidos]
+
+    @staticmethod
+    def generar_pdf_credenciales(ids_empleado=()):
+        """
+        PDF imprimible con la credencial (QR y nombre) de cada empleado, en una sola pasada.
+        Asigna antes los códigos faltantes; las páginas se envían a medida que se componen.
+
+        Args:
+            ids_empleado: IDs a incluir (vacío = todos los empleados)
+
+        Returns:
+            iterable: Fragmentos de bytes del PDF
+        """
+        empleados = Empleado.objects.order_by('apellidos', 'nombres', 'id_empleado')
+        if ids_empleado:
+            empleados = empleados.filter(id_empleado__in=ids_empleado)
+        QRService._asignar_codigos_faltantes(list(empleados.filter(Q(codigo_qr__isnull=True) | Q(codigo_qr=''))))
+        credenciales = (
+            (empleado.nombre_completo, QRService._url_qr(empleado))
+            for empleado in empleados.iterator(chunk_size=500)
+        )
+        return generar_pdf(credenciales, getattr(settings, 'CREDENCIALES_FUENTE', None))
+
+    @staticmethod
+    def _dibujar(pendientes, procesos=None):
+        """
+        Dibuja los QR pendientes, en un pool de procesos si hay más de uno.
+
+        Returns:
+            list: La excepción de cada QR que falló (None si se generó), en el mismo orden
+        """
+        procesos = min(max(1, procesos or settings.QR_PROCESOS), len(pendientes))
+        if procesos <= 1:
+            errores = []
+            for item, _, _, qr_url in pendientes:
+                try:
+                    guardar_png(qr_url, item['archivo'])
+                    errores.append(None)
+                except Exception as e:
+                    errores.append(e)
+            return errores
+
+        # spawn: los hijos solo importan qrcode, sin heredar conexiones de Django
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futuros = [pool.submit(guardar_png, qr_url, item['archivo']) for item, _, _, qr_url in pendientes]
+            return [futuro.exception() for futuro in futuros]
+
+    @staticmethod
+    def _asignar_codigos_faltantes(empleados):
+        """Asigna código QR a los empleados que no lo tienen, con un solo bulk_update."""
+        sin_codigo = [empleado for empleado in empleados if not empleado.codigo_qr]
+        if not sin_codigo:
+            return
+        for empleado in sin_codigo:
+            empleado.codigo_qr = Empleado.nuevo_codigo_qr(empleado.id_empleado)
+        Empleado.objects.bulk_update(sin_codigo, ['codigo_qr'], batch_size=1000)
+        # bulk_update no emite post_save: se descartan las cachés como en signals.py
+        DispositivoEmpleado.invalidar_cache_fingerprint()
+        Empleado.invalidar_cache_qr()
+
+    @staticmethod
+    def _directorio_qr():
+        qr_dir = os.path.join(settings.BASE_DIR, 'qr_codes')
+        os.makedirs(qr_dir, exist_ok=True)
+        return qr_dir
+
+    @staticmethod
+    def _nombre_archivo(id_empleado, codigo_qr):
+        return f"qr_{id_empleado}_{codigo_qr}.png"
+
+    @staticmethod
+    def _url_qr(empleado):
+        """URL codificada en el QR: con token firmado (QR_TOKENS_FIRMADOS) o con codigo_qr."""
+        base_url = os.getenv("APP_URL", "http://127.0.0.1:8000")
+        codigo = tokens_qr.crear(empleado.id_empleado, empleado.codigo_qr) if tokens_qr.activos() else empleado.codigo_qr
+        return f"{base_url}/qr/{codigo}/"
+
+    @staticmethod
+    def _leer_manifiesto(qr_dir):
+        try:
+            with open(os.path.join(qr_dir, MANIFIESTO_QR), encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _guardar_manifiesto(qr_dir, manifiesto):
+        ruta = os.path.join(qr_dir, MANIFIESTO_QR)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(manifiesto, archivo)
+        os.replace(temporal, ruta)
     
     @staticmethod
     def buscar_empleado_por_qr(codigo_qr):
@@ -92,28 +238,92 @@ class QRService:
         """
         try:
             empleado = Empleado.buscar_por_codigo_qr(codigo_qr)
-            
-            if empleado:
-                return {
-                    'success': True,
-                    'empleado': {
-                        'id': empleado.id_empleado,
-                        'nombres': empleado.nombres,
-                        'apellidos': empleado.apellidos,
-                        'nombre_completo': empleado.nombre_completo
-                    }
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': 'Empleado no encontrado'
-                }
-                
+            return QRService._respuesta_busqueda(empleado)
         except Exception as e:
             return {
                 'success': False,
                 'error': f'Error al buscar empleado: {str(e)}'
             }
+
+    @staticmethod
+    async def abuscar_empleado_por_qr(codigo_qr):
+        """Versión asíncrona de buscar_empleado_por_qr."""
+        try:
+            empleado = await Empleado.abuscar_por_codigo_qr(codigo_qr)
+            return QRService._respuesta_busqueda(empleado)
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Error al buscar empleado: {str(e)}'
+            }
+
+    @staticmethod
+    def validar_lote(valores):
+        """
+        Valida la lista de códigos QR o fingerprints de una identificación en lote.
+
+        Args:
+            valores: Lista recibida en el JSON
+
+        Returns:
+            tuple: (valores sin duplicados en el orden recibido, mensaje de error o None)
+        """
+        if not isinstance(valores, list) or not valores or not all(isinstance(v, str) and v for v in valores):
+            return None, 'Lista de códigos requerida'
+        valores = list(dict.fromkeys(valores))
+        if len(valores) > QRService.LOTE_MAX_IDENTIFICACIONES:
+            return None, f'Máximo {QRService.LOTE_MAX_IDENTIFICACIONES} códigos por envío'
+        return valores, None
+
+    @staticmethod
+    def respuesta_lote(empleados):
+        """
+        Respuesta de una identificación en lote.
+
+        Args:
+            empleados: dict código o fingerprint -> Empleado o None
+
+        Returns:
+            dict: Empleados serializados por clave (None si no se encontró) y cantidad encontrada
+        """
+        return {
+            'success': True,
+            'encontrados': sum(1 for empleado in empleados.values() if empleado),
+            'empleados': {
+                clave: QRService.serializar_empleado(empleado) if empleado else None
+                for clave, empleado in empleados.items()
+            },
+        }
+
+    @staticmethod
+    def serializar_empleado(empleado):
+        """
+        Datos públicos de un empleado para las respuestas JSON.
+
+        Args:
+            empleado: Instancia de Empleado
+
+        Returns:
+            dict: id, nombres, apellidos y nombre completo
+        """
+        return {
+            'id': empleado.id_empleado,
+            'nombres': empleado.nombres,
+            'apellidos': empleado.apellidos,
+            'nombre_completo': empleado.nombre_completo
+        }
+
+    @staticmethod
+    def _respuesta_busqueda(empleado):
+        if empleado:
+            return {
+                'success': True,
+                'empleado': QRService.serializar_empleado(empleado)
+            }
+        return {
+            'success': False,
+            'error': 'Empleado no encontrado'
+        }
     
     @staticmethod
     def obtener_url_qr_empleado(empleado):
@@ -126,6 +336,21 @@ class QRService:
         Returns:
             str: URL del QR
         """
-        codigo_qr = empleado.generar_codigo_qr()
-        base_url = os.getenv("APP_URL", "http://127.0.0.1:8000")
-        return f"{base_url}/qr/{codigo_qr}/"
+        # El token firmado también lo necesita: lleva el sello del codigo_qr
+        empleado.generar_codigo_qr()
+        return QRService._url_qr(empleado)
+
+    @staticmethod
+    def url_qr_asignado(empleado):
+        """
+        URL del QR de un empleado sin asignarle código (para lecturas como GET).
+
+        Args:
+            empleado: Instancia de Empleado
+
+        Returns:
+            str: URL del QR, o None si el empleado aún no tiene codigo_qr
+        """
+        if not empleado.codigo_qr:
+            return None
+        return QRService._url_qr(empleado)
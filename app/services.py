@@ -3,18 +3,32 @@ Servicios de negocio para el sistema de asistencia.
 Contiene la lógica de negocio separada de las vistas.
 """
 
-from datetime import datetime, timedelta
+import hmac
+from datetime import timedelta
 from collections import defaultdict
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import NamedTuple
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.contrib import messages
-from django.db.models import Q
-from .models import Empleado, TipoAsistencia, RegistroAsistencia, DispositivoEmpleado
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F, Count, Max, Min, Sum, Value, DurationField, ExpressionWrapper, TimeField
+from django.db.models.functions import Coalesce, Length, TruncMonth
+from .models import Empleado, TipoAsistencia, RegistroAsistencia, DispositivoEmpleado, ResumenDiario
+from .catalogo import CatalogoTipos
+from . import cache_exportaciones
+from .geocerca import obtener_indice_sedes, geocerca_activa, parsear_coordenadas
 
 
 class AsistenciaService:
     """Servicio para manejar la lógica de negocio de asistencia."""
-    
-    TIPOS_UNICOS = ['Entrada', 'Inicio Almuerzo', 'Fin Almuerzo', 'Salida']
+
+    # Límites para registros enviados en lote
+    LOTE_MAX_ITEMS = 500
+    LOTE_MAX_ANTIGUEDAD = timedelta(days=7)
+    LOTE_TOLERANCIA_RELOJ = timedelta(minutes=5)
 
     @staticmethod
     def _normalize_fingerprint(fingerprint):
@@ -33,17 +47,19 @@ class AsistenciaService:
         
         Args:
             empleado: Instancia de Empleado
-            tipo_asistencia: Instancia de TipoAsistencia
+            tipo_asistencia: Instancia de TipoAsistencia o TipoInfo del catálogo
             fecha: Fecha a validar
             
         Returns:
             bool: True si ya existe el registro
         """
-        if tipo_asistencia.nombre_asistencia in AsistenciaService.TIPOS_UNICOS:
+        if tipo_asistencia.es_tipo_unico:
+            # tipo_unico=True permite usar el índice parcial de uniq_registro_tipo_unico_por_dia
             return RegistroAsistencia.objects.filter(
                 empleado=empleado,
-                tipo=tipo_asistencia,
-                fecha_registro=fecha
+                tipo_id=tipo_asistencia.id_tipo,
+                fecha_registro=fecha,
+                tipo_unico=True,
             ).exists()
         return False
     
@@ -52,32 +68,68 @@ class AsistenciaService:
         """
         Bloquea solo si el fingerprint está VINCULADO a otro empleado distinto.
         Si no se proporciona fingerprint (None/cadena vacía/null/undefined), no aplica la validación.
+        Acepta la instancia de Empleado o directamente su ID.
         """
         fp = AsistenciaService._normalize_fingerprint(fingerprint)
         if not fp:
             return False  # no bloquear si no hay fingerprint válido
-        vinculo = DispositivoEmpleado.objects.select_related('empleado').filter(fingerprint=fp).first()
-        if vinculo and vinculo.empleado_id != empleado.id_empleado:
+        empleado_id = getattr(empleado, 'id_empleado', empleado)
+        vinculado = DispositivoEmpleado.obtener_empleado_por_fingerprint(fp)
+        if vinculado is not None and str(vinculado.id_empleado) != str(empleado_id):
             return True  # fingerprint pertenece a otro empleado
         return False
     
+    MENSAJE_SIN_UBICACION = "No se pudo obtener tu ubicación."
+    MENSAJE_FUERA_DE_SEDE = "Debes estar dentro del área de la empresa para registrar asistencia."
+
+    @staticmethod
+    def validar_ubicacion(latitud, longitud):
+        """
+        Valida que las coordenadas estén dentro de alguna sede configurada.
+        No aplica si la geocerca está desactivada (GEOCERCA_ACTIVA).
+
+        Args:
+            latitud, longitud: Coordenadas enviadas por el dispositivo
+
+        Returns:
+            str: Mensaje de error, o None si la ubicación es válida
+        """
+        if not geocerca_activa():
+            return None
+        coordenadas = parsear_coordenadas(latitud, longitud)
+        if coordenadas is None:
+            return AsistenciaService.MENSAJE_SIN_UBICACION
+        if obtener_indice_sedes().sede_para(*coordenadas) is None:
+            return AsistenciaService.MENSAJE_FUERA_DE_SEDE
+        return None
+
     @staticmethod
-    def crear_registro_asistencia(empleado_id, tipo_id, descripcion, fingerprint):
+    def crear_registro_asistencia(empleado_id, tipo_id, descripcion, fingerprint, latitud=None, longitud=None):
         """
         Crea un nuevo registro de asistencia.
+
+        El duplicado de tipos únicos lo garantiza la restricción
+        ``uniq_registro_tipo_unico_por_dia``: se intenta el INSERT directamente y un
+        conflicto se traduce en el mensaje de "ya registrado", incluso con envíos simultáneos.
         
         Args:
             empleado_id: ID del empleado
             tipo_id: ID del tipo de asistencia
             descripcion: Descripción adicional
             fingerprint: ID del dispositivo
+            latitud, longitud: Ubicación del dispositivo (validada contra las sedes)
             
         Returns:
             tuple: (success, message, registro)
         """
         try:
-            empleado = Empleado.objects.get(id_empleado=empleado_id)
-            tipo_asistencia = TipoAsistencia.objects.get(id_tipo=tipo_id)
+            error_ubicacion = AsistenciaService.validar_ubicacion(latitud, longitud)
+            if error_ubicacion:
+                return False, error_ubicacion, None
+
+            tipo_asistencia = CatalogoTipos.obtener(tipo_id)
+            if tipo_asistencia is None:
+                raise TipoAsistencia.DoesNotExist
             
             now = timezone.localtime()
             fecha = now.date()
@@ -86,23 +138,27 @@ class AsistenciaService:
             # Normalizar fingerprint recibido
             fingerprint = AsistenciaService._normalize_fingerprint(fingerprint)
             
-            # Validar registro duplicado
-            if AsistenciaService.validar_registro_duplicado(empleado, tipo_asistencia, fecha):
-                return False, f'Ya registraste "{tipo_asistencia.nombre_asistencia}" hoy.', None
-            
             # Validar fingerprint vinculado a otra persona
-            if AsistenciaService.validar_fingerprint_unico(empleado, fingerprint, fecha):
+            if AsistenciaService.validar_fingerprint_unico(empleado_id, fingerprint, fecha):
                 return False, "Este dispositivo está vinculado a otro empleado.", None
             
-            # Crear registro
-            registro = RegistroAsistencia.objects.create(
-                empleado=empleado,
-                tipo=tipo_asistencia,
+            # Crear registro (un solo INSERT protegido por la restricción única)
+            registro = RegistroAsistencia(
+                empleado_id=empleado_id,
+                tipo_id=tipo_asistencia.id_tipo,
                 fecha_registro=fecha,
                 hora_registro=hora,
                 descripcion=descripcion,
                 fingerprint=fingerprint
             )
+            try:
+                # La señal post_save programa ResumenDiario para después del COMMIT
+                with transaction.atomic():
+                    registro.save()
+            except IntegrityError as error:
+                # Solo en el camino de error se averigua la causa
+                AsistenciaService._verificar_conflicto(registro, error)
+                return False, f'Ya registraste "{tipo_asistencia.nombre_asistencia}" hoy.', None
             
             return True, f'{tipo_asistencia.nombre_asistencia} registrada correctamente.', registro
             
@@ -111,9 +167,322 @@ class AsistenciaService:
         except Exception as e:
             return False, f"Error inesperado: {str(e)}", None
 
+    @staticmethod
+    def _verificar_conflicto(registro, error):
+        """
+        Averigua la causa del IntegrityError al insertar un registro. Solo la violación de
+        ``uniq_registro_tipo_unico_por_dia`` es un registro duplicado; retorna sin error en ese caso.
+
+        Raises:
+            Empleado.DoesNotExist, TipoAsistencia.DoesNotExist: Si falta el empleado o el tipo
+            IntegrityError: El error original, si la causa es otra
+        """
+        if registro.tipo_unico and RegistroAsistencia.objects.filter(
+            empleado_id=registro.empleado_id,
+            tipo_id=registro.tipo_id,
+            fecha_registro=registro.fecha_registro,
+            tipo_unico=True,
+        ).exists():
+            return
+        if not Empleado.objects.filter(id_empleado=registro.empleado_id).exists():
+            raise Empleado.DoesNotExist
+        if not TipoAsistencia.objects.filter(id_tipo=registro.tipo_id).exists():
+            # El catálogo de este worker todavía ofrecía un tipo eliminado
+            CatalogoTipos.invalidar()
+            raise TipoAsistencia.DoesNotExist
+        raise error
+
+    @staticmethod
+    def kiosco_autenticado(clave):
+        """
+        Verifica la clave compartida enviada por un kiosco (cabecera X-Kiosco-Clave).
+
+        Args:
+            clave: Valor recibido (None si no se envió)
+
+        Returns:
+            bool: True si coincide con alguna de KIOSCO_CLAVES
+        """
+        if not clave:
+            return False
+        return any(
+            hmac.compare_digest(clave.encode('utf-8'), valida.encode('utf-8'))
+            for valida in getattr(settings, 'KIOSCO_CLAVES', ())
+        )
+
+    @staticmethod
+    def _parsear_item_lote(item, hora_cliente):
+        """
+        Valida la forma de un elemento del lote y retorna sus datos normalizados.
+        Sin hora_cliente (kiosco no autenticado) se ignora fecha_hora y se usa la hora del servidor.
+
+        Raises:
+            ValueError: Con el mensaje a devolver al cliente
+        """
+        if not isinstance(item, dict):
+            raise ValueError("Elemento inválido: se esperaba un objeto JSON.")
+        empleado_id = item.get('empleado_id')
+        # bool es subclase de int y int(1.9) truncaría: solo enteros o cadenas numéricas
+        if isinstance(empleado_id, bool) or not isinstance(empleado_id, (int, str)):
+            raise ValueError("empleado_id requerido.")
+        try:
+            empleado_id = int(empleado_id)
+        except ValueError:
+            raise ValueError("empleado_id requerido.")
+        tipo_asistencia = CatalogoTipos.obtener(item.get('tipo_id'))
+        if tipo_asistencia is None:
+            raise ValueError("Error: Empleado o tipo de asistencia no encontrado.")
+
+        ahora = timezone.localtime()
+        if hora_cliente:
+            fecha_hora = parse_datetime(str(item.get('fecha_hora') or ''))
+            if fecha_hora is None:
+                raise ValueError("fecha_hora requerida en formato ISO 8601.")
+            if timezone.is_naive(fecha_hora):
+                fecha_hora = timezone.make_aware(fecha_hora)
+            fecha_hora = timezone.localtime(fecha_hora)
+            if fecha_hora > ahora + AsistenciaService.LOTE_TOLERANCIA_RELOJ:
+                raise ValueError("fecha_hora no puede estar en el futuro.")
+            if fecha_hora < ahora - AsistenciaService.LOTE_MAX_ANTIGUEDAD:
+                raise ValueError("fecha_hora demasiado antigua para registrarse en lote.")
+        else:
+            fecha_hora = ahora
+
+        descripcion = item.get('descripcion') or ''
+        if not isinstance(descripcion, str):
+            raise ValueError("descripcion debe ser texto.")
+        if len(descripcion) > RegistroAsistencia._meta.get_field('descripcion').max_length:
+            raise ValueError("Descripción demasiado larga.")
+
+        return {
+            'empleado_id': empleado_id,
+            'tipo': tipo_asistencia,
+            'fecha': fecha_hora.date(),
+            'hora': fecha_hora.time(),
+            'descripcion': descripcion,
+            'fingerprint': AsistenciaService._normalize_fingerprint(item.get('fingerprint')),
+            'coordenadas': parsear_coordenadas(item.get('latitud'), item.get('longitud')),
+        }
+
+    @staticmethod
+    def crear_registros_lote(items, hora_cliente=False):
+        """
+        Crea varios registros de asistencia enviados juntos (p. ej. tablets que
+        estuvieron sin conexión), aplicando las mismas reglas que
+        crear_registro_asistencia pero con consultas por conjunto y un solo bulk_create.
+
+        Cada elemento es un dict con empleado_id, tipo_id, fecha_hora (ISO 8601,
+        hora del cliente), latitud/longitud (si la geocerca está activa),
+        fingerprint y descripcion opcionales.
+
+        Args:
+            items: Lista de elementos a registrar
+            hora_cliente: True solo para kioscos autenticados (kiosco_autenticado); si no,
+                fecha_hora se ignora y todos los registros llevan la hora del servidor
+
+        Returns:
+            list: Una tupla (success, message, registro) por elemento, en el mismo orden
+        """
+        resultados = [None] * len(items)
+        validos = []
+        for indice, item in enumerate(items):
+            try:
+                validos.append((indice, AsistenciaService._parsear_item_lote(item, hora_cliente)))
+            except ValueError as e:
+                resultados[indice] = (False, str(e), None)
+
+        if geocerca_activa():
+            con_ubicacion = []
+            for indice, datos in validos:
+                if datos['coordenadas'] is None:
+                    resultados[indice] = (False, AsistenciaService.MENSAJE_SIN_UBICACION, None)
+                else:
+                    con_ubicacion.append((indice, datos))
+            sedes = obtener_indice_sedes().sedes_para_puntos([datos['coordenadas'] for _, datos in con_ubicacion])
+            validos = []
+            for (indice, datos), sede in zip(con_ubicacion, sedes):
+                if sede is None:
+                    resultados[indice] = (False, AsistenciaService.MENSAJE_FUERA_DE_SEDE, None)
+                else:
+                    validos.append((indice, datos))
+
+        empleados_ids = {datos['empleado_id'] for _, datos in validos}
+        fingerprints = {datos['fingerprint'] for _, datos in validos if datos['fingerprint']}
+        fechas = {datos['fecha'] for _, datos in validos}
+
+        empleados_existentes = set(
+            Empleado.objects.filter(id_empleado__in=empleados_ids).values_list('id_empleado', flat=True)
+        ) if empleados_ids else set()
+        vinculos = dict(
+            DispositivoEmpleado.objects.filter(fingerprint__in=fingerprints).values_list('fingerprint', 'empleado_id')
+        ) if fingerprints else {}
+        ya_registrados = set(
+            RegistroAsistencia.objects.filter(
+                tipo_unico=True,
+                empleado_id__in=empleados_existentes,
+                fecha_registro__in=fechas,
+            ).values_list('empleado_id', 'tipo_id', 'fecha_registro')
+        ) if empleados_existentes else set()
+
+        pendientes = []
+        for indice, datos in validos:
+            tipo_asistencia = datos['tipo']
+            if datos['empleado_id'] not in empleados_existentes:
+                resultados[indice] = (False, "Error: Empleado o tipo de asistencia no encontrado.", None)
+                continue
+            vinculado_a = vinculos.get(datos['fingerprint'])
+            if vinculado_a is not None and vinculado_a != datos['empleado_id']:
+                resultados[indice] = (False, "Este dispositivo está vinculado a otro empleado.", None)
+                continue
+            if tipo_asistencia.es_tipo_unico:
+                clave = (datos['empleado_id'], tipo_asistencia.id_tipo, datos['fecha'])
+                if clave in ya_registrados:
+                    resultados[indice] = (
+                        False, f'Ya registraste "{tipo_asistencia.nombre_asistencia}" el {datos["fecha"]:%Y-%m-%d}.', None
+                    )
+                    continue
+                ya_registrados.add(clave)
+            registro = RegistroAsistencia(
+                empleado_id=datos['empleado_id'],
+                tipo_id=tipo_asistencia.id_tipo,
+                fecha_registro=datos['fecha'],
+                hora_registro=datos['hora'],
+                descripcion=datos['descripcion'],
+                fingerprint=datos['fingerprint'],
+                tipo_unico=tipo_asistencia.es_tipo_unico,
+            )
+            pendientes.append((indice, registro, tipo_asistencia))
+
+        if pendientes:
+            try:
+                with transaction.atomic():
+                    RegistroAsistencia.objects.bulk_create([registro for _, registro, _ in pendientes])
+                    # bulk_create no emite señales
+                    ReporteService.actualizar_resumen_al_confirmar(
+                        (registro.empleado_id, registro.fecha_registro) for _, registro, _ in pendientes
+                    )
+                for indice, registro, tipo_asistencia in pendientes:
+                    resultados[indice] = (True, f'{tipo_asistencia.nombre_asistencia} registrada correctamente.', registro)
+            except IntegrityError:
+                # Un registro concurrente ganó la carrera: se reintenta uno a uno
+                for indice, registro, tipo_asistencia in pendientes:
+                    registro.pk = None
+                    try:
+                        with transaction.atomic():
+                            registro.save()
+                        resultados[indice] = (True, f'{tipo_asistencia.nombre_asistencia} registrada correctamente.', registro)
+                    except IntegrityError as error:
+                        try:
+                            AsistenciaService._verificar_conflicto(registro, error)
+                        except (Empleado.DoesNotExist, TipoAsistencia.DoesNotExist):
+                            resultados[indice] = (False, "Error: Empleado o tipo de asistencia no encontrado.", None)
+                        except IntegrityError as e:
+                            resultados[indice] = (False, f"Error inesperado: {str(e)}", None)
+                        else:
+                            resultados[indice] = (
+                                False,
+                                f'Ya registraste "{tipo_asistencia.nombre_asistencia}" el {registro.fecha_registro:%Y-%m-%d}.',
+                                None,
+                            )
+
+        return resultados
+
+
+class FiltrosReporte(NamedTuple):
+    """Filtros de los reportes: rango de fechas, empleados y tipos (vacío = sin filtro)."""
+    desde: object = None
+    hasta: object = None
+    empleados: tuple = ()
+    tipos: tuple = ()
+
+    def aplicar(self, registros):
+        """
+        Aplica los filtros a un QuerySet de RegistroAsistencia.
+        Las condiciones caen sobre fecha_registro, empleado_id y tipo_id,
+        cubiertas por los índices de RegistroAsistencia.
+        """
+        if self.desde:
+            registros = registros.filter(fecha_registro__gte=self.desde)
+        if self.hasta:
+            registros = registros.filter(fecha_registro__lte=self.hasta)
+        if self.empleados:
+            registros = registros.filter(empleado_id__in=self.empleados)
+        if self.tipos:
+            registros = registros.filter(tipo_id__in=self.tipos)
+        return registros
+
+    def aplicar_resumen(self, resumenes):
+        """Aplica el rango de fechas y los empleados a un QuerySet de ResumenDiario (no tiene tipo)."""
+        if self.desde:
+            resumenes = resumenes.filter(fecha__gte=self.desde)
+        if self.hasta:
+            resumenes = resumenes.filter(fecha__lte=self.hasta)
+        if self.empleados:
+            resumenes = resumenes.filter(empleado_id__in=self.empleados)
+        return resumenes
+
+    def como_dict(self):
+        """Representación serializable en JSON (para TrabajoExportacion.filtros)."""
+        return {
+            'desde': self.desde.isoformat() if self.desde else None,
+            'hasta': self.hasta.isoformat() if self.hasta else None,
+            'empleados': list(self.empleados),
+            'tipos': list(self.tipos),
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        """Inverso de como_dict."""
+        return cls(
+            desde=parse_date(datos['desde']) if datos.get('desde') else None,
+            hasta=parse_date(datos['hasta']) if datos.get('hasta') else None,
+            empleados=tuple(datos.get('empleados') or ()),
+            tipos=tuple(datos.get('tipos') or ()),
+        )
+
+    def sufijo_archivo(self):
+        """Sufijo para el nombre del archivo descargado según el rango de fechas."""
+        partes = [f.strftime('%Y-%m-%d') for f in (self.desde, self.hasta) if f]
+        return '_' + '_'.join(partes) if partes else ''
+
 
 class ReporteService:
     """Servicio para generar reportes de asistencia."""
+
+    @staticmethod
+    def parsear_filtros(params):
+        """
+        Lee los filtros de los reportes desde los parámetros GET.
+
+        Args:
+            params: QueryDict con 'desde', 'hasta' (YYYY-MM-DD) y 'empleado', 'tipo' (repetibles)
+
+        Returns:
+            tuple: (success, message, filtros)
+        """
+        fechas = {}
+        for clave in ('desde', 'hasta'):
+            valor = (params.get(clave) or '').strip()
+            if not valor:
+                fechas[clave] = None
+                continue
+            try:
+                fechas[clave] = parse_date(valor)
+            except ValueError:
+                fechas[clave] = None
+            if fechas[clave] is None:
+                return False, f"Fecha inválida en '{clave}': {valor}", None
+        if fechas['desde'] and fechas['hasta'] and fechas['desde'] > fechas['hasta']:
+            return False, "La fecha 'desde' no puede ser posterior a la fecha 'hasta'", None
+
+        ids = {}
+        for clave, nombre in (('empleado', 'empleados'), ('tipo', 'tipos')):
+            try:
+                ids[nombre] = tuple(sorted({int(v) for v in params.getlist(clave) if str(v).strip()}))
+            except ValueError:
+                return False, f"Valor inválido en '{clave}'", None
+
+        return True, None, FiltrosReporte(desde=fechas['desde'], hasta=fechas['hasta'], **ids)
     
     @staticmethod
     def strfdelta(td):
@@ -131,77 +500,388 @@ class ReporteService:
         minutes = remainder // 60
         return f"{hours:02d}:{minutes:02d}"
     
+    # Primera marca del día que interesa al resumen, por nombre de tipo (sin distinguir mayúsculas)
+    TIPOS_RESUMEN = {
+        'entrada': "Entrada",
+        'salida': "Salida",
+        'ini_almuerzo': "Inicio Almuerzo",
+        'fin_almuerzo': "Fin Almuerzo",
+        'sal_comision': "Salida por comisión",
+        'ent_comision': "Entrada por comisión",
+        'sal_otros': "Salida por otros",
+        'ent_otros': "Entrada por otros",
+    }
+
     @staticmethod
-    def delta(t1, t2):
-        """Calcula la diferencia entre dos horas del mismo día."""
-        return datetime.combine(datetime.today(), t2) - datetime.combine(datetime.today(), t1)
-    
+    def _primera_hora(ids_tipo):
+        """Min(hora_registro) condicionado a los tipos dados (NULL si el tipo no existe)."""
+        if not ids_tipo:
+            # Agregado siempre NULL: un Value suelto terminaría en el GROUP BY
+            return Min(Value(None, output_field=TimeField()))
+        return Min('hora_registro', filter=Q(tipo_id__in=ids_tipo))
+
+    @staticmethod
+    def _diferencia(inicio, fin):
+        return ExpressionWrapper(F(fin) - F(inicio), output_field=DurationField())
+
+    CAMPOS_RESUMEN = ('entrada', 'salida', 'almuerzo_segundos', 'comision_segundos',
+                      'permiso_segundos', 'trabajadas_segundos')
+    TAMANO_LOTE_RESUMEN = 1000
+
+    @staticmethod
+    def consulta_resumen(registros, tipos):
+        """
+        Consulta agrupada por (empleado, fecha): la primera hora de cada tipo se obtiene
+        con Min condicionado y las duraciones se restan en la base de datos.
+
+        Args:
+            registros: QuerySet de RegistroAsistencia ya filtrado
+            tipos: Iterable de (id_tipo, nombre_asistencia) para ubicar los tipos por nombre
+
+        Returns:
+            QuerySet: Un diccionario por empleado y fecha con empleado_id, fecha_registro,
+            entrada, salida y las duraciones almuerzo, comision, permiso y trabajadas
+            (timedelta; None si faltan las marcas)
+        """
+        ids_por_nombre = defaultdict(list)
+        for id_tipo, nombre in tipos:
+            ids_por_nombre[nombre.lower()].append(id_tipo)
+        primeras = {
+            clave: ReporteService._primera_hora(ids_por_nombre.get(nombre.lower()))
+            for clave, nombre in ReporteService.TIPOS_RESUMEN.items()
+        }
+        cero = Value(timedelta(), output_field=DurationField())
+
+        return registros.values('empleado_id', 'fecha_registro') \
+            .annotate(**primeras) \
+            .annotate(
+                almuerzo=ReporteService._diferencia('ini_almuerzo', 'fin_almuerzo'),
+                comision=ReporteService._diferencia('sal_comision', 'ent_comision'),
+                permiso=ReporteService._diferencia('sal_otros', 'ent_otros'),
+            ) \
+            .annotate(
+                trabajadas=ExpressionWrapper(
+                    ReporteService._diferencia('entrada', 'salida')
+                    - Coalesce('almuerzo', cero) - Coalesce('permiso', cero),
+                    output_field=DurationField(),
+                )
+            ) \
+            .order_by('empleado_id', 'fecha_registro')
+
+    @staticmethod
+    def campos_resumen(fila):
+        """Convierte una fila de consulta_resumen en los campos de ResumenDiario."""
+        def segundos(td):
+            return int(td.total_seconds()) if td is not None else 0
+        return {
+            'empleado_id': fila['empleado_id'],
+            'fecha': fila['fecha_registro'],
+            'entrada': fila['entrada'],
+            'salida': fila['salida'],
+            'almuerzo_segundos': segundos(fila['almuerzo']),
+            'comision_segundos': segundos(fila['comision']),
+            'permiso_segundos': segundos(fila['permiso']),
+            'trabajadas_segundos': segundos(fila['trabajadas']),
+        }
+
+    @staticmethod
+    def _tipos_catalogo():
+        return [(t.id_tipo, t.nombre_asistencia) for t in CatalogoTipos.listar()]
+
+    @staticmethod
+    def actualizar_resumen_diario(pares):
+        """
+        Recalcula ResumenDiario para los (empleado_id, fecha) indicados con un upsert.
+        Las señales de RegistroAsistencia (alta, edición y baja) y el registro en lote
+        lo ejecutan tras el COMMIT (ver actualizar_resumen_al_confirmar).
+
+        Las filas de cada empleado y día se crean si faltan y se bloquean (select_for_update,
+        siempre en el mismo orden) antes de leer los registros: dos marcajes simultáneos del
+        mismo día se recalculan uno después del otro y el segundo ya ve el registro del primero.
+        Los días que se quedan sin registros se eliminan.
+
+        Args:
+            pares: Iterable de tuplas (empleado_id, fecha)
+        """
+        dias = set(pares)
+        if not dias:
+            return
+        pares = sorted(dias)
+        empleados = {empleado_id for empleado_id, _ in pares}
+        fechas = {fecha for _, fecha in pares}
+        with transaction.atomic():
+            ResumenDiario.objects.bulk_create(
+                [ResumenDiario(empleado_id=empleado_id, fecha=fecha) for empleado_id, fecha in pares],
+                ignore_conflicts=True,
+            )
+            list(
+                ResumenDiario.objects.select_for_update()
+                .filter(empleado_id__in=empleados, fecha__in=fechas)
+                .order_by('empleado_id', 'fecha')
+                .values_list('id', flat=True)
+            )
+            registros = RegistroAsistencia.objects.filter(empleado_id__in=empleados, fecha_registro__in=fechas)
+            resumenes = [
+                ResumenDiario(**ReporteService.campos_resumen(fila))
+                for fila in ReporteService.consulta_resumen(registros, ReporteService._tipos_catalogo())
+                if (fila['empleado_id'], fila['fecha_registro']) in dias
+            ]
+            ResumenDiario.objects.bulk_create(
+                resumenes,
+                update_conflicts=True,
+                unique_fields=['empleado', 'fecha'],
+                update_fields=list(ReporteService.CAMPOS_RESUMEN),
+            )
+            vacios = dias - {(resumen.empleado_id, resumen.fecha) for resumen in resumenes}
+            if vacios:
+                sin_registros = Q()
+                for empleado_id, fecha in vacios:
+                    sin_registros |= Q(empleado_id=empleado_id, fecha=fecha)
+                ResumenDiario.objects.filter(sin_registros).delete()
+
+    @staticmethod
+    def actualizar_resumen_al_confirmar(pares):
+        """
+        Programa actualizar_resumen_diario para después del COMMIT de la transacción en
+        curso (de inmediato si no hay ninguna): la transacción del marcaje queda en el INSERT
+        y no espera los bloqueos ni el recálculo del resumen.
+        Un fallo del recálculo se registra en el log sin afectar al registro ya guardado;
+        reconstruir_resumen lo corrige.
+
+        Args:
+            pares: Iterable de tuplas (empleado_id, fecha)
+        """
+        pares = set(pares)
+        transaction.on_commit(lambda: ReporteService.actualizar_resumen_diario(pares), robust=True)
+
+    @staticmethod
+    def reconstruir_resumen(desde=None, hasta=None):
+        """
+        Reconstruye ResumenDiario desde RegistroAsistencia para un rango de fechas.
+
+        Args:
+            desde, hasta: Fechas límite (inclusive); None = sin límite
+
+        Returns:
+            int: Cantidad de resúmenes escritos
+        """
+        filtros = FiltrosReporte(desde=desde, hasta=hasta)
+        consulta = ReporteService.consulta_resumen(
+            filtros.aplicar(RegistroAsistencia.objects.all()), ReporteService._tipos_catalogo()
+        )
+        total = 0
+        with transaction.atomic():
+            filtros.aplicar_resumen(ResumenDiario.objects.all()).delete()
+            lote = []
+            for fila in consulta.iterator(chunk_size=ReporteService.TAMANO_LOTE_RESUMEN):
+                lote.append(ResumenDiario(**ReporteService.campos_resumen(fila)))
+                if len(lote) >= ReporteService.TAMANO_LOTE_RESUMEN:
+                    ResumenDiario.objects.bulk_create(lote)
+                    total += len(lote)
+                    lote = []
+            ResumenDiario.objects.bulk_create(lote)
+            total += len(lote)
+        # Los Excel cacheados se generaron con el resumen anterior
+        cache_exportaciones.invalidar()
+        return total
+
     @staticmethod
-    def obtener_datos_resumen():
+    def obtener_datos_resumen(filtros=None):
         """
         Obtiene los datos para el resumen diario de asistencia.
+        Se leen de ResumenDiario; solo si se filtra por tipo de asistencia se
+        calculan al momento con consulta_resumen sobre los registros filtrados.
+        En ambos casos las filas se leen por bloques (iterator), sin cargar el historial.
         
+        Args:
+            filtros: FiltrosReporte opcional (sin filtros = todo el historial)
+            
         Returns:
-            dict: Datos organizados por empleado y fecha
+            iterable: Un diccionario por empleado y fecha con nombres, apellidos, fecha
+            y las duraciones almuerzo_segundos, comision_segundos, permiso_segundos y trabajadas_segundos
         """
-        registros = RegistroAsistencia.objects.select_related('empleado', 'tipo') \
-            .order_by('empleado', 'fecha_registro', 'hora_registro')
-        
-        datos_diarios = defaultdict(lambda: defaultdict(list))
-        for reg in registros:
-            key = (reg.empleado.id_empleado, reg.fecha_registro)
-            datos_diarios[key]["empleado"] = reg.empleado
-            datos_diarios[key]["fecha"] = reg.fecha_registro
-            datos_diarios[key][reg.tipo.nombre_asistencia].append(reg.hora_registro)
-        
-        return datos_diarios
+        filtros = filtros or FiltrosReporte()
+        columnas = ('nombres', 'apellidos', 'fecha') + ReporteService.CAMPOS_RESUMEN[2:]
+        if not filtros.tipos:
+            return filtros.aplicar_resumen(ResumenDiario.objects.all()) \
+                .annotate(nombres=F('empleado__nombres'), apellidos=F('empleado__apellidos')) \
+                .order_by('empleado_id', 'fecha') \
+                .values(*columnas)
+
+        consulta = ReporteService.consulta_resumen(
+            filtros.aplicar(RegistroAsistencia.objects.all()), ReporteService._tipos_catalogo()
+        ).annotate(nombres=Min('empleado__nombres'), apellidos=Min('empleado__apellidos'))
+        return (
+            {'nombres': fila['nombres'], 'apellidos': fila['apellidos'], **ReporteService.campos_resumen(fila)}
+            for fila in consulta.iterator(chunk_size=ReporteService.TAMANO_LOTE_EXPORTACION)
+        )
     
+    DURACIONES_RESUMEN = ('almuerzo', 'comision', 'permiso', 'trabajadas')
+
+    @staticmethod
+    def consulta_resumen_mensual(filtros=None):
+        """
+        Totales por empleado y mes en una sola consulta agrupada sobre ResumenDiario.
+        Un día cuenta como trabajado si tiene Entrada; las marcas faltantes son las
+        Entradas y Salidas que no se registraron en los días con algún registro.
+        El filtro de tipos no aplica (ResumenDiario no distingue tipos).
+
+        Args:
+            filtros: FiltrosReporte opcional (sin filtros = todo el historial)
+
+        Returns:
+            QuerySet: Un diccionario por empleado y mes con empleado_id, mes (primer día),
+            nombres, apellidos, dias_trabajados, marcas_faltantes y total_<duración> en segundos
+        """
+        filtros = filtros or FiltrosReporte()
+        totales = {
+            f'total_{clave}': Sum(f'{clave}_segundos') for clave in ReporteService.DURACIONES_RESUMEN
+        }
+        return filtros.aplicar_resumen(ResumenDiario.objects.all()) \
+            .values('empleado_id', mes=TruncMonth('fecha')) \
+            .annotate(
+                nombres=Min('empleado__nombres'),
+                apellidos=Min('empleado__apellidos'),
+                dias_trabajados=Count('id', filter=Q(entrada__isnull=False)),
+                marcas_faltantes=Count('id', filter=Q(entrada__isnull=True))
+                + Count('id', filter=Q(salida__isnull=True)),
+                **totales,
+            ) \
+            .order_by('empleado_id', 'mes')
+
+    @staticmethod
+    def obtener_datos_resumen_mensual(filtros=None):
+        """
+        Obtiene los totales mensuales por empleado (ver consulta_resumen_mensual),
+        con las duraciones en las mismas claves <duración>_segundos que obtener_datos_resumen
+        para darles formato con calcular_horas_empleado.
+
+        Args:
+            filtros: FiltrosReporte opcional (sin filtros = todo el historial)
+
+        Yields:
+            dict: nombres, apellidos, mes, dias_trabajados, marcas_faltantes y las duraciones en segundos
+        """
+        consulta = ReporteService.consulta_resumen_mensual(filtros)
+        for fila in consulta.iterator(chunk_size=ReporteService.TAMANO_LOTE_EXPORTACION):
+            datos = {
+                'nombres': fila['nombres'],
+                'apellidos': fila['apellidos'],
+                'mes': fila['mes'],
+                'dias_trabajados': fila['dias_trabajados'],
+                'marcas_faltantes': fila['marcas_faltantes'],
+            }
+            for clave in ReporteService.DURACIONES_RESUMEN:
+                datos[f'{clave}_segundos'] = fila[f'total_{clave}'] or 0
+            yield datos
+
+    ENCABEZADOS_ASISTENCIA = ["Empleado", "Tipo de Asistencia", "Fecha", "Hora", "Descripción", "ID Dispositivo"]
+    CAMPOS_EXPORTACION_ASISTENCIA = (
+        'empleado__nombres', 'empleado__apellidos', 'tipo_id',
+        'fecha_registro', 'hora_registro', 'descripcion', 'fingerprint',
+    )
+    TAMANO_LOTE_EXPORTACION = 2000
+
+    @staticmethod
+    def filas_exportacion_asistencia(registros):
+        """
+        Genera las filas del Excel de asistencia leyendo la consulta por bloques,
+        sin instanciar modelos ni cargar todos los registros a la vez.
+
+        Args:
+            registros: QuerySet de RegistroAsistencia ya filtrado y ordenado
+
+        Yields:
+            list: Valores de una fila en el orden de ENCABEZADOS_ASISTENCIA
+        """
+        nombres_tipo = {t.id_tipo: t.nombre_asistencia for t in CatalogoTipos.listar()}
+        filas = registros.values_list(
+            *ReporteService.CAMPOS_EXPORTACION_ASISTENCIA
+        ).iterator(chunk_size=ReporteService.TAMANO_LOTE_EXPORTACION)
+        for fila in filas:
+            yield ReporteService._fila_asistencia(fila, nombres_tipo)
+
+    @staticmethod
+    def filas_exportacion_por_empleado(registros):
+        """
+        Filas del Excel de asistencia agrupadas por empleado, desde una sola consulta
+        ordenada por empleado y leída por bloques: solo las filas de un empleado
+        están en memoria a la vez. Dentro de cada empleado se conserva el orden de ``registros``.
+
+        Args:
+            registros: QuerySet de RegistroAsistencia ya filtrado y ordenado
+
+        Yields:
+            tuple: (empleado_id, nombres, apellidos, lista de filas como filas_exportacion_asistencia)
+        """
+        nombres_tipo = {t.id_tipo: t.nombre_asistencia for t in CatalogoTipos.listar()}
+        filas = registros.order_by(
+            'empleado__apellidos', 'empleado__nombres', 'empleado_id', *registros.query.order_by
+        ).values_list(
+            'empleado_id', *ReporteService.CAMPOS_EXPORTACION_ASISTENCIA
+        ).iterator(chunk_size=ReporteService.TAMANO_LOTE_EXPORTACION)
+        for empleado_id, grupo in groupby(filas, key=itemgetter(0)):
+            primera = next(grupo)
+            yield empleado_id, primera[1], primera[2], [
+                ReporteService._fila_asistencia(fila[1:], nombres_tipo) for fila in chain([primera], grupo)
+            ]
+
+    @staticmethod
+    def _fila_asistencia(fila, nombres_tipo):
+        nombres, apellidos, tipo_id, fecha, hora, descripcion, fingerprint = fila
+        return [
+            f"{nombres} {apellidos}",
+            nombres_tipo.get(tipo_id, ''),
+            fecha.strftime('%Y-%m-%d'),
+            hora.strftime('%H:%M:%S'),
+            descripcion or '',
+            fingerprint or '',
+        ]
+
+    @staticmethod
+    def anchos_exportacion_asistencia(registros):
+        """
+        Calcula el ancho de cada columna del Excel de asistencia antes de escribir filas.
+        Se resuelve con agregados en la base de datos (largo máximo de cada campo),
+        equivalente a medir cada celda como hacía el export en memoria.
+
+        Args:
+            registros: QuerySet de RegistroAsistencia que se va a exportar
+
+        Returns:
+            list: Ancho por columna (largo máximo + 2)
+        """
+        largos = registros.aggregate(
+            nombre=Max(Length('empleado__nombres') + Length('empleado__apellidos')),
+            descripcion=Max(Length('descripcion')),
+            fingerprint=Max(Length('fingerprint')),
+        )
+        contenido = [
+            (largos['nombre'] or 0) + 1,
+            max((len(t.nombre_asistencia) for t in CatalogoTipos.listar()), default=0),
+            10,
+            8,
+            largos['descripcion'] or 0,
+            largos['fingerprint'] or 0,
+        ]
+        return [
+            max(len(encabezado), largo) + 2
+            for encabezado, largo in zip(ReporteService.ENCABEZADOS_ASISTENCIA, contenido)
+        ]
+
     @staticmethod
     def calcular_horas_empleado(data):
         """
-        Calcula las horas trabajadas, almuerzo, comisiones y permisos para un empleado.
-        Hace las búsquedas de tipos de asistencia de forma case-insensitive para evitar errores por variaciones de mayúsculas/minúsculas.
+        Da formato HH:MM a las duraciones ya calculadas por obtener_datos_resumen
+        (un día) u obtener_datos_resumen_mensual (un mes).
         
         Args:
-            data: Datos del empleado para una fecha específica
+            data: Fila de obtener_datos_resumen u obtener_datos_resumen_mensual
             
         Returns:
             dict: Horas calculadas
         """
-        almuerzo = timedelta()
-        comision = timedelta()
-        permiso = timedelta()
-        trabajadas = timedelta()
-
-        def get_times(key: str):
-            k = key.lower()
-            for existente, tiempos in data.items():
-                if str(existente).lower() == k:
-                    return tiempos
-            return []
-
-        ini_almuerzo = get_times("Inicio Almuerzo")
-        fin_almuerzo = get_times("Fin Almuerzo")
-        sal_comision = get_times("Salida por comisión")
-        ent_comision = get_times("Entrada por comisión")
-        sal_otros = get_times("Salida por otros")
-        ent_otros = get_times("Entrada por otros")
-        entrada = get_times("Entrada")
-        salida = get_times("Salida")
-
-        if ini_almuerzo and fin_almuerzo:
-            almuerzo = ReporteService.delta(ini_almuerzo[0], fin_almuerzo[0])
-        if sal_comision and ent_comision:
-            comision = ReporteService.delta(sal_comision[0], ent_comision[0])
-        if sal_otros and ent_otros:
-            permiso = ReporteService.delta(sal_otros[0], ent_otros[0])
-        if entrada and salida:
-            total_dia = ReporteService.delta(entrada[0], salida[0])
-            trabajadas = total_dia - almuerzo - permiso
-        
         return {
-            'almuerzo': ReporteService.strfdelta(almuerzo),
-            'comision': ReporteService.strfdelta(comision),
-            'permiso': ReporteService.strfdelta(permiso),
-            'trabajadas': ReporteService.strfdelta(trabajadas)
+            clave: ReporteService.strfdelta(timedelta(seconds=data[f'{clave}_segundos']))
+            for clave in ReporteService.DURACIONES_RESUMEN
         }
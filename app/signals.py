@@ -0,0 +1,79 @@
+"""
+Señales del sistema de asistencia.
+Mantienen sincronizadas las cachés en memoria con la base de datos.
+"""
+
+from django.core.signals import request_started, setting_changed
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Empleado, TipoAsistencia, DispositivoEmpleado, RegistroAsistencia
+from .catalogo import CatalogoTipos
+from . import cache_exportaciones, conexiones
+from .geocerca import obtener_indice_sedes
+
+
+@receiver([post_save, post_delete], sender=TipoAsistencia)
+def invalidar_catalogo_tipos(sender, **kwargs):
+    """Recarga el catálogo de tipos cuando se crea, edita o elimina uno."""
+    CatalogoTipos.invalidar()
+    cache_exportaciones.invalidar()
+
+
+@receiver([post_save, post_delete], sender=DispositivoEmpleado)
+def invalidar_cache_dispositivo(sender, instance, **kwargs):
+    """Invalida el fingerprint vinculado o desvinculado (API de vincular/desvincular, admin)."""
+    DispositivoEmpleado.invalidar_cache_fingerprint(instance.fingerprint)
+
+
+@receiver([post_save, post_delete], sender=Empleado)
+def invalidar_cache_empleado(sender, **kwargs):
+    """
+    Las cachés guardan instancias de Empleado (nombres, código QR); se descartan
+    completas porque el código anterior no se conoce tras el guardado.
+    """
+    DispositivoEmpleado.invalidar_cache_fingerprint()
+    Empleado.invalidar_cache_qr()
+    # Los reportes muestran el nombre del empleado
+    cache_exportaciones.invalidar()
+
+
+@receiver(post_save, sender=RegistroAsistencia)
+def actualizar_resumen_registro(sender, instance, created, **kwargs):
+    """Recalcula tras el COMMIT el resumen del día del registro (y el del día anterior si se editó)."""
+    from .services import ReporteService
+    pares = {(instance.empleado_id, instance.fecha_registro)}
+    original = getattr(instance, '_dia_original', None)
+    if not created and original and None not in original:
+        pares.add(original)
+    ReporteService.actualizar_resumen_al_confirmar(pares)
+
+
+@receiver(post_delete, sender=RegistroAsistencia)
+def actualizar_resumen_eliminado(sender, instance, origin=None, **kwargs):
+    """Recalcula el resumen del día del registro eliminado (admin, scripts de limpieza)."""
+    # Al eliminar el empleado su ResumenDiario se elimina en cascada
+    if isinstance(origin, Empleado) or (isinstance(origin, QuerySet) and origin.model is Empleado):
+        return
+    from .services import ReporteService
+    ReporteService.actualizar_resumen_al_confirmar([(instance.empleado_id, instance.fecha_registro)])
+
+
+@receiver(connection_created)
+def contar_conexion(sender, connection, **kwargs):
+    """Contabiliza conexiones abiertas para las estadísticas de DB_POOL_MODE."""
+    if connection.alias == 'default':
+        conexiones.registrar_conexion()
+
+
+@receiver(request_started)
+def contar_peticion(sender, **kwargs):
+    conexiones.registrar_peticion()
+
+
+@receiver(setting_changed)
+def reconstruir_indice_sedes(sender, setting, **kwargs):
+    """Reconstruye el índice de sedes si cambia la configuración (p. ej. override_settings)."""
+    if setting == 'SEDES_ASISTENCIA':
+        obtener_indice_sedes.cache_clear()
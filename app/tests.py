@@ -1,3 +1,766 @@
-from django.test import TestCase
+"""
+Pruebas del sistema de asistencia.
+Ejecutar: python manage.py test app
+(con DATABASE_URL apuntando a PostgreSQL, verificar_indices se comprueba también allí)
+"""
 
-# Create your tests here.
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import zlib
+from datetime import date, time, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+import openpyxl
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresWrapper
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .management.commands.verificar_indices import plan_valido
+from . import cache_exportaciones, cache_local, credenciales, exportaciones, tokens_qr, views, views_async
+from .models import (
+    DispositivoEmpleado, Empleado, RegistroAsistencia, ResumenDiario, TipoAsistencia, TrabajoExportacion,
+    VersionCompartida,
+)
+from .cache_local import CacheLRU
+from .credenciales import generar_pdf
+from .excel_stream import generar_xlsx_streaming
+from .geocerca import METROS_POR_GRADO, IndiceSedes
+from .qr_service import QRService
+from .services import AsistenciaService, FiltrosReporte
+from .utils import calcular_distancia_geografica
+
+
+class DatosAsistenciaMixin:
+    """Un empleado y los tipos de asistencia que usa el resumen diario."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empleado = Empleado.objects.create(nombres="Ana", apellidos="Núñez")
+        cls.tipos = {
+            nombre: TipoAsistencia.objects.create(nombre_asistencia=nombre)
+            for nombre in ("Entrada", "Inicio Almuerzo", "Fin Almuerzo", "Salida", "Salida por comisión")
+        }
+
+    def registrar(self, tipo, fecha, hora, empleado=None):
+        return RegistroAsistencia.objects.create(
+            empleado=empleado or self.empleado, tipo=self.tipos[tipo],
+            fecha_registro=fecha, hora_registro=hora,
+        )
+
+
+class IndicesTests(TestCase):
+
+    def test_consultas_frecuentes_usan_indices(self):
+        """verificar_indices falla (CommandError) si alguna consulta no usa su índice."""
+        salida = StringIO()
+        call_command('verificar_indices', stdout=salida)
+        self.assertIn("Todas las consultas frecuentes usan índices.", salida.getvalue())
+
+    def test_indices_cubrientes_en_postgresql(self):
+        """El DDL de PostgreSQL lleva las columnas include (se genera sin conectarse)."""
+        postgres = PostgresWrapper({**connection.settings_dict, 'ENGINE': 'django.db.backends.postgresql'})
+        editor = postgres.schema_editor(collect_sql=True)
+        sql = {
+            indice.name: str(indice.create_sql(RegistroAsistencia, editor))
+            for indice in RegistroAsistencia._meta.indexes
+        }
+        self.assertIn('INCLUDE ("tipo_id")', sql['idx_registro_emp_fecha_hora'])
+        self.assertIn(
+            'INCLUDE ("empleado_id", "tipo_id", "descripcion", "fingerprint")', sql['idx_registro_fecha_hora']
+        )
+
+    def test_plan_postgresql(self):
+        solo_indice = "Index Only Scan Backward using idx_registro_fecha_hora on app_registroasistencia"
+        con_heap = "Index Scan Backward using idx_registro_fecha_hora on app_registroasistencia"
+        ordenado = "Sort  (cost=1.0..2.0)\n  ->  Index Only Scan using idx_registro_fecha_hora on app_registroasistencia"
+        self.assertTrue(plan_valido(solo_indice, "idx_registro_fecha_hora", True, True, 'postgresql'))
+        self.assertFalse(plan_valido(con_heap, "idx_registro_fecha_hora", True, True, 'postgresql'))
+        self.assertTrue(plan_valido(con_heap, "idx_registro_fecha_hora", True, False, 'postgresql'))
+        self.assertFalse(plan_valido(ordenado, "idx_registro_fecha_hora", True, True, 'postgresql'))
+        self.assertFalse(plan_valido("Seq Scan on app_registroasistencia", "idx_registro_fecha_hora", False, False, 'postgresql'))
+
+
+@override_settings(GEOCERCA_ACTIVA=False)
+class TipoUnicoPorDiaTests(DatosAsistenciaMixin, TestCase):
+
+    def test_tipo_unico_repetido_viola_restriccion(self):
+        dia = date(2025, 3, 3)
+        self.registrar("Entrada", dia, time(8, 0))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.registrar("Entrada", dia, time(8, 5))
+
+    def test_tipo_unico_en_otro_dia_o_tipo_no_unico(self):
+        self.registrar("Entrada", date(2025, 3, 3), time(8, 0))
+        self.registrar("Entrada", date(2025, 3, 4), time(8, 0))
+        self.registrar("Salida por comisión", date(2025, 3, 3), time(10, 0))
+        self.registrar("Salida por comisión", date(2025, 3, 3), time(11, 0))
+        self.assertEqual(RegistroAsistencia.objects.filter(tipo_unico=True).count(), 2)
+
+    def test_marcaje_repetido_responde_ya_registrado(self):
+        entrada = self.tipos["Entrada"].id_tipo
+        ok, _, _ = AsistenciaService.crear_registro_asistencia(self.empleado.id_empleado, entrada, '', None)
+        self.assertTrue(ok)
+        ok, mensaje, registro = AsistenciaService.crear_registro_asistencia(self.empleado.id_empleado, entrada, '', None)
+        self.assertFalse(ok)
+        self.assertIsNone(registro)
+        self.assertEqual(mensaje, 'Ya registraste "Entrada" hoy.')
+
+    def test_resumen_se_actualiza_despues_del_commit(self):
+        """La transacción del marcaje solo lleva el INSERT; el resumen se calcula al confirmar."""
+        with self.captureOnCommitCallbacks() as pendientes:
+            ok, _, registro = AsistenciaService.crear_registro_asistencia(
+                self.empleado.id_empleado, self.tipos["Entrada"].id_tipo, '', None
+            )
+            self.assertTrue(ok)
+            self.assertFalse(ResumenDiario.objects.exists())
+        self.assertEqual(len(pendientes), 1)
+        pendientes[0]()
+        resumen = ResumenDiario.objects.get(empleado=self.empleado, fecha=registro.fecha_registro)
+        self.assertEqual(resumen.entrada, registro.hora_registro)
+
+
+class ResumenDiarioTests(DatosAsistenciaMixin, TestCase):
+    """ResumenDiario se recalcula al confirmar: cada escritura va dentro de captureOnCommitCallbacks."""
+
+    dia = date(2025, 3, 3)
+
+    def resumen(self):
+        return ResumenDiario.objects.get(empleado=self.empleado, fecha=self.dia)
+
+    def registrar_jornada(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.registrar("Entrada", self.dia, time(8, 0))
+            self.registrar("Inicio Almuerzo", self.dia, time(12, 0))
+            self.registrar("Fin Almuerzo", self.dia, time(13, 0))
+            return self.registrar("Salida", self.dia, time(17, 0))
+
+    def test_horas_trabajadas_descuentan_almuerzo(self):
+        self.registrar_jornada()
+        resumen = self.resumen()
+        self.assertEqual((resumen.entrada, resumen.salida), (time(8, 0), time(17, 0)))
+        self.assertEqual(resumen.almuerzo_segundos, 3600)
+        self.assertEqual(resumen.trabajadas_segundos, 8 * 3600)
+
+    def test_editar_registro_recalcula_ambos_dias(self):
+        salida = self.registrar_jornada()
+        with self.captureOnCommitCallbacks(execute=True):
+            salida.hora_registro = time(18, 30)
+            salida.save()
+        self.assertEqual(self.resumen().trabajadas_segundos, 9 * 3600 + 1800)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            salida.fecha_registro = self.dia + timedelta(days=1)
+            salida.save()
+        self.assertIsNone(self.resumen().salida)
+        self.assertEqual(self.resumen().trabajadas_segundos, 0)
+        siguiente = ResumenDiario.objects.get(empleado=self.empleado, fecha=salida.fecha_registro)
+        self.assertEqual(siguiente.salida, time(18, 30))
+
+    def test_eliminar_registros_actualiza_o_elimina_resumen(self):
+        salida = self.registrar_jornada()
+        with self.captureOnCommitCallbacks(execute=True):
+            salida.delete()
+        self.assertIsNone(self.resumen().salida)
+        with self.captureOnCommitCallbacks(execute=True):
+            RegistroAsistencia.objects.filter(empleado=self.empleado, fecha_registro=self.dia).delete()
+        self.assertFalse(ResumenDiario.objects.filter(empleado=self.empleado, fecha=self.dia).exists())
+
+
+
+@override_settings(GEOCERCA_ACTIVA=False, KIOSCO_CLAVES=["clave-kiosco"])
+class RegistroLoteTests(DatosAsistenciaMixin, TestCase):
+
+    def enviar(self, fecha_hora, clave=None, cliente=None, **campos):
+        cabeceras = {'HTTP_X_KIOSCO_CLAVE': clave} if clave else {}
+        registro = {
+            'empleado_id': self.empleado.id_empleado,
+            'tipo_id': self.tipos["Salida por comisión"].id_tipo,
+            'fecha_hora': fecha_hora.isoformat(),
+            **campos,
+        }
+        return (cliente or self.client).post(
+            reverse('api_registrar_asistencia_lote'), json.dumps({'registros': [registro]}),
+            content_type='application/json', **cabeceras,
+        )
+
+    def resultado(self, fecha_hora, clave="clave-kiosco", **campos):
+        response = self.enviar(fecha_hora, clave, **campos)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_kiosco_autenticado_usa_hora_del_cliente(self):
+        fecha_hora = timezone.localtime() - timedelta(days=2)
+        datos = self.resultado(fecha_hora)
+        self.assertTrue(datos['hora_cliente'])
+        self.assertEqual(datos['creados'], 1)
+        registro = RegistroAsistencia.objects.get(id_registro=datos['resultados'][0]['id_registro'])
+        self.assertEqual(registro.fecha_registro, fecha_hora.date())
+
+    def test_rechaza_fecha_futura(self):
+        datos = self.resultado(timezone.localtime() + timedelta(hours=1))
+        self.assertEqual(datos['creados'], 0)
+        self.assertIn("futuro", datos['resultados'][0]['message'])
+
+    def test_rechaza_fecha_demasiado_antigua(self):
+        datos = self.resultado(timezone.localtime() - timedelta(days=8))
+        self.assertEqual(datos['creados'], 0)
+        self.assertIn("antigua", datos['resultados'][0]['message'])
+
+    def test_sin_clave_usa_hora_del_servidor(self):
+        datos = self.resultado(timezone.localtime() - timedelta(days=2), clave="otra-clave")
+        self.assertFalse(datos['hora_cliente'])
+        self.assertEqual(datos['creados'], 1)
+        registro = RegistroAsistencia.objects.get(id_registro=datos['resultados'][0]['id_registro'])
+        self.assertEqual(registro.fecha_registro, timezone.localtime().date())
+
+    def test_csrf_solo_se_omite_con_clave_de_kiosco(self):
+        cliente = Client(enforce_csrf_checks=True)
+        ayer = timezone.localtime() - timedelta(days=1)
+        self.assertEqual(self.enviar(ayer, "clave-kiosco", cliente).status_code, 200)
+        self.assertEqual(self.enviar(ayer, "otra-clave", cliente).status_code, 403)
+        self.assertEqual(self.enviar(ayer, None, cliente).status_code, 403)
+
+    def test_descripcion_no_texto(self):
+        datos = self.resultado(timezone.localtime(), descripcion={'texto': "x"})
+        self.assertEqual(datos['creados'], 0)
+        self.assertIn("descripcion", datos['resultados'][0]['message'])
+
+    def test_empleado_id_bool_o_decimal(self):
+        for valor in (True, float(self.empleado.id_empleado), "1.5", None):
+            with self.subTest(empleado_id=valor):
+                datos = self.resultado(timezone.localtime(), empleado_id=valor)
+                self.assertEqual(datos['creados'], 0)
+                self.assertEqual(datos['resultados'][0]['message'], "empleado_id requerido.")
+        datos = self.resultado(timezone.localtime(), empleado_id=str(self.empleado.id_empleado))
+        self.assertEqual(datos['creados'], 1)
+
+
+class CacheFingerprintTests(DatosAsistenciaMixin, TestCase):
+
+    def version(self):
+        return VersionCompartida.objects.filter(clave=DispositivoEmpleado.VERSION_CACHE).values_list('version', flat=True).first() or 0
+
+    def llamar(self, vista, datos):
+        request = RequestFactory().post('/', json.dumps(datos), content_type='application/json')
+        return async_to_sync(vista)(request) if iscoroutinefunction(vista) else vista(request)
+
+    def test_vincular_y_desvincular_invalidan_una_vez(self):
+        for vincular, desvincular in ((views.api_vincular_fingerprint, views.api_desvincular_fingerprint),
+                                      (views_async.api_vincular_fingerprint, views_async.api_desvincular_fingerprint)):
+            with self.subTest(vista=vincular.__module__):
+                # Entrada negativa en caché antes de vincular
+                self.assertIsNone(DispositivoEmpleado.obtener_empleado_por_fingerprint("fp-1"))
+                inicial = self.version()
+                self.llamar(vincular, {'empleado_id': self.empleado.id_empleado, 'fingerprint': "fp-1"})
+                self.assertEqual(self.version(), inicial + 1)
+                self.assertEqual(DispositivoEmpleado.obtener_empleado_por_fingerprint("fp-1"), self.empleado)
+
+                self.llamar(desvincular, {'fingerprint': "fp-1"})
+                self.assertEqual(self.version(), inicial + 2)
+                self.assertIsNone(DispositivoEmpleado.obtener_empleado_por_fingerprint("fp-1"))
+
+
+class IndiceSedesTests(SimpleTestCase):
+    """La grilla debe dar siempre lo mismo que recorrer todas las sedes."""
+
+    def fuerza_bruta(self, sedes, lat, lon):
+        return next(
+            (sede for sede in sedes if calcular_distancia_geografica(lat, lon, sede['lat'], sede['lon']) <= sede['radio']),
+            None,
+        )
+
+    def comparar(self, sedes, puntos):
+        indice = IndiceSedes(sedes)
+        esperado = [self.fuerza_bruta(sedes, lat, lon) for lat, lon in puntos]
+        nombres = [sede['nombre'] if sede else None for sede in esperado]
+        por_punto = [indice.sede_para(lat, lon) for lat, lon in puntos]
+        self.assertEqual([sede.nombre if sede else None for sede in por_punto], nombres)
+        self.assertEqual([sede.nombre if sede else None for sede in indice.sedes_para_puntos(puntos)], nombres)
+        return indice
+
+    def alrededor(self, azar, sede, n):
+        """Puntos a distancias entre 0 y 1.2 radios, muchos cerca del borde."""
+        puntos = []
+        radio_grados = sede['radio'] / METROS_POR_GRADO
+        for _ in range(n):
+            distancia = radio_grados * azar.choice([azar.uniform(0, 1.2), azar.uniform(0.98, 1.02)])
+            rumbo = azar.uniform(0, 2 * math.pi)
+            lat1, lon1, d = math.radians(sede['lat']), math.radians(sede['lon']), math.radians(distancia)
+            lat2 = math.asin(math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(rumbo))
+            lon2 = lon1 + math.atan2(math.sin(rumbo) * math.sin(d) * math.cos(lat1), math.cos(d) - math.sin(lat1) * math.sin(lat2))
+            puntos.append((math.degrees(lat2), (math.degrees(lon2) + 180) % 360 - 180))
+        return puntos
+
+    def test_coincide_con_fuerza_bruta(self):
+        azar = random.Random(9)
+        sedes = [
+            {'nombre': f"s{n}", 'lat': azar.uniform(-60, 60), 'lon': azar.uniform(-180, 180),
+             'radio': azar.choice([50, 300, 500, 2000])}
+            for n in range(300)
+        ]
+        # Sedes agrupadas para que haya solapamientos y celdas con varias candidatas
+        sedes += [{'nombre': f"lima{n}", 'lat': -12.08 + azar.uniform(-0.02, 0.02),
+                   'lon': -76.99 + azar.uniform(-0.02, 0.02), 'radio': 800} for n in range(40)]
+        puntos = [punto for sede in sedes for punto in self.alrededor(azar, sede, 10)]
+        puntos += [(azar.uniform(-90, 90), azar.uniform(-180, 180)) for _ in range(1000)]
+        self.comparar(sedes, puntos)
+
+    def test_bordes_de_celda(self):
+        sedes = [{'nombre': "centro", 'lat': 0.0, 'lon': 0.0, 'radio': 1000},
+                 {'nombre': "lima", 'lat': -12.08, 'lon': -76.99, 'radio': 500}]
+        indice = IndiceSedes(sedes)
+        lado = indice.tamano_celda
+        puntos = [
+            (i * lado + desvio, j * lado + desvio)
+            for i in range(-2, 3) for j in range(-2, 3) for desvio in (-1e-9, 0.0, 1e-9)
+        ]
+        puntos += [punto for sede in sedes for punto in self.alrededor(random.Random(1), sede, 200)]
+        self.comparar(sedes, puntos)
+
+    def test_antimeridiano(self):
+        sedes = [{'nombre': "fiyi", 'lat': -16.5, 'lon': 179.999, 'radio': 2000},
+                 {'nombre': "chukotka", 'lat': 65.0, 'lon': -179.995, 'radio': 1500}]
+        puntos = [punto for sede in sedes for punto in self.alrededor(random.Random(2), sede, 500)]
+        puntos += [(-16.5, -179.99), (-16.5, 180.0), (-16.5, -180.0), (65.0, 179.99)]
+        self.comparar(sedes, puntos)
+        self.assertEqual(IndiceSedes(sedes).sede_para(-16.5, -179.995).nombre, "fiyi")
+
+    def test_polos(self):
+        sedes = [{'nombre': "norte", 'lat': 89.9999, 'lon': 10.0, 'radio': 500},
+                 {'nombre': "sur", 'lat': -89.999, 'lon': -120.0, 'radio': 300},
+                 {'nombre': "artico", 'lat': 89.5, 'lon': 179.9, 'radio': 400}]
+        azar = random.Random(3)
+        puntos = [punto for sede in sedes for punto in self.alrededor(azar, sede, 500)]
+        puntos += [(90.0, lon) for lon in (-180.0, -45.0, 0.0, 135.0)] + [(-90.0, 0.0)]
+        indice = self.comparar(sedes, puntos)
+        # Las sedes que abarcan todas las longitudes se guardan una vez por fila, no por columna
+        self.assertLess(sum(len(candidatas) for candidatas in indice._celdas.values()), 100)
+        self.assertEqual(indice.sede_para(90.0, -170.0).nombre, "norte")
+
+
+class ExcelStreamingTests(SimpleTestCase):
+    """El .xlsx armado a mano debe abrirse con openpyxl como cualquier otro libro."""
+
+    encabezados = ["Empleado", "Fecha", "Horas", "Nota"]
+
+    def abrir(self, filas, **opciones):
+        bloques = list(generar_xlsx_streaming("Asistencia", self.encabezados, filas, [20, 12, 8, 30], **opciones))
+        return bloques, openpyxl.load_workbook(BytesIO(b''.join(bloques)))
+
+    def test_libro_con_filas(self):
+        # Notas poco comprimibles para que el archivo salga en varios bloques
+        filas = [[f"Empleado {n}", "2025-03-03", n, f"{n * 2654435761 % 2 ** 32:08x}"] for n in range(1, 3001)]
+        filas[0][3] = "  <Ñandú> & \"comillas\"\x07"
+        bloques, libro = self.abrir(filas, nombre_tabla="TablaAsistencia", tamano_bloque=1024)
+        self.assertGreater(len(bloques), 2)
+        hoja = libro["Asistencia"]
+        self.assertEqual(hoja.max_row, 3001)
+        self.assertEqual([celda.value for celda in hoja[1]], self.encabezados)
+        self.assertEqual([celda.value for celda in hoja[2]], ["Empleado 1", "2025-03-03", 1, "  <Ñandú> & \"comillas\""])
+        self.assertEqual(hoja.cell(row=3001, column=3).value, 3000)
+        self.assertEqual(hoja.column_dimensions["A"].width, 20)
+        self.assertEqual(hoja.tables["TablaAsistencia"].ref, "A1:D3001")
+
+    def test_libro_vacio(self):
+        _, libro = self.abrir([], nombre_tabla="TablaAsistencia")
+        hoja = libro["Asistencia"]
+        self.assertEqual(hoja.max_row, 1)
+        self.assertEqual([celda.value for celda in hoja[1]], self.encabezados)
+        self.assertEqual(len(hoja.tables), 0)
+
+
+class ExportacionesMixin(DatosAsistenciaMixin):
+    """Caché de exportaciones en un directorio temporal y un usuario staff con sesión."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        configuracion = override_settings(EXPORT_CACHE_ACTIVA=True, EXPORT_CACHE_DIR=directorio.name)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        self.usuario = User.objects.create_user("admin", password="x", is_staff=True)
+        self.client.force_login(self.usuario)
+        self.registro = self.registrar("Entrada", date(2025, 3, 3), time(8, 0))
+
+    def ejecutar(self, trabajo):
+        """exportaciones.ejecutar sin cerrar la conexión de la transacción de la prueba."""
+        with mock.patch.object(exportaciones, 'close_old_connections'), \
+                mock.patch.object(exportaciones, 'connection'):
+            exportaciones.ejecutar(trabajo.pk)
+        trabajo.refresh_from_db()
+        return trabajo
+
+
+class CacheExportacionesTests(ExportacionesMixin, TestCase):
+
+    def descargar(self, etag=None):
+        cabeceras = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        response = self.client.get(reverse('descargar_excel'), {'formato': 'csv'}, **cabeceras)
+        contenido = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, contenido
+
+    def test_etag_responde_304_mientras_los_datos_no_cambian(self):
+        primera, contenido = self.descargar()
+        self.assertEqual(primera.status_code, 200)
+        self.assertIn("Núñez".encode('utf-8'), contenido)
+
+        revalidada, _ = self.descargar(primera['ETag'])
+        self.assertEqual(revalidada.status_code, 304)
+        self.assertEqual(revalidada['ETag'], primera['ETag'])
+
+        # La segunda descarga sin ETag sale del archivo en caché
+        desde_cache, contenido_cache = self.descargar()
+        self.assertEqual(desde_cache.status_code, 200)
+        self.assertEqual(contenido_cache, contenido)
+
+    def test_etag_cambia_al_editar_registros(self):
+        primera, _ = self.descargar()
+        self.registro.hora_registro = time(8, 30)
+        self.registro.save()
+
+        nueva, contenido = self.descargar(primera['ETag'])
+        self.assertEqual(nueva.status_code, 200)
+        self.assertNotEqual(nueva['ETag'], primera['ETag'])
+        self.assertIn(b"08:30", contenido)
+        self.assertEqual(self.descargar(nueva['ETag'])[0].status_code, 304)
+
+    def test_desalojo_por_tamano(self):
+        with override_settings(EXPORT_CACHE_MAX_BYTES=250):
+            for n, clave in enumerate(["a", "b"]):
+                list(cache_exportaciones.guardar_mientras(clave, [b"x" * 100]))
+                os.utime(self.directorio / f"{clave}{cache_exportaciones.EXTENSION}", (1000 + n, 1000 + n))
+            # "a" es el más antiguo pero se acaba de leer: al pasar el límite sale "b"
+            self.assertIsNotNone(cache_exportaciones.obtener("a"))
+            list(cache_exportaciones.guardar_mientras("c", [b"x" * 100]))
+        self.assertIsNone(cache_exportaciones.obtener("b"))
+        self.assertIsNotNone(cache_exportaciones.obtener("a"))
+        self.assertIsNotNone(cache_exportaciones.obtener("c"))
+        tamanos = [ruta.stat().st_size for ruta in self.directorio.glob(f"*{cache_exportaciones.EXTENSION}")]
+        self.assertLessEqual(sum(tamanos), 250)
+
+    def test_trabajo_terminado_queda_en_cache(self):
+        filtros = FiltrosReporte()
+        trabajo = self.ejecutar(exportaciones.encolar('asistencia', filtros, self.usuario, 'csv'))
+        self.assertEqual(trabajo.estado, TrabajoExportacion.TERMINADO)
+        clave = cache_exportaciones.clave('asistencia', 'csv', filtros, cache_exportaciones.marca_de_agua(filtros))
+        self.assertEqual(cache_exportaciones.obtener(clave).read_bytes(), Path(trabajo.archivo).read_bytes())
+
+        # La descarga directa con los mismos filtros responde desde ese archivo
+        response, contenido = self.descargar()
+        self.assertEqual(response['ETag'], f'"{clave}"')
+        self.assertEqual(contenido, Path(trabajo.archivo).read_bytes())
+
+
+class TrabajosExportacionTests(ExportacionesMixin, TestCase):
+
+    def crear(self, **campos):
+        return TrabajoExportacion.objects.create(
+            tipo='asistencia', formato='csv', nombre_archivo="registro_asistencia.csv", usuario=self.usuario, **campos
+        )
+
+    def test_ejecutar_genera_el_archivo_y_el_avance(self):
+        trabajo = self.ejecutar(exportaciones.encolar('asistencia', FiltrosReporte(), self.usuario, 'csv'))
+        self.assertEqual(trabajo.estado, TrabajoExportacion.TERMINADO)
+        self.assertEqual((trabajo.filas_procesadas, trabajo.filas_totales, trabajo.porcentaje), (1, 1, 100))
+        esperado = b"".join(exportaciones.generar('asistencia', FiltrosReporte(), 'csv'))
+        self.assertEqual(Path(trabajo.archivo).read_bytes(), esperado)
+
+    def test_ejecutar_registra_el_error(self):
+        with mock.patch.object(exportaciones, 'generar', side_effect=RuntimeError("disco lleno")):
+            trabajo = self.ejecutar(self.crear())
+        self.assertEqual(trabajo.estado, TrabajoExportacion.ERROR)
+        self.assertEqual(trabajo.error, "disco lleno")
+        self.assertIsNotNone(trabajo.terminado)
+
+    def test_reclamar_solo_una_vez(self):
+        trabajo = self.crear()
+        self.assertEqual(exportaciones._reclamar(trabajo.pk), 1)
+        self.assertEqual(exportaciones._reclamar(trabajo.pk), 0)
+        # Otro hilo o proceso que llegue después no lo vuelve a generar
+        with mock.patch.object(exportaciones, 'generar') as generar:
+            trabajo = self.ejecutar(trabajo)
+        generar.assert_not_called()
+        self.assertEqual(trabajo.estado, TrabajoExportacion.EN_PROCESO)
+
+    @override_settings(EXPORT_JOBS_ESTANCADO_MINUTOS=10)
+    def test_recuperar_huerfanos(self):
+        hace_rato = timezone.now() - timedelta(minutes=15)
+        estancado = self.crear(estado=TrabajoExportacion.EN_PROCESO, ultimo_avance=hace_rato)
+        activo = self.crear(estado=TrabajoExportacion.EN_PROCESO, ultimo_avance=timezone.now())
+        pendiente = self.crear()
+        TrabajoExportacion.objects.filter(pk=pendiente.pk).update(creado=hace_rato)
+
+        with override_settings(EXPORT_JOBS_EN_WEB=False):
+            # procesar_exportaciones tomará el pendiente: no es huérfano
+            self.assertEqual(exportaciones.recuperar_huerfanos(), 1)
+        with override_settings(EXPORT_JOBS_EN_WEB=True):
+            self.assertEqual(exportaciones.recuperar_huerfanos(), 1)
+
+        estados = dict(TrabajoExportacion.objects.values_list('pk', 'estado'))
+        self.assertEqual(estados[estancado.pk], TrabajoExportacion.ERROR)
+        self.assertEqual(estados[activo.pk], TrabajoExportacion.EN_PROCESO)
+        self.assertEqual(estados[pendiente.pk], TrabajoExportacion.ERROR)
+
+    def test_solo_el_propietario_consulta_y_descarga(self):
+        trabajo = self.ejecutar(self.crear())
+        urls = [reverse('api_estado_exportacion', args=[trabajo.pk]), reverse('descargar_exportacion', args=[trabajo.pk])]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+
+        otro = Client()
+        otro.force_login(User.objects.create_user("otro", password="x", is_staff=True))
+        for url in urls:
+            self.assertEqual(otro.get(url).status_code, 404)
+
+
+class ImagenQrTests(DatosAsistenciaMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("admin", password="x", is_staff=True))
+
+    def url(self, empleado, formato="svg"):
+        return reverse('imagen_qr_empleado', args=[empleado.id_empleado, formato])
+
+    def test_sin_codigo_responde_404_sin_asignarlo(self):
+        sin_codigo = Empleado.objects.create(nombres="Luis", apellidos="Paz")
+        self.assertEqual(self.client.get(self.url(sin_codigo)).status_code, 404)
+        sin_codigo.refresh_from_db()
+        self.assertIsNone(sin_codigo.codigo_qr)
+
+    def test_con_codigo_responde_imagen_y_304(self):
+        self.empleado.generar_codigo_qr()
+        response = self.client.get(self.url(self.empleado))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], QRService.FORMATOS_IMAGEN["svg"])
+        revalidada = self.client.get(self.url(self.empleado), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidada.status_code, 304)
+
+
+class PdfCredencialesTests(SimpleTestCase):
+    """Estructura del PDF escrito a mano: xref, trailer y árbol de páginas."""
+
+    def leer(self, cantidad):
+        credenciales = [(f"Empleado {n}", f"http://127.0.0.1:8000/qr/{n:08d}/") for n in range(cantidad)]
+        return b"".join(generar_pdf(credenciales))
+
+    def comprobar(self, pdf, paginas):
+        self.assertTrue(pdf.startswith(b"%PDF-1.4\n"))
+        self.assertTrue(pdf.endswith(b"%%EOF\n"))
+        inicio_xref = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", pdf).group(1))
+        self.assertEqual(pdf[inicio_xref:inicio_xref + 5], b"xref\n")
+
+        encabezado = re.match(rb"xref\n0 (\d+)\n", pdf[inicio_xref:])
+        total = int(encabezado.group(1))
+        entradas = pdf[inicio_xref + encabezado.end():].split(b"trailer")[0]
+        filas = [entradas[i:i + 20] for i in range(0, len(entradas), 20)]
+        self.assertEqual(len(filas), total)
+        self.assertEqual(filas[0], b"0000000000 65535 f \n")
+        for numero, fila in enumerate(filas[1:], start=1):
+            desplazamiento = int(fila[:10])
+            self.assertTrue(pdf[desplazamiento:].startswith(b"%d 0 obj\n" % numero), numero)
+        self.assertEqual(int(re.search(rb"trailer\n<< /Size (\d+) /Root 1 0 R >>", pdf).group(1)), total)
+
+        arbol = re.search(rb"2 0 obj\n<< /Type /Pages /Kids \[([^\]]*)\] /Count (\d+) >>", pdf)
+        hijos = [int(hijo) for hijo in re.findall(rb"(\d+) 0 R", arbol.group(1))]
+        self.assertEqual(int(arbol.group(2)), paginas)
+        self.assertEqual(len(hijos), paginas)
+        for hijo in hijos:
+            desplazamiento = int(filas[hijo][:10])
+            self.assertTrue(pdf[desplazamiento:].startswith(b"%d 0 obj\n<< /Type /Page /Parent 2 0 R" % hijo))
+
+        # Cada imagen descomprime a una página completa en escala de grises
+        for ancho, alto, largo, inicio in [
+            (int(m.group(1)), int(m.group(2)), int(m.group(3)), m.end())
+            for m in re.finditer(rb"/Width (\d+) /Height (\d+) .*?/Length (\d+) >>\nstream\n", pdf)
+        ]:
+            self.assertEqual(len(zlib.decompress(pdf[inicio:inicio + largo])), ancho * alto)
+
+    def test_varias_paginas(self):
+        por_pagina = credenciales.COLUMNAS * credenciales.FILAS
+        self.comprobar(self.leer(2 * por_pagina + 1), 3)
+
+    def test_sin_credenciales_una_pagina(self):
+        self.comprobar(self.leer(0), 1)
+
+
+class TokensQrTests(DatosAsistenciaMixin, TestCase):
+
+    def setUp(self):
+        self.empleado.generar_codigo_qr()
+        Empleado.invalidar_cache_qr()
+        self.token = tokens_qr.crear(self.empleado.id_empleado, self.empleado.codigo_qr)
+
+    def sin_cache(self):
+        """Vacía la caché de códigos QR y deja leída la versión compartida."""
+        Empleado.invalidar_cache_qr()
+        VersionCompartida.actual(Empleado.VERSION_CACHE_QR)
+
+    def test_token_valido_cuesta_una_consulta_sin_cache_y_ninguna_con_cache(self):
+        self.sin_cache()
+        with self.assertNumQueries(1):
+            self.assertEqual(Empleado.buscar_por_codigo_qr(self.token), self.empleado)
+        with self.assertNumQueries(0):
+            self.assertEqual(Empleado.buscar_por_codigo_qr(self.token), self.empleado)
+
+    def test_firma_falsificada(self):
+        valor, firma = self.token.split(tokens_qr.SEPARADOR)
+        falsos = [
+            f"{valor}{tokens_qr.SEPARADOR}{firma[:-1]}{'A' if firma[-1] != 'A' else 'B'}",
+            # Otro empleado con la firma del primero
+            f"{self.empleado.id_empleado + 1}{valor[valor.index('.'):]}{tokens_qr.SEPARADOR}{firma}",
+        ]
+        self.sin_cache()
+        for falso in falsos:
+            with self.subTest(token=falso), self.assertNumQueries(0):
+                self.assertIsNone(Empleado.buscar_por_codigo_qr(falso))
+
+    def test_version_de_clave_revocada(self):
+        with override_settings(QR_TOKEN_VERSION=2):
+            self.sin_cache()
+            with self.assertNumQueries(0):
+                self.assertIsNone(Empleado.buscar_por_codigo_qr(self.token))
+            nuevo = tokens_qr.crear(self.empleado.id_empleado, self.empleado.codigo_qr)
+            self.assertEqual(Empleado.buscar_por_codigo_qr(nuevo), self.empleado)
+        self.assertIsNone(Empleado.buscar_por_codigo_qr(nuevo))
+
+    def test_sello_vencido_tras_revocar(self):
+        otro = Empleado.objects.create(nombres="Luis", apellidos="Paz")
+        otro.generar_codigo_qr()
+        token_otro = tokens_qr.crear(otro.id_empleado, otro.codigo_qr)
+        # En caché antes de revocar: la señal post_save debe descartarlo
+        self.assertEqual(Empleado.buscar_por_codigo_qr(self.token), self.empleado)
+        codigo_anterior = self.empleado.codigo_qr
+
+        salida = StringIO()
+        with tempfile.TemporaryDirectory() as directorio, \
+                mock.patch.object(QRService, '_directorio_qr', return_value=directorio):
+            call_command('generar_qr', '--revocar', str(self.empleado.id_empleado), '--procesos', '1', stdout=salida)
+        self.assertIn("Reimprime las credenciales", salida.getvalue())
+
+        self.empleado.refresh_from_db()
+        self.assertNotEqual(self.empleado.codigo_qr, codigo_anterior)
+        self.assertIsNone(Empleado.buscar_por_codigo_qr(self.token))
+        self.assertIsNone(Empleado.buscar_por_codigo_qr(codigo_anterior))
+        nuevo = tokens_qr.crear(self.empleado.id_empleado, self.empleado.codigo_qr)
+        self.assertEqual(Empleado.buscar_por_codigo_qr(nuevo), self.empleado)
+        self.assertEqual(Empleado.buscar_por_codigo_qr(token_otro), otro)
+
+    def test_codigo_qr_que_no_es_texto(self):
+        for valor in (12345, 1.5, True, ["EMP1"], {"codigo": "EMP1"}, None):
+            with self.subTest(valor=valor):
+                self.assertIsNone(Empleado.buscar_por_codigo_qr(valor))
+                self.assertIsNone(async_to_sync(Empleado.abuscar_por_codigo_qr)(valor))
+                self.assertFalse(tokens_qr.es_token(valor))
+        response = self.client.post(
+            reverse('api_buscar_empleado_qr'), json.dumps({'codigo_qr': 12345}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class IdentificacionLoteTests(DatosAsistenciaMixin, TestCase):
+
+    def setUp(self):
+        self.empleado.generar_codigo_qr()
+        self.otro = Empleado.objects.create(nombres="Luis", apellidos="Paz")
+        self.otro.generar_codigo_qr()
+        Empleado.invalidar_cache_qr()
+        DispositivoEmpleado.invalidar_cache_fingerprint()
+
+    def sin_cache(self):
+        Empleado.invalidar_cache_qr()
+        DispositivoEmpleado.invalidar_cache_fingerprint()
+        VersionCompartida.actual(Empleado.VERSION_CACHE_QR)
+
+    def buscar(self, codigos):
+        return self.client.post(
+            reverse('api_buscar_empleados_qr'), json.dumps({'codigos_qr': codigos}), content_type='application/json'
+        )
+
+    def test_limite_de_codigos_por_envio(self):
+        limite = QRService.LOTE_MAX_IDENTIFICACIONES
+        codigos = [f"NOEXISTE{n}" for n in range(limite)]
+        self.assertEqual(self.buscar(codigos).status_code, 200)
+        response = self.buscar(codigos + ["NOEXISTE-extra"])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(limite), response.json()['error'])
+        # El límite se aplica después de quitar duplicados
+        self.assertEqual(self.buscar(codigos + codigos[:10]).status_code, 200)
+
+    def test_duplicados_se_resuelven_una_vez(self):
+        codigo = self.empleado.codigo_qr
+        self.sin_cache()
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.buscar([codigo, "NOEXISTE", codigo, "NOEXISTE"])
+        datos = response.json()
+        self.assertEqual(list(datos['empleados']), [codigo, "NOEXISTE"])
+        self.assertEqual(datos['encontrados'], 1)
+        self.assertEqual(len([c for c in consultas if 'app_empleado' in c['sql']]), 1)
+
+    def test_tokens_y_codigos_antiguos_en_una_consulta(self):
+        token = tokens_qr.crear(self.empleado.id_empleado, self.empleado.codigo_qr)
+        vencido = tokens_qr.crear(self.otro.id_empleado, "codigo-anterior")
+        valor, firma = token.split(tokens_qr.SEPARADOR)
+        falsificado = f"{valor}{tokens_qr.SEPARADOR}{firma[::-1]}"
+        codigos = [token, self.otro.codigo_qr, vencido, falsificado, "NOEXISTE"]
+        esperado = [self.empleado, self.otro, None, None, None]
+
+        self.sin_cache()
+        with CaptureQueriesContext(connection) as consultas:
+            encontrados = Empleado.buscar_varios_por_codigo_qr(codigos)
+        self.assertEqual(list(encontrados.values()), esperado)
+        self.assertEqual(len(consultas), 1)
+        self.assertIn("codigo_qr", consultas[0]['sql'])
+        self.assertIn("id_empleado", consultas[0]['sql'])
+
+        self.sin_cache()
+        with CaptureQueriesContext(connection) as consultas:
+            encontrados = async_to_sync(Empleado.abuscar_varios_por_codigo_qr)(codigos)
+        self.assertEqual(list(encontrados.values()), esperado)
+        self.assertEqual(len(consultas), 1)
+
+    def test_entradas_negativas(self):
+        self.sin_cache()
+        Empleado.buscar_varios_por_codigo_qr(["NOEXISTE", self.empleado.codigo_qr])
+        with self.assertNumQueries(0):
+            encontrados = Empleado.buscar_varios_por_codigo_qr(["NOEXISTE", self.empleado.codigo_qr])
+        self.assertEqual(list(encontrados.values()), [None, self.empleado])
+
+        DispositivoEmpleado.objects.create(fingerprint="fp-vinculado", empleado=self.empleado)
+        DispositivoEmpleado.obtener_empleados_por_fingerprint(["fp-vinculado", "fp-libre"])
+        VersionCompartida.actual(DispositivoEmpleado.VERSION_CACHE)
+        with self.assertNumQueries(0):
+            encontrados = DispositivoEmpleado.obtener_empleados_por_fingerprint(["fp-vinculado", "fp-libre"])
+        self.assertEqual(encontrados, {"fp-vinculado": self.empleado, "fp-libre": None})
+
+    def test_cache_obtener_varios(self):
+        cache = CacheLRU(maxsize=10, ttl=60, ttl_negativo=5)
+        cargas = []
+
+        def cargar_varios(claves):
+            cargas.append(list(claves))
+            return {clave: clave.upper() for clave in claves if clave.startswith("si")}
+
+        self.assertEqual(cache.obtener_varios(["si1", "no1", "si2"], cargar_varios), {"si1": "SI1", "no1": None, "si2": "SI2"})
+        # Las ausentes quedan como entradas negativas: solo se carga la nueva
+        self.assertEqual(cache.obtener_varios(["no1", "si1", "no2"], cargar_varios), {"no1": None, "si1": "SI1", "no2": None})
+        self.assertEqual(cargas, [["si1", "no1", "si2"], ["no2"]])
+
+        # Las negativas vencen antes (ttl_negativo) que las positivas
+        despues = cache_local.time.monotonic() + 10
+        with mock.patch.object(cache_local.time, 'monotonic', return_value=despues):
+            self.assertEqual(cache.obtener_varios(["no1", "si1"], cargar_varios), {"no1": None, "si1": "SI1"})
+        self.assertEqual(cargas[-1], ["no1"])
@@ -0,0 +1,68 @@
+"""
+Tokens QR firmados: ID de empleado + versión de clave + sello de Empleado.codigo_qr
++ HMAC (django.core.signing). Se verifican solo con CPU; un QR falsificado o emitido
+con una versión de clave anterior se rechaza sin consultar la base de datos.
+El sello permite revocar la credencial de un solo empleado regenerando su codigo_qr;
+comprobarlo requiere el empleado, que sale de la caché de Empleado o, si no está,
+de una consulta por clave primaria.
+Los códigos antiguos (Empleado.codigo_qr) siguen funcionando y se distinguen porque
+no contienen ':'.
+"""
+
+import hashlib
+from django.conf import settings
+from django.core import signing
+
+SAL = 'app.qr.empleado'
+SEPARADOR = ':'  # Separador de signing.Signer; nunca aparece en Empleado.codigo_qr
+
+
+def _firmante():
+    return signing.Signer(salt=SAL, sep=SEPARADOR)
+
+
+def activos():
+    """Retorna True si los QR nuevos deben llevar token firmado en lugar de codigo_qr."""
+    return getattr(settings, 'QR_TOKENS_FIRMADOS', False)
+
+
+def es_token(codigo):
+    """Distingue un token firmado de un codigo_qr antiguo (un valor que no es texto no es token)."""
+    return isinstance(codigo, str) and SEPARADOR in codigo
+
+
+def sello(codigo_qr):
+    """Huella corta del codigo_qr vigente del empleado; cambia al regenerarlo."""
+    return hashlib.sha256(codigo_qr.encode('utf-8')).hexdigest()[:8]
+
+
+def crear(id_empleado, codigo_qr):
+    """
+    Token firmado para un empleado con la versión de clave vigente (QR_TOKEN_VERSION).
+
+    Args:
+        id_empleado: ID del empleado
+        codigo_qr: Empleado.codigo_qr vigente (se incluye solo su sello)
+
+    Returns:
+        str: '<id>.<versión>.<sello>:<firma>'
+    """
+    return _firmante().sign(f"{id_empleado}.{settings.QR_TOKEN_VERSION}.{sello(codigo_qr)}")
+
+
+def verificar(token):
+    """
+    Verifica la firma y la versión de clave de un token.
+    El sello se compara después con el codigo_qr del empleado (ver Empleado.buscar_por_codigo_qr).
+
+    Returns:
+        tuple: (ID del empleado, sello), o None si la firma no es válida o la versión fue revocada
+    """
+    try:
+        valor = _firmante().unsign(token)
+    except signing.BadSignature:
+        return None
+    partes = valor.split('.')
+    if len(partes) != 3 or partes[1] != str(settings.QR_TOKEN_VERSION) or not partes[0].isdigit():
+        return None
+    return int(partes[0]), partes[2]
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_async
+
+# Endpoints JSON de identificación: versión asíncrona al servir por ASGI (API_ASYNC)
+api = views_async if settings.API_ASYNC else views
 
 urlpatterns = [
     # Página principal
@@ -14,17 +18,29 @@ urlpatterns = [
     # Sistema de QR por empleado (existente)
     path('qr/', views.escanear_qr, name='escanear_qr'),
     path('qr/<str:codigo_qr>/', views.registrar_asistencia_qr, name='registrar_asistencia_qr'),
-    path('api/buscar-empleado-qr/', views.api_buscar_empleado_qr, name='api_buscar_empleado_qr'),
+    path('api/buscar-empleado-qr/', api.api_buscar_empleado_qr, name='api_buscar_empleado_qr'),
+    path('api/buscar-empleados-qr/', api.api_buscar_empleados_qr, name='api_buscar_empleados_qr'),
 
     # QR general: auto-identificación por dispositivo
     path('auto/', views.identificar_dispositivo, name='identificar_dispositivo'),
     path('auto/empleado/<int:empleado_id>/', views.registrar_asistencia_auto, name='registrar_asistencia_auto'),
-    path('api/identificar-fingerprint/', views.api_identificar_por_fingerprint, name='api_identificar_por_fingerprint'),
-    path('api/vincular-fingerprint/', views.api_vincular_fingerprint, name='api_vincular_fingerprint'),
-    path('api/desvincular-fingerprint/', views.api_desvincular_fingerprint, name='api_desvincular_fingerprint'),
+    path('api/identificar-fingerprint/', api.api_identificar_por_fingerprint, name='api_identificar_por_fingerprint'),
+    path('api/identificar-fingerprints/', api.api_identificar_por_fingerprints, name='api_identificar_por_fingerprints'),
+    path('api/vincular-fingerprint/', api.api_vincular_fingerprint, name='api_vincular_fingerprint'),
+    path('api/desvincular-fingerprint/', api.api_desvincular_fingerprint, name='api_desvincular_fingerprint'),
+    path('api/registrar-lote/', views.api_registrar_asistencia_lote, name='api_registrar_asistencia_lote'),
+    path('api/estadisticas-cache/', views.api_estadisticas_cache, name='api_estadisticas_cache'),
+    path('api/estadisticas-conexiones/', views.api_estadisticas_conexiones, name='api_estadisticas_conexiones'),
     
     # Reportes (solo para staff)
     path('login/descarga/', views.pagina_descarga_excel, name='pagina_descarga_excel'),
     path('login/descargar/asistencia', views.exportar_asistencia_excel, name='descargar_excel'),
     path('login/descargar/resumen/', views.exportar_resumen_excel, name='resumen_excel'),
+    path('login/descargar/mensual/', views.exportar_resumen_mensual_excel, name='resumen_mensual_excel'),
+    path('login/descargar/por-empleado/', views.exportar_paquete_empleados, name='paquete_empleados'),
+    path('login/qr/<int:empleado_id>.<str:formato>', views.imagen_qr_empleado, name='imagen_qr_empleado'),
+    path('login/qr/credenciales.pdf', views.credenciales_qr, name='credenciales_qr'),
+    path('login/exportaciones/', views.api_crear_exportacion, name='api_crear_exportacion'),
+    path('login/exportaciones/<uuid:trabajo_id>/', views.api_estado_exportacion, name='api_estado_exportacion'),
+    path('login/exportaciones/<uuid:trabajo_id>/descargar/', views.descargar_exportacion, name='descargar_exportacion'),
 ]
@@ -5,6 +5,7 @@ Funciones auxiliares que pueden ser reutilizadas.
 
 from datetime import datetime, timedelta
 from django.utils import timezone
+from .catalogo import CatalogoTipos
 
 
 def obtener_fecha_hora_actual():
@@ -81,9 +82,9 @@ def obtener_tipos_asistencia_unicos():
     Retorna la lista de tipos de asistencia que solo pueden registrarse una vez por día.
     
     Returns:
-        list: Lista de nombres de tipos únicos
+        list: Lista de nombres de tipos únicos (según el catálogo en memoria)
     """
-    return ['Entrada', 'Inicio Almuerzo', 'Fin Almuerzo', 'Salida']
+    return [tipo.nombre_asistencia for tipo in CatalogoTipos.listar() if tipo.es_tipo_unico]
 
 
 def obtener_tipos_asistencia_con_descripcion():
@@ -91,6 +92,6 @@ def obtener_tipos_asistencia_con_descripcion():
     Retorna la lista de tipos de asistencia que requieren descripción adicional.
     
     Returns:
-        list: Lista de nombres de tipos con descripción
+        list: Lista de nombres de tipos con descripción (según el catálogo en memoria)
     """
-    return ['Entrada por otros', 'Salida por otros']
+    return [tipo.nombre_asistencia for tipo in CatalogoTipos.listar() if tipo.requiere_descripcion]
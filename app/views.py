@@ -1,17 +1,19 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.views.decorators.http import require_http_methods
 from django.urls import reverse
-from .models import Empleado, TipoAsistencia, RegistroAsistencia, DispositivoEmpleado, ActividadProyecto
+from .models import Empleado, DispositivoEmpleado, ActividadProyecto, TrabajoExportacion
 from .services import AsistenciaService, ReporteService
 from .qr_service import QRService
+from .catalogo import CatalogoTipos
+from . import cache_exportaciones, conexiones, exportaciones
 from .utils import obtener_fecha_hora_actual
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Border, Side
-from openpyxl.worksheet.table import Table, TableStyleInfo
 import json
 
 
@@ -32,187 +34,226 @@ def pagina_descarga_excel(request):
     """
     Página para descargar reportes de Excel.
     Solo accesible para usuarios staff.
+    Por defecto propone el mes en curso como rango de fechas.
     """
-    return render(request, 'pagina_descarga_excel.html')
+    hoy = obtener_fecha_hora_actual()[0]
+    return render(request, 'pagina_descarga_excel.html', {
+        'empleados': Empleado.objects.order_by('apellidos', 'nombres'),
+        'tipos': CatalogoTipos.listar(),
+        'desde': hoy.replace(day=1).strftime('%Y-%m-%d'),
+        'hasta': hoy.strftime('%Y-%m-%d'),
+    })
+
+
+def _respuesta_exportacion(request, tipo, formato, filtros):
+    """
+    Respuesta de descarga de un reporte.
+    Con EXPORT_CACHE_ACTIVA se sirve desde la caché en disco si los datos no cambiaron
+    (marca de agua) y responde 304 si el navegador ya tiene esa versión (ETag).
+
+    Args:
+        request: Petición HTTP
+        tipo: Clave de exportaciones.REPORTES
+        formato: Clave de exportaciones.FORMATOS
+        filtros: FiltrosReporte aplicados
+    """
+    nombre_archivo = exportaciones.nombre_archivo(tipo, filtros, formato)
+    content_type = exportaciones.FORMATOS[formato][1]
+
+    if not cache_exportaciones.activa():
+        response = StreamingHttpResponse(exportaciones.generar(tipo, filtros, formato), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename={nombre_archivo}'
+        return response
+
+    clave = cache_exportaciones.clave(tipo, formato, filtros, cache_exportaciones.marca_de_agua(filtros))
+    etag = f'"{clave}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        ruta = cache_exportaciones.obtener(clave)
+        if ruta:
+            response = FileResponse(open(ruta, 'rb'), content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                cache_exportaciones.guardar_mientras(clave, exportaciones.generar(tipo, filtros, formato)),
+                content_type=content_type,
+            )
+        response['Content-Disposition'] = f'attachment; filename={nombre_archivo}'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _parametros_exportacion(datos, reporte):
+    """
+    Lee el formato y los filtros de una descarga.
+    Los reportes de formato único ignoran el formato recibido.
+
+    Returns:
+        tuple: (success, message, formato, filtros)
+    """
+    formatos = exportaciones.formatos_reporte(reporte)
+    formato = formatos[0] if len(formatos) == 1 else datos.get('formato') or formatos[0]
+    if formato not in formatos:
+        return False, f"Formato no soportado: {formato}", None, None
+    valido, mensaje, filtros = ReporteService.parsear_filtros(datos)
+    return valido, mensaje, formato, filtros
 
 
 @user_passes_test(es_staff)
 def exportar_resumen_excel(request):
     """
-    Exporta un resumen diario de asistencia en formato Excel.
+    Exporta un resumen diario de asistencia en formato Excel (o CSV con ?formato=csv / csv.gz).
     Incluye Proyecto y Actividad (si existen) para la ENTRADA de ese día.
+    Acepta los filtros de fecha, empleado y tipo de pagina_descarga_excel.
     """
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Resumen Diario"
-
-    # Encabezados (sin Proyecto/Actividad mientras la funcionalidad está deshabilitada)
-    encabezados = [
-        "Empleado", "Fecha", "Tiempo de Almuerzo",
-        "Horas por Comisión", "Horas por Permiso (Otros)",
-        "Horas Trabajadas Totales"
-    ]
-    ws.append(encabezados)
-
-    # Obtener datos usando el servicio
-    datos_diarios = ReporteService.obtener_datos_resumen()
-
-    # from .models import ActividadProyecto  # DESHABILITADO: columnas de proyecto/actividad
-    # from django.utils import timezone
-
-    for (id_empleado, fecha), data in datos_diarios.items():
-        empleado = data["empleado"]
-        horas = ReporteService.calcular_horas_empleado(data)
-
-        # Columnas de proyecto/actividad deshabilitadas temporalmente
-        ws.append([
-            empleado.nombre_completo,
-            fecha.strftime("%Y-%m-%d"),
-            horas['almuerzo'],
-            horas['comision'],
-            horas['permiso'],
-            horas['trabajadas']
-        ])
-
-    # Ajustar ancho de columnas
-    for col in ws.columns:
-        max_length = max(len(str(cell.value)) for cell in col if cell.value)
-        ws.column_dimensions[col[0].column_letter].width = max_length + 2
-
-    # Aplicar estilo al encabezado
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill("solid", fgColor="4F81BD")
-    thin_border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
-    )
+    valido, mensaje, formato, filtros = _parametros_exportacion(request.GET, 'resumen')
+    if not valido:
+        messages.error(request, mensaje)
+        return redirect('pagina_descarga_excel')
 
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = thin_border
+    return _respuesta_exportacion(request, 'resumen', formato, filtros)
 
-    # Crear tabla solo si hay datos (al menos 1 fila de datos)
-    if ws.max_row > 1:
-        tabla = Table(
-            displayName="ResumenAsistencia",
-            ref=f"A1:F{ws.max_row}"
-        )
-        style = TableStyleInfo(
-            name="TableStyleMedium9", showFirstColumn=False,
-            showLastColumn=False, showRowStripes=True, showColumnStripes=False
-        )
-        tabla.tableStyleInfo = style
-        ws.add_table(tabla)
+@user_passes_test(es_staff)
+def exportar_resumen_mensual_excel(request):
+    """
+    Exporta los totales mensuales por empleado (días trabajados, horas trabajadas,
+    almuerzo, comisión, permiso y marcas faltantes) en formato Excel o CSV.
+    Se calcula con una consulta agrupada sobre ResumenDiario; acepta los filtros
+    de fecha y empleado de pagina_descarga_excel.
+    """
+    valido, mensaje, formato, filtros = _parametros_exportacion(request.GET, 'mensual')
+    if not valido:
+        messages.error(request, mensaje)
+        return redirect('pagina_descarga_excel')
 
-    # Enviar archivo
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
-    response['Content-Disposition'] = 'attachment; filename=resumen_asistencia.xlsx'
-    wb.save(response)
-    return response
+    return _respuesta_exportacion(request, 'mensual', formato, filtros)
 
 @user_passes_test(es_staff)
 def exportar_asistencia_excel(request):
     """
-    Exporta todos los registros de asistencia en formato Excel.
+    Exporta todos los registros de asistencia en formato Excel (o CSV con ?formato=csv / csv.gz).
     Incluye información detallada de cada registro.
+    El archivo se genera en streaming: los registros se leen por bloques y los
+    bytes se envían mientras se escriben, con memoria constante.
+    Acepta los filtros de fecha, empleado y tipo de pagina_descarga_excel.
     """
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Asistencia"
+    valido, mensaje, formato, filtros = _parametros_exportacion(request.GET, 'asistencia')
+    if not valido:
+        messages.error(request, mensaje)
+        return redirect('pagina_descarga_excel')
 
-    # Encabezados del excel
-    encabezados = ["Empleado", "Tipo de Asistencia", "Fecha", "Hora", "Descripción", "ID Dispositivo"]
-    ws.append(encabezados)
+    return _respuesta_exportacion(request, 'asistencia', formato, filtros)
 
-    # Registros usando el modelo
-    registros = RegistroAsistencia.objects.select_related('empleado', 'tipo') \
-        .order_by('-fecha_registro', '-hora_registro')
-    
-    for reg in registros:
-        fila = [
-            reg.empleado.nombre_completo,
-            reg.tipo.nombre_asistencia,
-            reg.fecha_registro.strftime('%Y-%m-%d'),
-            reg.hora_registro.strftime('%H:%M:%S'),
-            reg.descripcion or '',
-            reg.fingerprint or '',
-        ]
-        ws.append(fila)
-
-    # Ajustar ancho de columnas
-    for col in ws.columns:
-        max_length = max(len(str(cell.value)) for cell in col if cell.value)
-        ws.column_dimensions[col[0].column_letter].width = max_length + 2
-
-    # Estilo encabezado
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill("solid", fgColor="4F81BD")
-    thin_border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
-    )
 
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = thin_border
+@user_passes_test(es_staff)
+def exportar_paquete_empleados(request):
+    """
+    Exporta un ZIP con un Excel de registros de asistencia por empleado.
+    Los libros se arman en paralelo en un pool de procesos (EXPORT_PAQUETE_PROCESOS)
+    y el ZIP se envía a medida que terminan.
+    Acepta los filtros de fecha, empleado y tipo de pagina_descarga_excel.
+    """
+    valido, mensaje, formato, filtros = _parametros_exportacion(request.GET, 'paquete')
+    if not valido:
+        messages.error(request, mensaje)
+        return redirect('pagina_descarga_excel')
 
-    # Tabla solo si hay datos (al menos 1 fila de datos)
-    if ws.max_row > 1:
-        tabla = Table(
-            displayName="RegistroAsistencia",
-            ref=f"A1:F{ws.max_row}"
-        )
-        style = TableStyleInfo(
-            name="TableStyleMedium9", showFirstColumn=False,
-            showLastColumn=False, showRowStripes=True, showColumnStripes=False
+    return _respuesta_exportacion(request, 'paquete', formato, filtros)
+
+
+@user_passes_test(es_staff)
+@require_http_methods(["GET", "HEAD"])
+def imagen_qr_empleado(request, empleado_id, formato):
+    """
+    Imagen del QR de un empleado (PNG o SVG) dibujada en memoria.
+    Responde con ETag fuerte y Cache-Control de larga duración; si el navegador
+    ya tiene la versión vigente responde 304 sin dibujar. Un GET no asigna códigos:
+    sin codigo_qr responde 404 (se asignan con generar_qr o al imprimir las credenciales).
+    """
+    if formato not in QRService.FORMATOS_IMAGEN:
+        raise Http404("Formato de imagen no soportado")
+    empleado = get_object_or_404(Empleado, id_empleado=empleado_id)
+    qr_url = QRService.url_qr_asignado(empleado)
+    if qr_url is None:
+        raise Http404("El empleado no tiene código QR")
+
+    etag = f'"{QRService.version_imagen_qr(qr_url, formato)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(
+            QRService.imagen_qr_empleado(empleado, formato), content_type=QRService.FORMATOS_IMAGEN[formato]
         )
-        tabla.tableStyleInfo = style
-        ws.add_table(tabla)
-
-    # Hoja adicional: Actividades (DESHABILITADA TEMPORALMENTE)
-    # from .models import ActividadProyecto
-    # ws2 = wb.create_sheet(title="Actividades")
-    # ws2.append(["Empleado", "Fecha", "Proyecto", "Actividad", "Hora"])
-
-    # for ap in ActividadProyecto.objects.select_related('empleado').all().order_by('-fecha', '-hora'):
-    #     ws2.append([
-    #         ap.empleado.nombre_completo,
-    #         ap.fecha.strftime('%Y-%m-%d'),
-    #         ap.proyecto,
-    #         ap.actividad,
-    #         ap.hora.strftime('%H:%M:%S'),
-    #     ])
-
-    # # Ajustar ancho y tabla hoja 2
-    # for col in ws2.columns:
-    #     max_length = max(len(str(cell.value)) for cell in col if cell.value)
-    #     ws2.column_dimensions[col[0].column_letter].width = max_length + 2
-
-    # if ws2.max_row > 1:
-    #     tabla2 = Table(
-    #         displayName="TablaActividades",
-    #         ref=f"A1:E{ws2.max_row}"
-    #     )
-    #     style2 = TableStyleInfo(
-    #         name="TableStyleMedium9", showFirstColumn=False,
-    #         showLastColumn=False, showRowStripes=True, showColumnStripes=False
-    #     )
-    #     tabla2.tableStyleInfo = style2
-    #     ws2.add_table(tabla2)
-
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=settings.QR_IMAGEN_MAX_AGE)
+    return response
+
+
+@user_passes_test(es_staff)
+def credenciales_qr(request):
+    """
+    PDF imprimible con las credenciales QR de los empleados (todos, o los elegidos
+    en el filtro de empleados de pagina_descarga_excel). Se envía página por página.
+    """
+    valido, mensaje, filtros = ReporteService.parsear_filtros(request.GET)
+    if not valido:
+        messages.error(request, mensaje)
+        return redirect('pagina_descarga_excel')
+
+    response = StreamingHttpResponse(
+        QRService.generar_pdf_credenciales(filtros.empleados), content_type='application/pdf'
     )
-    response['Content-Disposition'] = 'attachment; filename=registro_asistencia.xlsx'
-    wb.save(response)
+    response['Content-Disposition'] = 'inline; filename=credenciales_qr.pdf'
     return response
 
 
+@user_passes_test(es_staff)
+@require_http_methods(["POST"])
+def api_crear_exportacion(request):
+    """
+    Crea un trabajo de exportación en segundo plano.
+    Recibe 'reporte' (asistencia | resumen | mensual | paquete) y los mismos filtros que las descargas directas.
+    Solo accesible para usuarios staff.
+    """
+    reporte = request.POST.get('reporte')
+    if reporte not in exportaciones.REPORTES:
+        return JsonResponse({'success': False, 'error': 'Tipo de reporte inválido'}, status=400)
+    valido, mensaje, formato, filtros = _parametros_exportacion(request.POST, reporte)
+    if not valido:
+        return JsonResponse({'success': False, 'error': mensaje}, status=400)
+    trabajo = exportaciones.encolar(reporte, filtros, request.user, formato)
+    return JsonResponse({'success': True, 'trabajo': exportaciones.serializar(trabajo)}, status=202)
+
+
+@user_passes_test(es_staff)
+def api_estado_exportacion(request, trabajo_id):
+    """
+    Estado y avance (filas procesadas) de un trabajo de exportación.
+    Solo accesible para el usuario staff que lo creó (404 para los demás).
+    """
+    exportaciones.recuperar_huerfanos()
+    trabajo = get_object_or_404(TrabajoExportacion, pk=trabajo_id, usuario=request.user)
+    return JsonResponse({'success': True, 'trabajo': exportaciones.serializar(trabajo)})
+
+
+@user_passes_test(es_staff)
+def descargar_exportacion(request, trabajo_id):
+    """
+    Descarga el archivo de un trabajo de exportación terminado.
+    Solo accesible para el usuario staff que lo creó (404 para los demás).
+    """
+    trabajo = get_object_or_404(
+        TrabajoExportacion, pk=trabajo_id, usuario=request.user, estado=TrabajoExportacion.TERMINADO
+    )
+    try:
+        archivo = open(trabajo.archivo, 'rb')
+    except FileNotFoundError:
+        raise Http404("El archivo ya no está disponible")
+    return FileResponse(
+        archivo, as_attachment=True, filename=trabajo.nombre_archivo,
+        content_type=exportaciones.FORMATOS[trabajo.formato][1],
+    )
+
+
 
 def pagina_principal(request):
     """
@@ -249,12 +290,14 @@ def registrar_asistencia_qr(request, codigo_qr):
         messages.error(request, 'Código QR no válido o empleado no encontrado.')
         return render(request, 'error_qr.html')
     
-    tipos_evento = TipoAsistencia.objects.all()
+    tipos_evento = CatalogoTipos.listar()
 
     if request.method == 'POST':
         tipo_id = request.POST.get('tipo_evento')
         descripcion = request.POST.get('descripcion') or ''
         fingerprint = request.POST.get('fingerprint')
+        latitud = request.POST.get('latitud')
+        longitud = request.POST.get('longitud')
 
         # Validar datos requeridos
         if not tipo_id:
@@ -266,7 +309,7 @@ def registrar_asistencia_qr(request, codigo_qr):
 
         # Usar el servicio para crear el registro
         success, message, registro = AsistenciaService.crear_registro_asistencia(
-            empleado.id_empleado, tipo_id, descripcion, fingerprint
+            empleado.id_empleado, tipo_id, descripcion, fingerprint, latitud, longitud
         )
 
         if success:
@@ -285,7 +328,7 @@ def registrar_asistencia_qr(request, codigo_qr):
             return render(request, 'asistencia_exitosa.html', {
                 'fecha': fecha,
                 'hora': hora,
-                'empleado': registro.empleado
+                'empleado': empleado
             })
         else:
             messages.error(request, message)
@@ -302,12 +345,14 @@ def registrar_asistencia_auto(request, empleado_id):
     Primera vez: se vincula en identificar_dispositivo.
     """
     empleado = get_object_or_404(Empleado, id_empleado=empleado_id)
-    tipos_evento = TipoAsistencia.objects.all()
+    tipos_evento = CatalogoTipos.listar()
 
     if request.method == 'POST':
         tipo_id = request.POST.get('tipo_evento')
         descripcion = request.POST.get('descripcion') or ''
         fingerprint = request.POST.get('fingerprint')
+        latitud = request.POST.get('latitud')
+        longitud = request.POST.get('longitud')
 
         if not tipo_id:
             messages.error(request, 'Debe seleccionar un tipo de asistencia.')
@@ -317,7 +362,7 @@ def registrar_asistencia_auto(request, empleado_id):
             })
 
         success, message, registro = AsistenciaService.crear_registro_asistencia(
-            empleado.id_empleado, tipo_id, descripcion, fingerprint
+            empleado.id_empleado, tipo_id, descripcion, fingerprint, latitud, longitud
         )
 
         if success:
@@ -336,7 +381,7 @@ def registrar_asistencia_auto(request, empleado_id):
             return render(request, 'asistencia_exitosa.html', {
                 'fecha': fecha,
                 'hora': hora,
-                'empleado': registro.empleado
+                'empleado': empleado
             })
         else:
             messages.error(request, message)
@@ -372,6 +417,26 @@ def api_buscar_empleado_qr(request):
         return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
 
 
+@require_http_methods(["POST", "OPTIONS"])
+def api_buscar_empleados_qr(request):
+    """
+    Busca varios empleados por código QR en una sola petición (kioscos compartidos).
+    Body: {"codigos_qr": [...]}; responde un mapa código -> empleado (null si no existe).
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        codigos, error = QRService.validar_lote(data.get('codigos_qr') if isinstance(data, dict) else None)
+        if error:
+            return JsonResponse({'success': False, 'error': error}, status=400)
+        return JsonResponse(QRService.respuesta_lote(Empleado.buscar_varios_por_codigo_qr(codigos)))
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
 @require_http_methods(["POST", "OPTIONS"])
 def api_identificar_por_fingerprint(request):
     """
@@ -388,12 +453,7 @@ def api_identificar_por_fingerprint(request):
         if empleado:
             return JsonResponse({
                 'success': True,
-                'empleado': {
-                    'id': empleado.id_empleado,
-                    'nombres': empleado.nombres,
-                    'apellidos': empleado.apellidos,
-                    'nombre_completo': empleado.nombre_completo,
-                }
+                'empleado': QRService.serializar_empleado(empleado)
             })
         else:
             return JsonResponse({'success': False, 'error': 'Dispositivo no vinculado a un empleado'}, status=404)
@@ -403,6 +463,26 @@ def api_identificar_por_fingerprint(request):
         return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
 
 
+@require_http_methods(["POST", "OPTIONS"])
+def api_identificar_por_fingerprints(request):
+    """
+    Identifica varios dispositivos en una sola petición.
+    Body: {"fingerprints": [...]}; responde un mapa fingerprint -> empleado (null si no está vinculado).
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        fingerprints, error = QRService.validar_lote(data.get('fingerprints') if isinstance(data, dict) else None)
+        if error:
+            return JsonResponse({'success': False, 'error': error}, status=400)
+        return JsonResponse(QRService.respuesta_lote(DispositivoEmpleado.obtener_empleados_por_fingerprint(fingerprints)))
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
 @require_http_methods(["POST", "OPTIONS"])
 def api_vincular_fingerprint(request):
     """
@@ -447,19 +527,97 @@ def api_desvincular_fingerprint(request):
         return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+def api_registrar_asistencia_lote(request):
+    """
+    Registra en un solo envío los marcajes acumulados por un kiosco sin conexión.
+    Acepta JSON ({"registros": [...]} o una lista) o NDJSON (un registro por línea).
+    Cada registro: empleado_id, tipo_id, fecha_hora (ISO 8601), latitud, longitud,
+    fingerprint y descripcion opcionales. La fecha_hora del cliente solo se acepta con
+    una clave de kiosco válida (cabecera X-Kiosco-Clave); sin ella se usa la hora del servidor.
+    Los kioscos no tienen sesión ni cookie CSRF: la clave los autentica y la vista está
+    exenta de CSRF; sin clave válida se exige el token CSRF como en el resto de la web.
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    hora_cliente = AsistenciaService.kiosco_autenticado(request.headers.get('X-Kiosco-Clave'))
+    if not hora_cliente:
+        rechazo = CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+        if rechazo:
+            return rechazo
+    try:
+        if 'ndjson' in (request.content_type or ''):
+            items = [json.loads(linea) for linea in request.body.decode('utf-8').splitlines() if linea.strip()]
+        else:
+            data = json.loads(request.body)
+            items = data.get('registros') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return JsonResponse({'success': False, 'error': 'Lista de registros requerida'}, status=400)
+        if len(items) > AsistenciaService.LOTE_MAX_ITEMS:
+            return JsonResponse({
+                'success': False,
+                'error': f'Máximo {AsistenciaService.LOTE_MAX_ITEMS} registros por envío'
+            }, status=400)
+
+        resultados = AsistenciaService.crear_registros_lote(items, hora_cliente=hora_cliente)
+        return JsonResponse({
+            'success': True,
+            'creados': sum(1 for ok, _, _ in resultados if ok),
+            'hora_cliente': hora_cliente,
+            'resultados': [
+                {
+                    'indice': indice,
+                    'success': ok,
+                    'message': mensaje,
+                    'id_registro': registro.id_registro if registro else None,
+                }
+                for indice, (ok, mensaje, registro) in enumerate(resultados)
+            ],
+        })
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
+@user_passes_test(es_staff)
+def api_estadisticas_cache(request):
+    """
+    Estadísticas de las cachés en memoria del worker que atiende la petición.
+    Solo accesible para usuarios staff.
+    """
+    return JsonResponse({
+        'success': True,
+        'fingerprint': DispositivoEmpleado.estadisticas_cache(),
+        'codigo_qr': Empleado.estadisticas_cache_qr(),
+    })
+
+
+@user_passes_test(es_staff)
+def api_estadisticas_conexiones(request):
+    """
+    Uso de conexiones a la base de datos del worker que atiende la petición.
+    Solo accesible para usuarios staff.
+    """
+    return JsonResponse({'success': True, 'base_datos': conexiones.estadisticas()})
+
+
 def registrar_asistencia(request):
     """
     Vista tradicional para registrar la asistencia de un empleado.
     Mantenida para compatibilidad.
     """
     empleados = Empleado.objects.all()
-    tipos_evento = TipoAsistencia.objects.all()
+    tipos_evento = CatalogoTipos.listar()
 
     if request.method == 'POST':
         empleado_id = request.POST.get('empleado')
         tipo_id = request.POST.get('tipo_evento')
         descripcion = request.POST.get('descripcion') or ''
         fingerprint = request.POST.get('fingerprint')
+        latitud = request.POST.get('latitud')
+        longitud = request.POST.get('longitud')
 
         # Validar datos requeridos
         if not empleado_id or not tipo_id:
@@ -471,7 +629,7 @@ def registrar_asistencia(request):
 
         # Usar el servicio para crear el registro
         success, message, registro = AsistenciaService.crear_registro_asistencia(
-            empleado_id, tipo_id, descripcion, fingerprint
+            empleado_id, tipo_id, descripcion, fingerprint, latitud, longitud
         )
 
         if success:
@@ -0,0 +1,146 @@
+"""
+Versiones asíncronas de los endpoints JSON de identificación.
+Usan el ORM asíncrono de Django para que, servidas por ASGI (ver servidor_asgi.py),
+un solo proceso mantenga muchas identificaciones en curso sin bloquear un worker.
+Responden exactamente igual que sus equivalentes síncronos en views.py.
+"""
+
+import json
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from .models import Empleado, DispositivoEmpleado
+from .qr_service import QRService
+
+
+@require_http_methods(["POST", "OPTIONS"])
+async def api_buscar_empleado_qr(request):
+    """
+    API para buscar empleado por código QR.
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        codigo_qr = data.get('codigo_qr')
+
+        if not codigo_qr:
+            return JsonResponse({'success': False, 'error': 'Código QR requerido'}, status=400)
+
+        resultado = await QRService.abuscar_empleado_por_qr(codigo_qr)
+        status_code = 200 if resultado.get('success') else 404
+        return JsonResponse(resultado, status=status_code)
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
+@require_http_methods(["POST", "OPTIONS"])
+async def api_buscar_empleados_qr(request):
+    """
+    Busca varios empleados por código QR en una sola petición (kioscos compartidos).
+    Body: {"codigos_qr": [...]}; responde un mapa código -> empleado (null si no existe).
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        codigos, error = QRService.validar_lote(data.get('codigos_qr') if isinstance(data, dict) else None)
+        if error:
+            return JsonResponse({'success': False, 'error': error}, status=400)
+        return JsonResponse(QRService.respuesta_lote(await Empleado.abuscar_varios_por_codigo_qr(codigos)))
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
+@require_http_methods(["POST", "OPTIONS"])
+async def api_identificar_por_fingerprint(request):
+    """
+    Identifica empleado por fingerprint del dispositivo.
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        fingerprint = data.get('fingerprint')
+        if not fingerprint:
+            return JsonResponse({'success': False, 'error': 'Fingerprint requerido'}, status=400)
+        empleado = await DispositivoEmpleado.aobtener_empleado_por_fingerprint(fingerprint)
+        if empleado:
+            return JsonResponse({
+                'success': True,
+                'empleado': QRService.serializar_empleado(empleado)
+            })
+        else:
+            return JsonResponse({'success': False, 'error': 'Dispositivo no vinculado a un empleado'}, status=404)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
+@require_http_methods(["POST", "OPTIONS"])
+async def api_identificar_por_fingerprints(request):
+    """
+    Identifica varios dispositivos en una sola petición.
+    Body: {"fingerprints": [...]}; responde un mapa fingerprint -> empleado (null si no está vinculado).
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        fingerprints, error = QRService.validar_lote(data.get('fingerprints') if isinstance(data, dict) else None)
+        if error:
+            return JsonResponse({'success': False, 'error': error}, status=400)
+        return JsonResponse(QRService.respuesta_lote(await DispositivoEmpleado.aobtener_empleados_por_fingerprint(fingerprints)))
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
+@require_http_methods(["POST", "OPTIONS"])
+async def api_vincular_fingerprint(request):
+    """
+    Vincula el fingerprint al empleado seleccionado (primera vez).
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        empleado_id = data.get('empleado_id')
+        fingerprint = data.get('fingerprint')
+        if not empleado_id or not fingerprint:
+            return JsonResponse({'success': False, 'error': 'Empleado y fingerprint requeridos'}, status=400)
+        empleado = await Empleado.objects.aget(id_empleado=empleado_id)
+        # Reasignación permitida: si el fingerprint existe con otro empleado, se actualiza al elegido
+        await DispositivoEmpleado.objects.aupdate_or_create(
+            fingerprint=fingerprint,
+            defaults={'empleado': empleado}
+        )
+        return JsonResponse({'success': True, 'empleado_id': empleado.id_empleado}, status=201)
+    except Empleado.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Empleado no encontrado'}, status=404)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
+
+
+@require_http_methods(["POST", "OPTIONS"])
+async def api_desvincular_fingerprint(request):
+    """
+    Desvincula el fingerprint del dispositivo actual para permitir seleccionar de nuevo.
+    """
+    if request.method == 'OPTIONS':
+        return JsonResponse({'success': True})
+    try:
+        data = json.loads(request.body)
+        fingerprint = data.get('fingerprint')
+        if not fingerprint:
+            return JsonResponse({'success': False, 'error': 'Fingerprint requerido'}, status=400)
+        borrados, detalle = await DispositivoEmpleado.objects.filter(fingerprint=fingerprint).adelete()
+        return JsonResponse({'success': True, 'deleted': borrados})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Error del servidor: {str(e)}'}, status=500)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'control_asistencia.settings')
+# Bajo ASGI los endpoints JSON de identificación se sirven con sus versiones asíncronas
+os.environ.setdefault('API_ASYNC', 'True')
 
 application = get_asgi_application()
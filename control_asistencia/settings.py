@@ -11,7 +11,10 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 import dj_database_url
 load_dotenv()
@@ -85,6 +88,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'control_asistencia.wsgi.application'
 
+# Endpoints JSON asíncronos (app/views_async.py); asgi.py lo activa por defecto
+API_ASYNC = str(os.getenv('API_ASYNC', 'False')).lower() in ['1', 'true', 'yes', 'on']
+
 DB_LIVE=os.getenv("DB_LIVE")
 DATABASE_URL=os.getenv("DATABASE_URL")
 
@@ -92,13 +98,30 @@ DATABASE_URL=os.getenv("DATABASE_URL")
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 USE_POSTGRES = str(DB_LIVE).lower() in ["1", "true", "yes"]
 
+# Modo de conexión para DATABASE_URL (ver README, "Conexiones a la base de datos"):
+# - "none": una conexión nueva por petición (por defecto, pensado para pgbouncer)
+# - "persistent": cada worker reutiliza su conexión hasta DB_CONN_MAX_AGE segundos
+# - "pool": pool nativo de Django 5.1 (requiere psycopg[binary,pool])
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'none').lower()
+if DB_POOL_MODE not in ('none', 'persistent', 'pool'):
+    raise ImproperlyConfigured(f"DB_POOL_MODE inválido: {DB_POOL_MODE!r} (none | persistent | pool)")
+if DATABASE_URL and DB_POOL_MODE == 'pool':
+    # requirements.txt solo instala psycopg2, que no tiene pool nativo
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured(
+            'DB_POOL_MODE=pool requiere psycopg 3 con pool: pip install "psycopg[binary,pool]"'
+        )
+
 if DATABASE_URL:
     # Prefer DATABASE_URL when provided (e.g., Supabase)
     try:
         DATABASES = {
             'default': dj_database_url.config(
                 default=DATABASE_URL,
-                conn_max_age=0,  # No mantener conexiones persistentes con pgbouncer
+                # Sin conexiones persistentes salvo en modo "persistent" (el pool nativo exige 0)
+                conn_max_age=int(os.getenv('DB_CONN_MAX_AGE', '600')) if DB_POOL_MODE == 'persistent' else 0,
                 conn_health_checks=True,  # Verificar salud de conexiones
                 ssl_require=True,
             )
@@ -109,6 +132,18 @@ if DATABASE_URL:
             'connect_timeout': 10,
             'options': '-c statement_timeout=30000'  # 30 segundos timeout
         }
+        # pgbouncer en modo transaction (p. ej. el puerto 6543 de Supabase) no admite los cursores
+        # del servidor que usan las exportaciones (.iterator()); Django lee entonces por bloques en el cliente
+        DB_PGBOUNCER_TRANSACCION = str(
+            os.getenv('DB_PGBOUNCER_TRANSACCION') or DATABASES['default'].get('PORT') == 6543
+        ).lower() in ['1', 'true', 'yes', 'on']
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = DB_PGBOUNCER_TRANSACCION
+        if DB_POOL_MODE == 'pool':
+            DATABASES['default']['OPTIONS']['pool'] = {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '4')),
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),  # espera máxima por una conexión libre
+            }
     except Exception:
         # Fall back to explicit variables if URL is invalid
         if USE_POSTGRES:
@@ -150,6 +185,10 @@ else:
         }
     }
 
+# Los índices de RegistroAsistencia declaran columnas include (lectura solo del índice en
+# PostgreSQL); SQLite las ignora y crea el índice solo con las columnas clave
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
 
 # if DB_LIVE in [False,"False"]:
 
@@ -175,6 +214,60 @@ else:
 
 
 
+# Cada cuántos segundos relee cada worker las versiones compartidas (VersionCompartida) que
+# invalidan sus cachés en memoria: es el máximo retraso con que ve cambios hechos en otro worker
+VERSIONES_INTERVALO = float(os.getenv('VERSIONES_INTERVALO', '2'))
+
+# Cachés en memoria por worker (fingerprint -> empleado, código QR -> empleado). Los vínculos
+# de fingerprint y los empleados o códigos QR cambiados en otro worker se ven en VERSIONES_INTERVALO segundos
+FINGERPRINT_CACHE_SIZE = int(os.getenv('FINGERPRINT_CACHE_SIZE', '2048'))
+FINGERPRINT_CACHE_TTL = int(os.getenv('FINGERPRINT_CACHE_TTL', '300'))  # segundos
+FINGERPRINT_CACHE_NEGATIVE_TTL = int(os.getenv('FINGERPRINT_CACHE_NEGATIVE_TTL', '30'))  # segundos
+QR_CACHE_SIZE = int(os.getenv('QR_CACHE_SIZE', '2048'))
+QR_CACHE_TTL = int(os.getenv('QR_CACHE_TTL', '300'))  # segundos
+QR_CACHE_NEGATIVE_TTL = int(os.getenv('QR_CACHE_NEGATIVE_TTL', '10'))  # segundos
+# QR con token firmado (ID + versión de clave + HMAC) verificable sin consultar la base de datos.
+# Subir QR_TOKEN_VERSION revoca todas las credenciales impresas con la versión anterior; la de un solo
+# empleado se revoca regenerando su codigo_qr (manage.py generar_qr --revocar <id>).
+QR_TOKENS_FIRMADOS = str(os.getenv('QR_TOKENS_FIRMADOS', 'False')).lower() in ['1', 'true', 'yes', 'on']
+QR_TOKEN_VERSION = int(os.getenv('QR_TOKEN_VERSION', '1'))
+# Imágenes QR servidas por /login/qr/<id>.png|svg: caché de imágenes por worker y max-age del navegador
+QR_IMAGEN_CACHE_SIZE = int(os.getenv('QR_IMAGEN_CACHE_SIZE', '512'))
+QR_IMAGEN_CACHE_TTL = int(os.getenv('QR_IMAGEN_CACHE_TTL', '86400'))  # segundos
+QR_IMAGEN_MAX_AGE = int(os.getenv('QR_IMAGEN_MAX_AGE', '86400'))  # segundos
+# Fuente .ttf para los nombres en las credenciales PDF (por defecto DejaVu Sans del sistema)
+CREDENCIALES_FUENTE = os.getenv('CREDENCIALES_FUENTE') or None
+# Procesos que dibujan los QR en la generación masiva (0 = uno por núcleo)
+QR_PROCESOS = int(os.getenv('QR_PROCESOS', '0')) or os.cpu_count() or 1
+
+# Caché en disco de los Excel exportados (se reutilizan mientras los datos no cambien)
+EXPORT_CACHE_ACTIVA = str(os.getenv('EXPORT_CACHE_ACTIVA', 'True')).lower() in ['1', 'true', 'yes', 'on']
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'control_asistencia_exportaciones')
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_MB', '200')) * 1024 * 1024
+# Exportaciones en segundo plano: hilos por worker y horas que se conservan los archivos
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '2'))
+EXPORT_JOBS_RETENCION_HORAS = int(os.getenv('EXPORT_JOBS_RETENCION_HORAS', '24'))
+# False: los trabajos no corren en los workers web sino en `python manage.py procesar_exportaciones`
+EXPORT_JOBS_EN_WEB = str(os.getenv('EXPORT_JOBS_EN_WEB', 'True')).lower() in ['1', 'true', 'yes', 'on']
+# Minutos sin avance tras los que un trabajo se da por perdido (su worker se reinició)
+EXPORT_JOBS_ESTANCADO_MINUTOS = int(os.getenv('EXPORT_JOBS_ESTANCADO_MINUTOS', '15'))
+# Procesos que arman en paralelo los libros del paquete por empleado (0 = uno por núcleo)
+EXPORT_PAQUETE_PROCESOS = int(os.getenv('EXPORT_PAQUETE_PROCESOS', '0')) or os.cpu_count() or 1
+
+
+# Geocerca: sedes donde se permite registrar asistencia (validado en el servidor).
+# Desactivada por defecto; al activarla SEDES_ASISTENCIA es obligatorio, con un JSON como
+# [{"nombre": "...", "lat": -12.08, "lon": -76.99, "radio": 500}]
+GEOCERCA_ACTIVA = str(os.getenv('GEOCERCA_ACTIVA', 'False')).lower() in ['1', 'true', 'yes', 'on']
+SEDES_ASISTENCIA = json.loads(os.getenv('SEDES_ASISTENCIA') or '[]')
+if GEOCERCA_ACTIVA and not SEDES_ASISTENCIA:
+    raise ImproperlyConfigured("GEOCERCA_ACTIVA requiere definir SEDES_ASISTENCIA (ver el .env de ejemplo del README)")
+
+# Claves compartidas de los kioscos (separadas por coma). Solo con una de ellas en la cabecera
+# X-Kiosco-Clave el registro en lote acepta la fecha_hora del cliente; si no, usa la hora del servidor
+KIOSCO_CLAVES = [clave.strip() for clave in os.getenv('KIOSCO_CLAVES', '').split(',') if clave.strip()]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,29 @@
+"""
+Servidor ASGI (uvicorn) para la aplicación.
+Con ASGI los endpoints JSON de identificación son asíncronos y un mismo proceso
+atiende muchas peticiones concurrentes mientras espera a la base de datos.
+
+Ejecutar: python servidor_asgi.py
+Variables: PORT (8000), WEB_CONCURRENCY (procesos, 1), LOG_LEVEL (info)
+"""
+
+import os
+import uvicorn
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'control_asistencia.settings')
+    os.environ.setdefault('API_ASYNC', 'True')
+    uvicorn.run(
+        'control_asistencia.asgi:application',
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', '8000')),
+        workers=int(os.getenv('WEB_CONCURRENCY', '1')),
+        proxy_headers=True,
+        forwarded_allow_ips='*',
+        log_level=os.getenv('LOG_LEVEL', 'info'),
+    )
+
+
+if __name__ == '__main__':
+    main()